@@ -1,12 +1,21 @@
-from flask import Flask, request, render_template, jsonify, send_file
+from flask import Flask, request, render_template, jsonify, send_file, Response, stream_with_context
 import os
-import pandas as pd
-from io import BytesIO
-from directory import read_data_from_excel, SoapRequestGenerator, send_soap_request, dados, lista
-from utils import verify_submission
-import unicodedata
-import html
-import re
+import json
+import time
+import uuid
+from directory import dados
+from municipio_index import carregar_indice
+from polling import STATUS_AGUARDANDO
+from jobs import JobManager
+from file_handler import iter_xlsx_chunks
+from data_validation import relatorio_validacao
+from rate_limit import metricas
+from status_store import criar_status_store
+from upload_cache import salvar_upload
+from exportacao import exportar, FORMATOS
+from rps_journal import criar_journal
+from pipeline import (BANCO_TERRITORIAL_CAMINHO, STREAMING_MIN_BYTES, enriquecer_blocos, enviar_blocos,
+                      planilhas_enriquecidas, process_dataframes)
 
 app = Flask(__name__)
 UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
@@ -17,8 +26,17 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-processed_status = []
-uploaded_filename = None
+# Linhas por página da consulta incremental de status (/status_data?since=) e máximo aceito em 'limite'
+STATUS_PAGINA = int(os.getenv('STATUS_PAGINA', '500'))
+STATUS_PAGINA_MAXIMA = int(os.getenv('STATUS_PAGINA_MAXIMA', '5000'))
+# Intervalo, em segundos, entre as verificações de alterações do /status_stream
+STATUS_STREAM_INTERVALO = float(os.getenv('STATUS_STREAM_INTERVALO', '1.0'))
+# Intervalo, em segundos, entre os comentários enviados para manter a conexão do /status_stream aberta
+STATUS_STREAM_HEARTBEAT = float(os.getenv('STATUS_STREAM_HEARTBEAT', '15'))
+
+status_store = criar_status_store()
+rps_journal = criar_journal()
+job_manager = JobManager(ao_descartar=status_store.descartar_job)
 
 
 def allowed_file(filename):
@@ -28,315 +46,310 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def normalizar_coluna(nome_coluna):
-    """
-      Normaliza o nome de uma coluna removendo acentos e convertendo para minúsculas.
-    """
-    nome_coluna = unicodedata.normalize('NFKD', nome_coluna).encode('ASCII', 'ignore').decode('ASCII')
-    return nome_coluna.lower()
-
+@app.route('/')
+def index():
+    """Rota para carregar a página inicial."""
 
-def normalizar_texto(texto):
-    """
-       Normaliza o texto removendo acentos, espaços extras e convertendo para minúsculas.
-    """
-    if pd.isna(texto):
-        return texto
-    texto = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
-    texto = texto.lower().strip()
-    texto = re.sub(r'\s+', ' ', texto)
-    return texto
+    return render_template('index.html')
 
 
-def normalize_column_names(columns):
-    """
-     Normaliza os nomes das colunas, removendo sufixos e convertendo para minúsculas.
-    """
-    normalized_columns = []
-    for col in columns:
-        normalized_col = col.split('_')[0].lower().strip()
-        normalized_columns.append(normalized_col)
-    return normalized_columns
+@app.route('/status')
+def status_page():
+    return render_template('status.html')
 
 
-def preencher_municipio(planilha_caminho, banco_territorial_caminho):
+@app.route('/upload', methods=['POST'])
+def upload_file():
     """
-       Preenche os códigos municipais nas planilhas baseados em um banco territorial de referência.
-
-       Parâmetros:
-           planilha_caminho (str): Caminho da planilha enviada pelo usuário.
-           banco_territorial_caminho (str): Caminho do banco de dados territorial.
+    Rota para fazer upload do arquivo Excel enviado pelo usuário.
 
-       Exceções:
-           ValueError: Erro em formato de colunas ou dados ausentes.
+    O processamento é feito em segundo plano; a rota retorna o identificador do job, cujo
+    progresso pode ser consultado em /jobs/<id>.
     """
-    print(f"Processando a planilha: {planilha_caminho}")
-    print(f"Usando o banco territorial: {banco_territorial_caminho}")
-
-    # Mapeamento de códigos para estados (UF)
-    uf_mapping = {
-        11: 'RO', 12: 'AC', 13: 'AM', 14: 'RR', 15: 'PA', 16: 'AP', 17: 'TO',
-        21: 'MA', 22: 'PI', 23: 'CE', 24: 'RN', 25: 'PB', 26: 'PE', 27: 'AL', 28: 'SE', 29: 'BA',
-        31: 'MG', 32: 'ES', 33: 'RJ', 35: 'SP',
-        41: 'PR', 42: 'SC', 43: 'RS',
-        50: 'MS', 51: 'MT', 52: 'GO', 53: 'DF'
-    }
 
-    xls = pd.ExcelFile(planilha_caminho)
-    df_banco_territorial = pd.read_excel(banco_territorial_caminho)
+    if 'file' not in request.files:
+        return 'Nenhum arquivo encontrado', 400
 
-    print("Colunas na planilha do banco territorial:", df_banco_territorial.columns)
+    file = request.files['file']
+    if file.filename == '':
+        return 'Nenhum arquivo selecionado', 400
 
-    df_banco_territorial['UF'] = df_banco_territorial['UF'].map(uf_mapping)
+    if file and allowed_file(file.filename):
+        job_id = uuid.uuid4().hex
+        # Arquivos com o mesmo conteúdo são gravados uma única vez (ver upload_cache.py)
+        _, file_path = salvar_upload(file, app.config['UPLOAD_FOLDER'])
 
-    df_banco_territorial['Cidade'] = df_banco_territorial['Cidade'].apply(normalizar_texto)
-    df_banco_territorial['chave'] = ((df_banco_territorial['Cidade'] + '/' + df_banco_territorial['UF'].str.upper())
-                                     .apply(normalizar_texto))
+        status_store.criar_job(job_id, file.filename, file_path)
+        job = job_manager.submit(file.filename, file_path, processar_upload, job_id=job_id)
+        return jsonify(job.to_dict()), 202
+    else:
+        return 'Arquivo não permitido', 400
 
-    print("Chaves no banco territorial:", df_banco_territorial['chave'].unique())
 
-    df_dict = {}
+@app.route('/validar', methods=['POST'])
+def validar_planilha():
+    """
+    Rota de validação prévia: preenche os municípios da planilha enviada e retorna as linhas com
+    erro (CNPJ/CPF, valor, CEP, campos obrigatórios), sem enviar nenhum RPS.
+    """
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return 'Nenhum arquivo selecionado', 400
+    if not allowed_file(file.filename):
+        return 'Arquivo não permitido', 400
 
-    for sheet_name in xls.sheet_names:
-        df_planilha = pd.read_excel(planilha_caminho, sheet_name=sheet_name)
-        print(f"Processando aba: {sheet_name}")
-        print("Colunas na planilha do usuário:", df_planilha.columns)
+    _, file_path = salvar_upload(file, app.config['UPLOAD_FOLDER'])
+    try:
+        planilhas = {aba: df for aba, df in planilhas_enriquecidas(file_path).items() if aba in dados}
+    except ValueError as e:
+        return jsonify({'arquivo': file.filename, 'erro': str(e)}), 400
 
-        df_planilha.columns = normalize_column_names(df_planilha.columns)
-        print("Colunas normalizadas:", df_planilha.columns)
+    relatorio = relatorio_validacao(planilhas)
+    return jsonify({
+        'arquivo': file.filename,
+        'linhas': sum(len(df) for df in planilhas.values()),
+        'invalidas': len(relatorio),
+        'erros': relatorio,
+    })
 
-        # Validação da coluna cidade/uf
-        if 'cidade/uf' not in df_planilha.columns:
-            raise ValueError(f"A coluna 'cidade/uf' não está presente na planilha de entrada na aba {sheet_name}.")
 
-        split_columns = df_planilha['cidade/uf'].str.split('/', expand=True)
-        if split_columns.shape[1] != 2:
-            raise ValueError(f"Erro ao dividir a coluna 'cidade/uf' na aba {sheet_name}. Verifique o formato.")
+def processar_upload(job):
+    """
+    Processa um upload em segundo plano: preenche os municípios e envia os RPS.
 
-        # Divide a coluna cidade/uf
-        df_planilha[['cidade', 'uf']] = split_columns
-        df_planilha['cidade'] = df_planilha['cidade'].apply(normalizar_texto)
-        df_planilha['uf'] = df_planilha['uf'].str.upper()
+    A planilha é lida uma única vez; as abas enriquecidas ficam no job até o fim do
+    processamento (para a exportação de um job em andamento) e no cache de uploads, reaproveitado
+    na exportação de jobs finalizados e em novos envios do mesmo arquivo. Os RPS já enviados não
+    são reenviados (ver rps_journal.py). Arquivos grandes (STREAMING_MIN_BYTES) são lidos em blocos
+    e enviados à medida que são lidos, sem manter a planilha em memória.
 
-        df_planilha['chave'] = (df_planilha['cidade'] + '/' + df_planilha['uf']).apply(normalizar_texto)
+    Parâmetros:
+        job (Job): Job do upload.
+    """
+    if os.path.getsize(job.file_path) >= STREAMING_MIN_BYTES:
+        blocos = enriquecer_blocos(iter_xlsx_chunks(job.file_path), BANCO_TERRITORIAL_CAMINHO)
+        for _ in enviar_blocos(blocos, job=job, store=status_store, journal=rps_journal):
+            pass
+        return
 
-        print("Primeiras linhas da planilha após criar a chave:", df_planilha.head())
+    job.planilhas = planilhas_enriquecidas(job.file_path)
+    process_dataframes(job.planilhas, job=job, store=status_store, journal=rps_journal)
 
-        municipio_mapping = dict(zip(df_banco_territorial['chave'], df_banco_territorial['Código Município']))
-        df_planilha['municipio'] = df_planilha['chave'].map(municipio_mapping)
 
-        if df_planilha['municipio'].isnull().any():
-            linhas_nao_correspondidas = df_planilha[df_planilha['municipio'].isnull()]
-            print("Linhas não correspondidas:", linhas_nao_correspondidas)
-            raise ValueError(f"Alguns cód de municípios não foram encontrados no banco de dados na aba {sheet_name}.")
+def planilhas_do_job(job_id, info):
+    """
+    Retorna as abas enriquecidas de um job: as mantidas em memória pelo job em andamento ou, se o
+    job já terminou ou foi executado por outro processo, as obtidas a partir do arquivo enviado
+    (pelo cache de uploads).
+    """
+    job = job_manager.get(job_id)
+    if job is not None and job.planilhas is not None:
+        return job.planilhas
+    return planilhas_enriquecidas(info['caminho'])
 
-        df_planilha = df_planilha.drop(columns=['cidade/uf', 'cidade', 'chave'])
 
-        # Salva o resultado processado
-        df_dict[sheet_name] = df_planilha
+def _job_solicitado():
+    """
+    Retorna o job informado no parâmetro 'job' da requisição ou, na falta dele, o mais recente.
+    """
+    return request.args.get('job') or status_store.ultimo_job()
 
-    # Reescreve a planilha com os dados atualizados
-    with pd.ExcelWriter(planilha_caminho, engine='openpyxl') as writer:
-        for sheet_name, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
 
-    print("Planilha atualizada com códigos de município e abas preservadas.")
+@app.route('/metricas', methods=['GET'])
+def metricas_envio():
+    """
+    Rota com as métricas do controle de fluxo do web service: taxa observada, limite de
+    concorrência adaptativo e latência, por endpoint e prestador.
+    """
+    return jsonify(metricas())
 
 
-@app.route('/')
-def index():
-    """Rota para carregar a página inicial."""
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Rota para consultar o progresso de um job de upload.
 
-    return render_template('index.html')
+    Jobs executados por outro processo não estão no gerenciador local; nesse caso o progresso
+    é calculado a partir do armazenamento de status.
+    """
 
+    job = job_manager.get(job_id)
+    if job is not None:
+        return jsonify(job.to_dict())
+
+    info = status_store.info_job(job_id)
+    if info is None:
+        return 'Job não encontrado', 404
+
+    total, pendentes = status_store.resumo_job(job_id, STATUS_AGUARDANDO)
+    return jsonify({
+        'id': job_id,
+        'arquivo': info['arquivo'],
+        'estado': 'processando' if pendentes else 'concluido',
+        'total': total,
+        'enviados': total,
+        'concluidos': total - pendentes,
+        'vazao': None,
+        'eta': None,
+        'decorrido': None,
+        'erro': None,
+    })
 
-@app.route('/status')
-def status_page():
-    return render_template('status.html')
 
+@app.route('/export', methods=['GET'])
+def export_status():
+    """
+    Rota para baixar a planilha processada com o resultado de cada RPS.
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    """Rota para fazer upload e processar o arquivo Excel enviado pelo usuário."""
+    O parâmetro 'formato' escolhe o arquivo gerado: xlsx (default), csv ou parquet.
+    """
+    job_id = _job_solicitado()
+    info = status_store.info_job(job_id) if job_id else None
+    if info is None:
+        return 'Nenhum arquivo processado disponível para exportação', 400
 
-    global processed_status, uploaded_filename
-    processed_status = []
+    formato = request.args.get('formato', 'xlsx').lower()
+    if formato not in FORMATOS:
+        return f'Formato de exportação não suportado: {formato}', 400
 
-    if 'file' not in request.files:
-        return 'Nenhum arquivo encontrado', 400
+    try:
+        output = exportar(planilhas_do_job(job_id, info), status_store.linhas(job_id), formato)
+    except ImportError:
+        return 'A exportação em Parquet requer o pacote pyarrow (ou fastparquet) instalado', 400
+    except ValueError as e:
+        return jsonify({'arquivo': info['arquivo'], 'erro': str(e)}), 400
 
-    file = request.files['file']
-    if file.filename == '':
-        return 'Nenhum arquivo selecionado', 400
+    extensao, mimetype = FORMATOS[formato]
+    nome = os.path.splitext(info['arquivo'])[0]
+    return send_file(output, as_attachment=True, download_name=f"{nome}_processada.{extensao}", mimetype=mimetype)
 
-    if file and allowed_file(file.filename):
-        uploaded_filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], uploaded_filename)
-        file.save(file_path)
 
-        BANCO_TERRITORIAL_CAMINHO = os.getenv('BANCO_TERRITORIAL', 'referencia/relatorio_municipio.xls')
-        preencher_municipio(file_path, BANCO_TERRITORIAL_CAMINHO)
+def _filtros_status():
+    """
+    Lê os filtros da consulta de status: 'status' (prefixo do status de verificação) e
+    'prestador' (CNPJ do prestador, convertido nas abas configuradas para ele).
 
-        status_list = process_file(file_path)
-        processed_status.extend(status_list)
-        return jsonify(status_list)
-    else:
-        return 'Arquivo não permitido', 400
+    Retorna:
+        tuple: (status, abas); None quando o filtro não foi informado.
+    """
+    status = request.args.get('status') or None
+    prestador = request.args.get('prestador')
+    abas = None
+    if prestador:
+        prestador = ''.join(filter(str.isdigit, prestador))
+        abas = {aba for aba, (cnpj, _) in dados.items() if cnpj and ''.join(filter(str.isdigit, cnpj)) == prestador}
+    return status, abas
 
 
-def process_file(file_path):
-    dfs = read_data_from_excel(file_path)
-    status_list = []
-
-    for sheet_name, df in dfs.items():
-        if sheet_name in dados:
-            cnpj_prestador, inscricao_municipal_prestador = dados[sheet_name]
-        else:
-            continue
-
-        soap_request_gen = SoapRequestGenerator()
-
-        rps_inicial = int(df.iloc[0]['rps']) if 'rps' in df.columns else 1
-        rps_counter = rps_inicial
-
-        for index, row in df.iterrows():
-            if sheet_name == "simply":
-                aliquota = 0.0253
-            elif sheet_name == "dm":
-                aliquota = 0.0414
-            else:
-                aliquota = 0.05
-
-            kwargs = {
-                'cnpj': cnpj_prestador,
-                'inscricao_municipal': inscricao_municipal_prestador,
-                'valor_rps': rps_counter,
-                'prestador_cnpj': cnpj_prestador,
-                'prestador_inscricao': inscricao_municipal_prestador,
-                'tomador_cnpj': row.get('cnpj', ''),
-                'tomador_razao_social': html.escape(row.get('razao', '')),
-                'tomador_endereco': row.get('logradouro', ''),
-                'tomador_numero': row.get('numero', ''),
-                'tomador_bairro': row.get('bairro', ''),
-                'tomador_codigo_municipio': row.get('municipio', ''),
-                'tomador_uf': row.get('uf', ''),
-                'tomador_cep': row.get('cep', ''),
-                'valor_liquido_nfse': row.get('valor', ''),
-                'item_lista_servico': lista.get(sheet_name, ['0'])[0],
-                'aliquota': aliquota,
-                'codigo_cnae': '8219999' if sheet_name == 'consultoria' else '0',
-                'descricao': row.get('descricao', '')
-            }
-
-            soap_request = soap_request_gen.create_soap_request(**kwargs)
-            rps_counter += 1
-
-            numero_lote = soap_request_gen.numero_lote_dinamico(valor_rps=kwargs['valor_rps'])
-
-            soap_request_lote = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <RecepcionarLoteRps xmlns="https://www.e-governeapps2.com.br/">
-      <EnviarLoteRpsEnvio>
-        <LoteRps>
-          <NumeroLote>{numero_lote}</NumeroLote>
-          <Cnpj>{cnpj_prestador}</Cnpj>
-          <InscricaoMunicipal>{inscricao_municipal_prestador}</InscricaoMunicipal>
-          <QuantidadeRps>1</QuantidadeRps>
-          <ListaRps>
-            <Rps>
-              <InfRps>
-                {soap_request.split('<InfRps>')[1].split('</InfRps>')[0]}
-              </InfRps>
-            </Rps>
-          </ListaRps>
-        </LoteRps>
-      </EnviarLoteRpsEnvio>
-    </RecepcionarLoteRps>
-  </soap:Body>
-</soap:Envelope>"""
-
-            response = send_soap_request(soap_request_lote)
-            status_text = "Sucesso" if "Protocolo" in response.text else "Erro"
-
-            if status_text == "Sucesso":
-                protocolo_numero = response.text.split("<Protocolo>")[1].split("</Protocolo>")[0]
-                status_verificacao = verify_submission(cnpj_prestador, inscricao_municipal_prestador, protocolo_numero)
-            else:
-                protocolo_numero = "N/A"
-                status_verificacao = "Erro ao processar a NFS-e: " + response.text
-
-            status = [
-                kwargs['valor_rps'],
-                kwargs['tomador_cnpj'],
-                kwargs['tomador_razao_social'],
-                kwargs['tomador_endereco'],
-                kwargs['tomador_numero'],
-                kwargs['tomador_codigo_municipio'],
-                kwargs['tomador_uf'],
-                kwargs['tomador_cep'],
-                kwargs['tomador_bairro'],
-                kwargs['valor_liquido_nfse'],
-                kwargs['descricao'],
-                protocolo_numero,
-                status_verificacao
-            ]
-            status_list.append(status)
-
-    return status_list
+def _consulta_incremental():
+    """
+    Indica se a requisição usa a consulta incremental de status (algum dos parâmetros 'since',
+    'limite', 'status' ou 'prestador').
+    """
+    return any(parametro in request.args for parametro in ('since', 'limite', 'status', 'prestador'))
 
 
-@app.route('/export', methods=['GET'])
-def export_status():
-    global processed_status, uploaded_filename
-    if uploaded_filename is None:
-        return 'Nenhum arquivo processado disponível para exportação', 400
+def _pagina_status(job_id, desde, limite):
+    status, abas = _filtros_status()
+    itens, cursor, mais = status_store.linhas_desde(job_id, desde, limite, status=status, abas=abas)
+    return {
+        'linhas': [{'seq': seq, 'posicao': posicao, 'linha': linha.para_lista()} for seq, posicao, linha in itens],
+        'cursor': cursor,
+        'mais': mais,
+    }
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], uploaded_filename)
 
-    xls = pd.ExcelFile(file_path)
+@app.route('/status_data', methods=['GET'])
+def status_data():
+    """
+    Rota com as linhas de status de um job.
 
-    df_dict = {}
-    processed_status_index = 0
+    Sem parâmetros de consulta, retorna a lista completa de linhas. Com 'since' (cursor retornado
+    pela consulta anterior, 0 para começar), retorna apenas as linhas novas ou alteradas depois
+    dele, em páginas de até 'limite' linhas (default: STATUS_PAGINA), com os filtros opcionais
+    'status' (prefixo do status de verificação) e 'prestador' (CNPJ do prestador).
 
-    for sheet_name in xls.sheet_names:
-        df_planilha = pd.read_excel(file_path, sheet_name=sheet_name)
+    Retorna:
+        JSON: {'linhas': [{'seq', 'posicao', 'linha'}], 'cursor': int, 'mais': bool}; com 'mais'
+            verdadeiro, há outra página a buscar imediatamente com o novo cursor.
 
-        df_planilha['Protocolo'] = None
-        df_planilha['Status Verificação'] = None
+    Exemplo:
+        GET /status_data?job=<id>&since=0&limite=200&status=Erro
+    """
+    job_id = _job_solicitado()
+    if not _consulta_incremental():
+        return jsonify([linha.para_lista() for linha in status_store.linhas(job_id)] if job_id else [])
 
-        for i in range(len(df_planilha)):
-            if processed_status_index < len(processed_status):
-                df_planilha.at[i, 'Protocolo'] = processed_status[processed_status_index][11]
-                df_planilha.at[i, 'Status Verificação'] = processed_status[processed_status_index][12]
-                processed_status_index += 1
+    try:
+        desde = int(request.args.get('since', 0))
+        limite = int(request.args.get('limite', STATUS_PAGINA))
+    except ValueError:
+        return "Parâmetros 'since' e 'limite' devem ser inteiros", 400
+    limite = min(max(limite, 1), STATUS_PAGINA_MAXIMA)
 
-        df_planilha = df_planilha.reindex(columns=[
-            'vazio', 'rps', 'vazio.1', 'cnpj', 'razao', 'logradouro',
-            'numero', 'cep', 'bairro', 'valor', 'descricao', 'obs',
-            'uf', 'municipio', 'Protocolo', 'Status Verificação'
-        ])
+    if not job_id:
+        return jsonify({'linhas': [], 'cursor': desde, 'mais': False})
+    return jsonify(_pagina_status(job_id, desde, limite))
 
-        df_dict[sheet_name] = df_planilha
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for sheet_name, df in df_dict.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+def _job_encerrado(job_id):
+    """
+    Indica se um job terminou: pelo gerenciador local ou, para jobs de outro processo, pela
+    ausência de linhas aguardando consulta.
+    """
+    job = job_manager.get(job_id)
+    if job is not None:
+        return job.estado in ('concluido', 'erro')
+    if status_store.info_job(job_id) is None:
+        return True
+    _, pendentes = status_store.resumo_job(job_id, STATUS_AGUARDANDO)
+    return pendentes == 0
 
-    output.seek(0)
 
-    return send_file(output, as_attachment=True, download_name=f"{uploaded_filename[:-5]}_processada.xlsx",
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@app.route('/status_stream', methods=['GET'])
+def status_stream():
+    """
+    Rota de Server-Sent Events com as linhas de status novas ou alteradas de um job.
 
+    Cada evento 'linhas' traz a mesma página de /status_data?since= e tem como id o cursor, de
+    modo que o navegador, ao reconectar, continua do ponto em que parou (cabeçalho Last-Event-ID).
+    Quando o job termina e todas as alterações foram enviadas, é enviado o evento 'fim'. Aceita
+    os mesmos filtros de /status_data.
 
-@app.route('/status_data', methods=['GET'])
-def status_data():
-    global processed_status
-    return jsonify(processed_status)
+    Exemplo:
+        const fonte = new EventSource('/status_stream?job=<id>&since=0');
+        fonte.addEventListener('linhas', evento => atualizar(JSON.parse(evento.data)));
+    """
+    job_id = _job_solicitado()
+    try:
+        desde = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        return "Parâmetro 'since' deve ser inteiro", 400
+
+    def eventos(desde):
+        ultimo_envio = time.monotonic()
+        while job_id:
+            encerrado = _job_encerrado(job_id)
+            pagina = _pagina_status(job_id, desde, STATUS_PAGINA)
+            if pagina['linhas']:
+                desde = pagina['cursor']
+                ultimo_envio = time.monotonic()
+                yield f"id: {desde}\nevent: linhas\ndata: {json.dumps(pagina, default=str)}\n\n"
+                if pagina['mais']:
+                    continue
+            if encerrado:
+                break
+            if time.monotonic() - ultimo_envio >= STATUS_STREAM_HEARTBEAT:
+                ultimo_envio = time.monotonic()
+                yield ": heartbeat\n\n"
+            time.sleep(STATUS_STREAM_INTERVALO)
+        yield f"id: {desde}\nevent: fim\ndata: {json.dumps({'cursor': desde})}\n\n"
+
+    return Response(stream_with_context(eventos(desde)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 if __name__ == '__main__':
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'False').lower() == 'true'
+    carregar_indice(BANCO_TERRITORIAL_CAMINHO)
     app.run(debug=DEBUG_MODE)
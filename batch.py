@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from polling import get_poller, STATUS_AGUARDANDO
+from exportacao import exportar, FORMATOS
+from rps_journal import criar_journal
+from pipeline import planilhas_enriquecidas, process_dataframes
+import pipeline
+import rate_limit
+
+"""
+Módulo: batch.py
+Descrição: Execução em lote, pela linha de comando, sem o servidor web.
+
+Processa uma planilha ou todas as planilhas (.xlsx) de um diretório com as mesmas etapas do app
+(pipeline.py): preenchimento dos municípios, validação prévia, envio concorrente dos lotes,
+consulta dos protocolos e registro de RPS (os RPS já enviados em uma execução anterior não são
+reenviados). Para cada planilha é gravado o arquivo de resultado (o mesmo da exportação do app)
+e, ao final, um resumo em JSON com a contagem de notas emitidas, recusadas e pendentes.
+
+As planilhas são distribuídas entre processos (--processos); cada processo trata uma planilha
+por vez, do envio até o fim das consultas. A taxa de requisições por prestador (SOAP_TAXA) é
+dividida entre os processos, para que o total continue dentro do limite configurado. Com mais de
+um processo, as abas de cada planilha são tratadas em sequência dentro do seu processo (sem o
+pool de abas de pipeline.py, que só é usado com um processo).
+
+Uso:
+    python batch.py entrada/ --saida resultados/ --processos 4 --formato csv
+
+Configuração (variáveis de ambiente):
+- As mesmas do app para o envio (LOTE_TAMANHO, VALIDAR_RPS, SOAP_TAXA, RPS_JOURNAL, ...).
+- BATCH_PROCESSOS: Número de processos (default: 1).
+
+Dependências:
+- concurrent.futures
+"""
+
+BATCH_PROCESSOS = int(os.getenv('BATCH_PROCESSOS', '1'))
+
+
+def listar_planilhas(entrada):
+    """
+    Retorna as planilhas a processar: o próprio arquivo ou os .xlsx de um diretório, em ordem
+    alfabética (arquivos temporários do Excel, iniciados por '~$', são ignorados).
+    """
+    if os.path.isdir(entrada):
+        return sorted(caminho for caminho in glob.glob(os.path.join(entrada, '*.xlsx'))
+                      if not os.path.basename(caminho).startswith('~$'))
+    return [entrada]
+
+
+def resumir(arquivo, linhas):
+    """
+    Conta os resultados de uma planilha.
+
+    Retorna:
+        dict: Total de RPS, NFS-e emitidas, RPS com erro e RPS ainda aguardando processamento.
+    """
+    emitidas = sum(1 for linha in linhas if linha.nfse)
+    aguardando = sum(1 for linha in linhas if linha.status == STATUS_AGUARDANDO)
+    return {
+        'arquivo': arquivo,
+        'total': len(linhas),
+        'emitidas': emitidas,
+        'erros': len(linhas) - emitidas - aguardando,
+        'aguardando': aguardando,
+    }
+
+
+def processar_arquivo(caminho, saida, formato='xlsx', lote_tamanho=None):
+    """
+    Envia os RPS de uma planilha, aguarda a consulta dos protocolos e grava o arquivo de resultado.
+
+    Parâmetros:
+        caminho (str): Caminho da planilha.
+        saida (str): Diretório onde o resultado é gravado.
+        formato (str): Formato do resultado: 'xlsx', 'csv' ou 'parquet'.
+        lote_tamanho (int): Quantidade de RPS por lote (default: LOTE_TAMANHO).
+
+    Retorna:
+        dict: Resumo da planilha (ver resumir), com o caminho do resultado em 'resultado' e o
+            tempo de processamento em 'duracao'; em caso de falha, a mensagem em 'erro'.
+    """
+    inicio = time.perf_counter()
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    try:
+        planilhas = planilhas_enriquecidas(caminho)
+        linhas = process_dataframes(planilhas, lote_tamanho=lote_tamanho, journal=criar_journal())
+        get_poller().wait()
+
+        extensao, _ = FORMATOS[formato]
+        destino = os.path.join(saida, f"{nome}_processada.{extensao}")
+        conteudo = exportar(planilhas, linhas, formato)
+        with open(destino, 'wb') as arquivo:
+            arquivo.write(conteudo.getbuffer())
+    except Exception as e:
+        print(f"Erro ao processar a planilha {caminho}: {e}")
+        return {'arquivo': caminho, 'erro': str(e), 'duracao': round(time.perf_counter() - inicio, 2)}
+
+    resumo = resumir(caminho, linhas)
+    resumo['resultado'] = destino
+    resumo['duracao'] = round(time.perf_counter() - inicio, 2)
+    print(f"{caminho}: {resumo['emitidas']}/{resumo['total']} NFS-e emitidas, {resumo['erros']} com erro, "
+          f"{resumo['aguardando']} aguardando ({resumo['duracao']} s)")
+    return resumo
+
+
+def _inicializar_processo(processos):
+    """
+    Divide a taxa de requisições por prestador entre os processos e desativa o pool de abas (as
+    planilhas já estão distribuídas entre os processos).
+    """
+    pipeline.PIPELINE_PROCESSOS = 1
+    if rate_limit.SOAP_TAXA > 0:
+        rate_limit.SOAP_TAXA /= processos
+        if rate_limit.SOAP_RAJADA:
+            rate_limit.SOAP_RAJADA = max(1.0, rate_limit.SOAP_RAJADA / processos)
+
+
+def executar(entrada, saida, processos=None, formato='xlsx', lote_tamanho=None):
+    """
+    Processa as planilhas de um arquivo ou diretório, distribuídas entre processos.
+
+    Parâmetros:
+        entrada (str): Planilha ou diretório com planilhas .xlsx.
+        saida (str): Diretório dos resultados (criado se não existir).
+        processos (int): Número de processos (default: BATCH_PROCESSOS).
+        formato (str): Formato dos resultados: 'xlsx', 'csv' ou 'parquet'.
+        lote_tamanho (int): Quantidade de RPS por lote (default: LOTE_TAMANHO).
+
+    Retorna:
+        list: Resumos das planilhas (ver processar_arquivo), na ordem de listar_planilhas.
+
+    Exemplo:
+        >>> resumos = executar('entrada', 'resultados', processos=4)
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+    planilhas = listar_planilhas(entrada)
+    os.makedirs(saida, exist_ok=True)
+    processos = max(1, min(processos or BATCH_PROCESSOS, len(planilhas) or 1))
+    print(f"Processando {len(planilhas)} planilha(s) em {processos} processo(s)")
+
+    if processos == 1:
+        resumos = [processar_arquivo(caminho, saida, formato, lote_tamanho) for caminho in planilhas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo,
+                                 initargs=(processos,)) as executor:
+            resumos = list(executor.map(processar_arquivo, planilhas, [saida] * len(planilhas),
+                                        [formato] * len(planilhas), [lote_tamanho] * len(planilhas)))
+
+    with open(os.path.join(saida, 'resumo.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(resumos, arquivo, ensure_ascii=False, indent=2)
+    return resumos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Envio em lote de planilhas de RPS, sem o servidor web.')
+    parser.add_argument('entrada', help='Planilha .xlsx ou diretório com planilhas')
+    parser.add_argument('--saida', default=os.getenv('OUTPUT_DIR') or 'resultados',
+                        help='Diretório dos resultados (default: OUTPUT_DIR ou resultados)')
+    parser.add_argument('--processos', type=int, default=None, help='Número de processos (default: BATCH_PROCESSOS)')
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default='xlsx', help='Formato dos resultados')
+    parser.add_argument('--lote-tamanho', type=int, default=None, help='RPS por lote (default: LOTE_TAMANHO)')
+    args = parser.parse_args(argv)
+
+    resumos = executar(args.entrada, args.saida, args.processos, args.formato, args.lote_tamanho)
+    # Código de saída diferente de zero se alguma planilha não pôde ser processada (para o cron)
+    return 1 if any('erro' in resumo for resumo in resumos) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
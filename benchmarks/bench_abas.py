@@ -0,0 +1,97 @@
+import os
+import re
+import sys
+import time
+import tempfile
+import pandas as pd
+
+"""
+Benchmark: processamento das abas de uma planilha em paralelo.
+
+Gera uma planilha sintética com uma aba por categoria de prestador e mede a leitura com
+preenchimento dos municípios (pipeline.ler_planilha) e a montagem dos lotes
+(pipeline.montar_lotes_abas), primeiro em sequência (PIPELINE_PROCESSOS=1) e depois com uma aba
+por processo. Os lotes dos dois caminhos são comparados (exceto a data de emissão).
+
+O ganho depende do número de CPUs disponíveis: com 4 abas e pelo menos 4 CPUs, o tempo das
+etapas de CPU cai para cerca do tempo da maior aba, somado ao custo de enviar as abas e os
+lotes entre os processos.
+
+Execução (a partir da raiz do repositório):
+    python -m benchmarks.bench_abas [linhas_por_aba] [processos]
+"""
+
+ABAS = ['categoria_1', 'categoria_2', 'categoria_3', 'categoria_4']
+
+# Prestadores fictícios das abas; definidos antes de importar o pipeline (directory.dados)
+for numero, _ in enumerate(ABAS, start=1):
+    os.environ.setdefault(f'CNPJ_CATEGORIA_{numero}', f'{numero}' * 8 + '000191')
+    os.environ.setdefault(f'IM_CATEGORIA_{numero}', str(numero))
+
+CIDADES = ['Curitiba/PR', 'São Paulo/SP', 'Florianópolis/SC', 'Porto Alegre/RS']
+
+
+def gerar_planilha(caminho, linhas_por_aba):
+    with pd.ExcelWriter(caminho, engine='openpyxl') as writer:
+        for numero_aba, aba in enumerate(ABAS):
+            pd.DataFrame({
+                'vazio': [None] * linhas_por_aba,
+                'rps_numero': range(1000 * numero_aba + 1, 1000 * numero_aba + 1 + linhas_por_aba),
+                'cnpj_tomador': ['12.345.678/0001-95' if i % 2 else '123.456.789-09' for i in range(linhas_por_aba)],
+                'razao_social': [f'Empresa {i}' for i in range(linhas_por_aba)],
+                'logradouro': 'Rua XV de Novembro',
+                'numero': [str(i) for i in range(linhas_por_aba)],
+                'cep': '80020-310',
+                'bairro': 'Centro',
+                'valor': '1.234,56',
+                'descricao': 'Prestação de serviços',
+                'cidade/uf': [CIDADES[i % len(CIDADES)] for i in range(linhas_por_aba)],
+            }).to_excel(writer, sheet_name=aba, index=False)
+
+
+def medir(pipeline, caminho, processos):
+    pipeline.PIPELINE_PROCESSOS = processos
+    pipeline.PIPELINE_PARALELO_MIN_LINHAS = 0
+    pipeline.reset_pool_abas()
+    if processos > 1:
+        # Inicia os processos antes da medição
+        list(pipeline.get_pool_abas().map(abs, range(processos)))
+
+    inicio = time.perf_counter()
+    dfs = pipeline.ler_planilha(caminho, pipeline.BANCO_TERRITORIAL_CAMINHO)
+    leitura = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    lotes = pipeline.montar_lotes_abas(dfs, 50)
+    montagem = time.perf_counter() - inicio
+    pipeline.reset_pool_abas()
+    return leitura, montagem, lotes
+
+
+def _comparavel(lote):
+    return (lote['modo'], lote['cnpj'], lote['posicao'], [rps.valor_rps for rps in lote['kwargs']],
+            re.sub(r'<DataEmissao>[^<]*', '', lote.get('envelope', '')))
+
+
+def main(linhas_por_aba=5000, processos=len(ABAS)):
+    import pipeline
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'abas.xlsx')
+        gerar_planilha(caminho, linhas_por_aba)
+
+        leitura_seq, montagem_seq, lotes_seq = medir(pipeline, caminho, 1)
+        leitura_par, montagem_par, lotes_par = medir(pipeline, caminho, processos)
+
+    assert list(map(_comparavel, lotes_seq)) == list(map(_comparavel, lotes_par)), \
+        "Os dois caminhos produziram lotes diferentes"
+
+    print(f"Abas: {len(ABAS)} x {linhas_por_aba} linhas | processos: {processos} | CPUs: {os.cpu_count()}")
+    print(f"{'':14}{'sequencial':>12}{'paralelo':>12}{'ganho':>8}")
+    for etapa, sequencial, paralelo in (('leitura', leitura_seq, leitura_par),
+                                        ('lotes', montagem_seq, montagem_par),
+                                        ('total', leitura_seq + montagem_seq, leitura_par + montagem_par)):
+        print(f"{etapa:14}{sequencial:11.2f}s{paralelo:11.2f}s{sequencial / paralelo:7.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(argumento) for argumento in sys.argv[1:3]))
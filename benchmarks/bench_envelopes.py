@@ -0,0 +1,115 @@
+import time
+import datetime
+from directory import SoapRequestGenerator, create_lote_request
+from rps_template import render_inf_rps, render_lote
+
+"""
+Benchmark: geração de envelopes de lote (RecepcionarLoteRps).
+
+Compara o caminho antigo (create_soap_request gera um envelope completo por RPS, o InfRps é
+recortado com split e colado em um segundo envelope montado com f-string) com as funções de
+rps_template, que montam o InfRps e o lote diretamente com f-strings.
+
+Execução (a partir da raiz do repositório):
+    python -m benchmarks.bench_envelopes [rps] [rps_por_lote]
+"""
+
+KWARGS = {
+    'cnpj': '11111111000111',
+    'inscricao_municipal': '123456',
+    'prestador_cnpj': '11111111000111',
+    'prestador_inscricao': '123456',
+    'tomador_cnpj': '12.345.678/0001-95',
+    'tomador_razao_social': 'Empresa Exemplo Ltda',
+    'tomador_endereco': 'Rua XV de Novembro',
+    'tomador_numero': '1000',
+    'tomador_bairro': 'Centro',
+    'tomador_codigo_municipio': 4106902,
+    'tomador_uf': 'PR',
+    'tomador_cep': '80020-310',
+    'valor_liquido_nfse': 1234.56,
+    'item_lista_servico': '0000',
+    'aliquota': 0.05,
+    'codigo_cnae': '0',
+    'descricao': 'Prestação de serviços de consultoria',
+}
+
+LOTE_ANTIGO = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+                xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <RecepcionarLoteRps xmlns="https://www.e-governeapps2.com.br/">
+      <EnviarLoteRpsEnvio>
+        <LoteRps>
+          <NumeroLote>{numero_lote}</NumeroLote>
+          <Cnpj>{cnpj}</Cnpj>
+          <InscricaoMunicipal>{inscricao}</InscricaoMunicipal>
+          <QuantidadeRps>{quantidade}</QuantidadeRps>
+          <ListaRps>{lista_rps}
+          </ListaRps>
+        </LoteRps>
+      </EnviarLoteRpsEnvio>
+    </RecepcionarLoteRps>
+  </soap:Body>
+</soap:Envelope>"""
+
+
+def caminho_antigo(total, por_lote):
+    gerador = SoapRequestGenerator()
+    envelopes = 0
+    for inicio in range(0, total, por_lote):
+        fragmentos = []
+        for numero in range(inicio, min(inicio + por_lote, total)):
+            soap_request = gerador.create_soap_request(valor_rps=numero, **KWARGS)
+            fragmentos.append(soap_request.split('<InfRps>')[1].split('</InfRps>')[0])
+        lista_rps = "".join(f"""
+            <Rps>
+              <InfRps>
+                {fragmento}
+              </InfRps>
+            </Rps>""" for fragmento in fragmentos)
+        LOTE_ANTIGO.format(numero_lote=gerador.numero_lote_dinamico(inicio), cnpj=KWARGS['cnpj'],
+                           inscricao=KWARGS['inscricao_municipal'], quantidade=len(fragmentos),
+                           lista_rps=lista_rps)
+        envelopes += 1
+    return envelopes
+
+
+def caminho_templates(total, por_lote):
+    gerador = SoapRequestGenerator()
+    envelopes = 0
+    data_emissao = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    for inicio in range(0, total, por_lote):
+        fragmentos = [render_inf_rps(valor_rps=numero, data_emissao=data_emissao, **KWARGS)
+                      for numero in range(inicio, min(inicio + por_lote, total))]
+        render_lote(gerador.numero_lote_dinamico(inicio), KWARGS['cnpj'], KWARGS['inscricao_municipal'], fragmentos)
+        envelopes += 1
+    return envelopes
+
+
+def medir(funcao, total, por_lote, repeticoes=3):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(total, por_lote)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main(total=20000, por_lote=1):
+    # create_lote_request é o caminho usado em produção; garante que aceita o lote medido
+    create_lote_request(1, KWARGS['cnpj'], KWARGS['inscricao_municipal'], [render_inf_rps(valor_rps=1, **KWARGS)])
+
+    tempo_antigo = medir(caminho_antigo, total, por_lote)
+    tempo_novo = medir(caminho_templates, total, por_lote)
+    envelopes = -(-total // por_lote)
+
+    print(f"RPS: {total} | RPS por lote: {por_lote} | envelopes: {envelopes}")
+    print(f"antigo (split/re-wrap): {envelopes / tempo_antigo:10.0f} envelopes/s {total / tempo_antigo:10.0f} RPS/s")
+    print(f"templates:              {envelopes / tempo_novo:10.0f} envelopes/s {total / tempo_novo:10.0f} RPS/s")
+    print(f"Ganho:                  {tempo_antigo / tempo_novo:10.1f}x")
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(argumento) for argumento in sys.argv[1:3]))
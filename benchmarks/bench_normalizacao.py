@@ -0,0 +1,70 @@
+import time
+import random
+import pandas as pd
+from municipio_index import normalizar_texto, separar_cidade_uf, carregar_indice
+
+"""
+Benchmark: normalização da coluna cidade/uf.
+
+Compara o caminho antigo de preencher_municipio (normalizar_texto aplicado célula a célula com
+Series.apply, com a chave normalizada duas vezes) com o caminho vetorizado (separar_cidade_uf,
+que divide e normaliza apenas os valores distintos) em uma planilha sintética de 50 mil linhas.
+
+Execução (a partir da raiz do repositório):
+    python -m benchmarks.bench_normalizacao [linhas] [cidades_distintas]
+"""
+
+BANCO_TERRITORIAL_CAMINHO = 'referencia/relatorio_municipio.xls'
+
+
+def gerar_coluna(linhas, cidades_distintas):
+    """
+    Gera uma coluna 'cidade/uf' com variações de caixa e espaços sobre cidades reais.
+    """
+    indice = carregar_indice(BANCO_TERRITORIAL_CAMINHO)
+    random.seed(42)
+    chaves = random.sample(sorted(indice), cidades_distintas)
+    variacoes = [str.upper, str.title, str.lower, lambda texto: f"  {texto} "]
+    return pd.Series([random.choice(variacoes)(random.choice(chaves)) for _ in range(linhas)])
+
+
+def caminho_antigo(coluna):
+    partes = coluna.str.split('/', expand=True)
+    cidade = partes[0].apply(normalizar_texto)
+    uf = partes[1].str.upper()
+    return (cidade + '/' + uf).apply(normalizar_texto)
+
+
+def caminho_vetorizado(coluna):
+    return separar_cidade_uf(coluna)['chave']
+
+
+def medir(funcao, coluna, repeticoes=3):
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(coluna)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main(linhas=50000, cidades_distintas=300):
+    coluna = gerar_coluna(linhas, cidades_distintas)
+
+    tempo_antigo, antigo = medir(caminho_antigo, coluna)
+    tempo_novo, novo = medir(caminho_vetorizado, coluna)
+
+    # O caminho antigo não remove espaços ao redor da UF; compara apenas as linhas sem esse caso
+    comparaveis = ~coluna.str.contains(r'/\s|\s$', regex=True)
+    assert antigo[comparaveis].equals(novo[comparaveis]), "Os dois caminhos produziram chaves diferentes"
+
+    print(f"Linhas: {linhas} | cidades distintas: {cidades_distintas}")
+    print(f"apply (antigo):   {tempo_antigo * 1000:8.1f} ms")
+    print(f"vetorizado:       {tempo_novo * 1000:8.1f} ms")
+    print(f"Ganho:            {tempo_antigo / tempo_novo:8.1f}x")
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(argumento) for argumento in sys.argv[1:3]))
@@ -0,0 +1,183 @@
+import io
+import os
+import time
+import tempfile
+import contextlib
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.fake_nfse import FakeNfseServer
+
+"""
+Benchmark: pipeline completo de upload contra o serviço NFS-e de teste (benchmarks/fake_nfse.py).
+
+Para cada tamanho, gera uma planilha sintética com duas abas, envia-a pela rota /upload do app
+(Flask test client) e acompanha o job até que todas as linhas tenham status definitivo. Cada
+execução roda em um processo novo, de modo que o pico de memória é o do próprio pipeline; o
+serviço de teste roda no processo principal.
+
+Métricas:
+- linhas/s: linhas concluídas por segundo, do upload até o último status definitivo.
+- envio linhas/s: linhas enviadas por segundo, do upload até a última resposta do RecepcionarLoteRps.
+- p50/p99: latência das requisições HTTP ao web service, por operação.
+- pico de memória: RSS máximo do processo do pipeline.
+- controle de fluxo: limite de concorrência final e reduções por prestador (ver rate_limit.py).
+
+O comportamento do serviço é configurado pelas variáveis FAKE_NFSE_* (ver fake_nfse.py); as do
+app (LOTE_TAMANHO, SUBMISSION_MAX_WORKERS, POLLING_* etc.) valem normalmente, com defaults
+adequados ao benchmark quando não informadas.
+
+Execução (a partir da raiz do repositório):
+    python -m benchmarks.bench_pipeline [linhas ...]
+"""
+
+TAMANHOS = (100, 1000, 10000)
+
+AMBIENTE = {
+    'CNPJ_CATEGORIA_1': '11111111000191',
+    'IM_CATEGORIA_1': '1234567',
+    'CNPJ_CATEGORIA_2': '22222222000191',
+    'IM_CATEGORIA_2': '7654321',
+    'LOTE_TAMANHO': '50',
+    'POLLING_INTERVALO_INICIAL': '0.5',
+    'POLLING_INTERVALO_MAXIMO': '2',
+    'POLLING_TENTATIVAS': '30',
+    'STATUS_STORE': 'memoria',
+    # Sem registro de RPS: cada execução envia a planilha inteira
+    'RPS_JOURNAL': '',
+}
+
+CIDADES = ['Curitiba/PR', 'São Paulo/SP', 'Florianópolis/SC', 'Porto Alegre/RS', 'Londrina/PR']
+
+
+def gerar_planilha(caminho, linhas):
+    """
+    Gera uma planilha com as linhas divididas entre as abas categoria_1 e categoria_2.
+    """
+    with pd.ExcelWriter(caminho, engine='openpyxl') as writer:
+        for numero_aba, aba in enumerate(('categoria_1', 'categoria_2')):
+            quantidade = linhas // 2 + (linhas % 2 if numero_aba == 0 else 0)
+            pd.DataFrame({
+                'rps_numero': range(1, quantidade + 1),
+                'cnpj_tomador': ['12.345.678/0001-95' if i % 2 else '123.456.789-09' for i in range(quantidade)],
+                'razao_social': [f'Empresa {i} & Filhos Ltda' for i in range(quantidade)],
+                'logradouro': 'Rua XV de Novembro',
+                'numero': [str(i % 2000) for i in range(quantidade)],
+                'cep': '80020-310',
+                'bairro': 'Centro',
+                'valor': [f'{100 + i % 900},{i % 100:02d}' for i in range(quantidade)],
+                'descricao': 'Prestação de serviços de consultoria',
+                'obs': '',
+                'cidade/uf': [CIDADES[i % len(CIDADES)] for i in range(quantidade)],
+            }).to_excel(writer, sheet_name=aba, index=False)
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def pico_memoria_mb():
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    # ru_maxrss é informado em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def executar(caminho, url, linhas):
+    """
+    Executa o upload de uma planilha em um processo novo e retorna as métricas.
+    """
+    for chave, valor in AMBIENTE.items():
+        os.environ.setdefault(chave, valor)
+    os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp(prefix='bench_uploads_'))
+    os.environ['NFSE_URL'] = url
+
+    import app
+    import transport
+    import rate_limit
+
+    latencias = {}
+    ultimo_envio = [0.0]
+
+    def registrar(response, *args, **kwargs):
+        operacao = response.request.headers.get('SOAPAction', '').rsplit('/', 1)[-1]
+        latencias.setdefault(operacao, []).append(response.elapsed.total_seconds())
+        if operacao == 'RecepcionarLoteRps':
+            ultimo_envio[0] = time.perf_counter()
+
+    for idempotente in (False, True):
+        transport.get_session(url, idempotente).hooks['response'].append(registrar)
+
+    cliente = app.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        with open(caminho, 'rb') as arquivo:
+            resposta = cliente.post('/upload', data={'file': (arquivo, os.path.basename(caminho))},
+                                    content_type='multipart/form-data')
+        job_id = resposta.get_json()['id']
+
+        while True:
+            job = cliente.get(f'/jobs/{job_id}').get_json()
+            if job['estado'] in ('concluido', 'erro'):
+                break
+            time.sleep(0.02)
+        fim = time.perf_counter()
+
+    if job['estado'] == 'erro':
+        raise RuntimeError(f"O job terminou com erro: {job['erro']}")
+
+    return {
+        'linhas': linhas,
+        'tempo': fim - inicio,
+        'linhas_s': job['concluidos'] / (fim - inicio),
+        'envio_linhas_s': job['enviados'] / max(ultimo_envio[0] - inicio, 1e-9),
+        'latencias': {operacao: (percentil(valores, 50), percentil(valores, 99), len(valores))
+                      for operacao, valores in latencias.items()},
+        'memoria_mb': pico_memoria_mb(),
+        'controle': rate_limit.metricas(),
+    }
+
+
+def main(*tamanhos):
+    tamanhos = tamanhos or TAMANHOS
+    servidor = FakeNfseServer()
+    url = servidor.start()
+    print(f"Serviço de teste: latência {servidor.latencia}s ±{servidor.variacao:.0%}, taxa de erro "
+          f"{servidor.taxa_erro}, taxa de falha {servidor.taxa_falha}, processamento {servidor.atraso_processamento}s")
+    print(f"{'linhas':>7} {'tempo (s)':>10} {'linhas/s':>9} {'envio linhas/s':>15} {'operação':>19} "
+          f"{'req.':>6} {'p50 (ms)':>9} {'p99 (ms)':>9} {'pico (MB)':>10}")
+
+    contexto = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='bench_pipeline_') as diretorio:
+        for linhas in tamanhos:
+            caminho = os.path.join(diretorio, f'planilha_{linhas}.xlsx')
+            gerar_planilha(caminho, linhas)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                resultado = executor.submit(executar, caminho, url, linhas).result()
+
+            primeira = True
+            for operacao, (p50, p99, quantidade) in sorted(resultado['latencias'].items(), reverse=True):
+                prefixo = (f"{linhas:>7} {resultado['tempo']:>10.2f} {resultado['linhas_s']:>9.0f} "
+                           f"{resultado['envio_linhas_s']:>15.0f}") if primeira else " " * 44
+                sufixo = f" {resultado['memoria_mb']:>10.0f}" if primeira else ""
+                print(f"{prefixo} {operacao:>19} {quantidade:>6} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f}{sufixo}")
+                primeira = False
+            for controle in resultado['controle']:
+                print(f"{'':>44} prestador {controle['prestador']}: concorrência {controle['concorrencia']}, "
+                      f"{controle['reducoes']} reduções, {controle['sobrecargas']} sobrecargas, "
+                      f"taxa máxima {controle['taxa_maxima']} req/s")
+
+    servidor.stop()
+    print(f"Requisições atendidas: {servidor.envios} envios, {servidor.consultas} consultas, "
+          f"{servidor.recusas} lotes recusados, {servidor.falhas} falhas HTTP")
+
+
+if __name__ == '__main__':
+    import sys
+    main(*(int(argumento) for argumento in sys.argv[1:]))
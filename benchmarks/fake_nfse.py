@@ -0,0 +1,224 @@
+import os
+import re
+import gzip
+import time
+import random
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+"""
+Módulo: benchmarks/fake_nfse.py
+Descrição: Serviço NFS-e local que substitui o web service do município em testes de carga.
+
+Implementa o RecepcionarLoteRps e o ConsultarLoteRps com o mesmo formato de resposta do serviço
+real (ABRASF), sem validar o conteúdo dos lotes:
+- RecepcionarLoteRps devolve um protocolo novo, ou recusa o lote (ListaMensagemRetorno) com a
+  probabilidade configurada em taxa_erro.
+- ConsultarLoteRps devolve uma resposta sem ListaNfse enquanto o lote está "em processamento"
+  (atraso_processamento segundos após o recebimento) e, depois disso, uma NFS-e por RPS do lote.
+- Qualquer requisição pode falhar com HTTP 503 com a probabilidade taxa_falha.
+- Cada resposta é atrasada por latencia segundos, com variação uniforme de ±variacao * latencia.
+
+Configuração (variáveis de ambiente, usadas como default):
+- FAKE_NFSE_LATENCIA: Latência média das respostas em segundos (default: 0.05).
+- FAKE_NFSE_VARIACAO: Variação relativa da latência (default: 0.5).
+- FAKE_NFSE_TAXA_ERRO: Fração dos lotes recusados com mensagem de retorno (default: 0).
+- FAKE_NFSE_TAXA_FALHA: Fração das requisições respondidas com HTTP 503 (default: 0).
+- FAKE_NFSE_ATRASO: Tempo de processamento de cada lote em segundos (default: 1).
+
+Execução isolada (a partir da raiz do repositório):
+    python -m benchmarks.fake_nfse [porta]
+e o app apontado para ele com NFSE_URL=http://127.0.0.1:<porta>/ (ver endpoints.py).
+
+Dependências:
+- http.server (biblioteca padrão)
+"""
+
+FAKE_NFSE_LATENCIA = float(os.getenv('FAKE_NFSE_LATENCIA', '0.05'))
+FAKE_NFSE_VARIACAO = float(os.getenv('FAKE_NFSE_VARIACAO', '0.5'))
+FAKE_NFSE_TAXA_ERRO = float(os.getenv('FAKE_NFSE_TAXA_ERRO', '0'))
+FAKE_NFSE_TAXA_FALHA = float(os.getenv('FAKE_NFSE_TAXA_FALHA', '0'))
+FAKE_NFSE_ATRASO = float(os.getenv('FAKE_NFSE_ATRASO', '1'))
+
+NAMESPACE = 'https://www.e-governeapps2.com.br/'
+
+ENVELOPE = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <{operacao}Response xmlns="{namespace}">
+      <{operacao}Result>{conteudo}</{operacao}Result>
+    </{operacao}Response>
+  </soap:Body>
+</soap:Envelope>"""
+
+_NUMERO_RPS = re.compile(r'<IdentificacaoRps>\s*<Numero>([^<]*)</Numero>')
+_PROTOCOLO = re.compile(r'<Protocolo>([^<]*)</Protocolo>')
+
+
+class FakeNfseServer:
+    """
+    Servidor HTTP local com o comportamento do web service de NFS-e.
+
+    Métodos:
+    - start: Inicia o servidor em uma thread daemon e retorna a URL.
+    - stop: Encerra o servidor.
+
+    Atributos:
+    - envios / consultas / recusas / falhas: Contadores de requisições atendidas.
+    """
+    def __init__(self, porta=0, latencia=None, variacao=None, taxa_erro=None, taxa_falha=None,
+                 atraso_processamento=None, semente=None):
+        """
+        Inicializa o servidor.
+
+        Parâmetros:
+            porta (int): Porta local (default: 0, escolhida pelo sistema).
+            latencia (float): Latência média das respostas em segundos (default: FAKE_NFSE_LATENCIA).
+            variacao (float): Variação relativa da latência (default: FAKE_NFSE_VARIACAO).
+            taxa_erro (float): Fração dos lotes recusados (default: FAKE_NFSE_TAXA_ERRO).
+            taxa_falha (float): Fração das requisições com HTTP 503 (default: FAKE_NFSE_TAXA_FALHA).
+            atraso_processamento (float): Segundos até o lote constar como processado
+                (default: FAKE_NFSE_ATRASO).
+            semente (int): Semente do gerador aleatório, para execuções reproduzíveis.
+        """
+        self.latencia = FAKE_NFSE_LATENCIA if latencia is None else latencia
+        self.variacao = FAKE_NFSE_VARIACAO if variacao is None else variacao
+        self.taxa_erro = FAKE_NFSE_TAXA_ERRO if taxa_erro is None else taxa_erro
+        self.taxa_falha = FAKE_NFSE_TAXA_FALHA if taxa_falha is None else taxa_falha
+        self.atraso_processamento = FAKE_NFSE_ATRASO if atraso_processamento is None else atraso_processamento
+
+        self.envios = 0
+        self.consultas = 0
+        self.recusas = 0
+        self.falhas = 0
+
+        self._random = random.Random(semente)
+        self._protocolos = itertools.count(1)
+        self._lotes = {}
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', porta), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._httpd.server_address[:2]
+        return f"http://{host}:{porta}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-nfse', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _sortear(self, taxa):
+        with self._lock:
+            return self._random.random() < taxa
+
+    def _esperar(self):
+        with self._lock:
+            fator = 1 + self._random.uniform(-self.variacao, self.variacao)
+        time.sleep(max(self.latencia * fator, 0))
+
+    def recepcionar(self, corpo):
+        """
+        Retorna o conteúdo da resposta do RecepcionarLoteRps para o lote recebido.
+        """
+        numeros_rps = _NUMERO_RPS.findall(corpo)
+        if self._sortear(self.taxa_erro):
+            with self._lock:
+                self.recusas += 1
+            return ("<ListaMensagemRetorno><MensagemRetorno><Codigo>E999</Codigo>"
+                    "<Mensagem>Lote recusado pelo serviço de teste</Mensagem>"
+                    "<Correcao>Reenvie o lote</Correcao></MensagemRetorno></ListaMensagemRetorno>")
+
+        protocolo = str(next(self._protocolos))
+        with self._lock:
+            self.envios += 1
+            self._lotes[protocolo] = (time.monotonic(), numeros_rps)
+        return (f"<NumeroLote>{protocolo}</NumeroLote>"
+                f"<DataRecebimento>{time.strftime('%Y-%m-%dT%H:%M:%S')}</DataRecebimento>"
+                f"<Protocolo>{protocolo}</Protocolo>")
+
+    def consultar(self, corpo):
+        """
+        Retorna o conteúdo da resposta do ConsultarLoteRps para o protocolo consultado.
+        """
+        encontrado = _PROTOCOLO.search(corpo)
+        with self._lock:
+            self.consultas += 1
+            lote = self._lotes.get(encontrado.group(1)) if encontrado else None
+
+        if lote is None:
+            return ("<ListaMensagemRetorno><MensagemRetorno><Codigo>E86</Codigo>"
+                    "<Mensagem>Protocolo não encontrado</Mensagem></MensagemRetorno></ListaMensagemRetorno>")
+        recebido_em, numeros_rps = lote
+        if time.monotonic() - recebido_em < self.atraso_processamento:
+            return ""
+
+        nfses = "".join(
+            f"<CompNfse><Nfse><InfNfse><Numero>{numero}</Numero><CodigoVerificacao>FAKE{numero}</CodigoVerificacao>"
+            f"<IdentificacaoRps><Numero>{numero}</Numero><Serie>1</Serie><Tipo>1</Tipo></IdentificacaoRps>"
+            f"</InfNfse></Nfse></CompNfse>"
+            for numero in numeros_rps
+        )
+        return f"<ListaNfse>{nfses}</ListaNfse>"
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, codigo, corpo):
+                dados = corpo.encode('utf-8')
+                self.send_response(codigo)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def do_POST(self):
+                dados = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    dados = gzip.decompress(dados)
+                corpo = dados.decode('utf-8')
+                acao = self.headers.get('SOAPAction', '').strip('"')
+
+                servidor._esperar()
+                if servidor._sortear(servidor.taxa_falha):
+                    with servidor._lock:
+                        servidor.falhas += 1
+                    self._responder(503, "Serviço indisponível")
+                    return
+
+                if acao.endswith('RecepcionarLoteRps'):
+                    operacao, conteudo = 'RecepcionarLoteRps', servidor.recepcionar(corpo)
+                elif acao.endswith('ConsultarLoteRps'):
+                    operacao, conteudo = 'ConsultarLoteRps', servidor.consultar(corpo)
+                else:
+                    self._responder(400, f"SOAPAction não suportada: {acao}")
+                    return
+                self._responder(200, ENVELOPE.format(operacao=operacao, namespace=NAMESPACE, conteudo=conteudo))
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import sys
+    servidor = FakeNfseServer(porta=int(sys.argv[1]) if len(sys.argv) > 1 else 8085)
+    print(f"Serviço NFS-e de teste em {servidor.url} (latência {servidor.latencia}s, "
+          f"taxa de erro {servidor.taxa_erro}, taxa de falha {servidor.taxa_falha}, "
+          f"processamento {servidor.atraso_processamento}s)")
+    try:
+        servidor._httpd.serve_forever()
+    except KeyboardInterrupt:
+        servidor.stop()
@@ -1,4 +1,6 @@
 import re
+import numpy as np
+import pandas as pd
 
 """
 Módulo: data_validation.py
@@ -7,10 +9,23 @@ como CNPJs e valores monetários, utilizados em transações financeiras ou cada
 
 Funcionalidades:
 - Normalizar CNPJs removendo caracteres não numéricos.
-- Normalizar valores monetários, substituindo vírgulas por pontos e removendo espaços.
+- Normalizar valores monetários, removendo separadores de milhar e espaços e usando ponto como
+  separador decimal.
 - Validar e retornar os dados normalizados para uso em processamento posterior.
+- Versões vetorizadas das normalizações, aplicadas a colunas inteiras de um DataFrame.
+- Validação vetorizada das linhas de uma aba (dígitos verificadores de CNPJ/CPF, valores, CEP e
+  campos obrigatórios), com relatório de erros por linha antes do envio ao web service.
 """
 
+# Colunas (já normalizadas, ver app.normalize_column_names) que não podem ficar vazias
+CAMPOS_OBRIGATORIOS = ('cnpj', 'razao', 'logradouro', 'bairro', 'cep', 'valor', 'descricao')
+
+# Pesos dos dígitos verificadores
+_PESOS_CNPJ_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_PESOS_CNPJ_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_PESOS_CPF_1 = np.arange(10, 1, -1)
+_PESOS_CPF_2 = np.arange(11, 1, -1)
+
 
 def normalize_cnpj(cnpj):
     """
@@ -43,7 +58,11 @@ def normalize_valor(valor):
         >>> normalize_valor('1.234,56')
         '1234.56'
     """
-    return valor.replace(',', '.').replace(' ', '')  # Substitui vírgulas por pontos e remove espaços
+    valor = valor.replace(' ', '')
+    if ',' in valor:
+        # Formato brasileiro: pontos separam milhares e a vírgula separa os decimais
+        valor = valor.replace('.', '').replace(',', '.')
+    return valor
 
 
 def validate_and_normalize_data(cnpj, valor):
@@ -66,3 +85,243 @@ def validate_and_normalize_data(cnpj, valor):
     valor_normalizado = normalize_valor(valor)
     return cnpj_normalizado, valor_normalizado
 
+
+def _texto_celula(valor):
+    """
+    Converte o valor de uma célula em texto; números inteiros lidos como float (colunas com
+    células vazias) perdem o '.0'.
+    """
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _documento_celula(valor):
+    """
+    Dígitos do CPF/CNPJ de uma célula. Células numéricas perdem os zeros iniciais do documento e
+    são completadas até 11 (CPF) ou 14 dígitos (CNPJ, a partir de 12 dígitos); células de texto
+    ficam como foram digitadas, para que a validação aponte o documento incompleto.
+    """
+    digitos = normalize_cnpj(_texto_celula(valor))
+    if digitos and len(digitos) < 14 and isinstance(valor, (int, float, np.number)):
+        return digitos.zfill(11 if len(digitos) <= 11 else 14)
+    return digitos
+
+
+def normalize_cnpj_serie(serie):
+    """
+    Versão vetorizada de normalize_cnpj para uma coluna de CNPJs/CPFs.
+
+    Apenas os valores distintos são normalizados e o resultado é mapeado de volta para as linhas.
+    Células vazias viram texto vazio. Documentos de células numéricas com menos dígitos que um CPF
+    (11) ou um CNPJ (14) são completados com zeros à esquerda; os de texto não são alterados.
+
+    Parâmetros:
+        serie (pandas.Series): Coluna com os CNPJs/CPFs (texto ou número).
+
+    Retorna:
+        pandas.Series: Coluna apenas com os dígitos.
+
+    Exemplo:
+        >>> normalize_cnpj_serie(pd.Series(['12.345.678/0001-95', 1234567890, '123', None])).tolist()
+        ['12345678000195', '01234567890', '123', '']
+    """
+    unicos = serie.dropna().unique()
+    return serie.map({valor: _documento_celula(valor) for valor in unicos}).fillna('')
+
+
+def _digitos_serie(serie):
+    """
+    Apenas os dígitos de cada célula de uma coluna (células vazias viram texto vazio).
+    """
+    unicos = serie.dropna().unique()
+    return serie.map({valor: normalize_cnpj(_texto_celula(valor)) for valor in unicos}).fillna('')
+
+
+def normalize_valor_serie(serie):
+    """
+    Versão vetorizada de normalize_valor para uma coluna de valores monetários.
+
+    Os textos são normalizados (apenas os valores distintos); números e células vazias são
+    mantidos como estão.
+
+    Parâmetros:
+        serie (pandas.Series): Coluna com os valores (texto ou número).
+
+    Retorna:
+        pandas.Series: Coluna com os textos no formato decimal padrão.
+
+    Exemplo:
+        >>> normalize_valor_serie(pd.Series(['1.234,56', 100.5])).tolist()
+        ['1234.56', 100.5]
+    """
+    textos = serie.map(lambda valor: isinstance(valor, str))
+    if not textos.any():
+        return serie
+    unicos = serie[textos].unique()
+    normalizados = serie.copy()
+    normalizados[textos] = serie[textos].map({valor: normalize_valor(valor) for valor in unicos})
+    return normalizados
+
+
+def normalize_cep_serie(serie):
+    """
+    Normaliza uma coluna de CEPs: apenas os dígitos, completados com zeros à esquerda até 8 dígitos
+    (CEPs lidos como número perdem os zeros iniciais). Células vazias viram texto vazio.
+
+    Exemplo:
+        >>> normalize_cep_serie(pd.Series(['80020-310', 1310100, None])).tolist()
+        ['80020310', '01310100', '']
+    """
+    digitos = _digitos_serie(serie)
+    numericos = serie.map(lambda valor: isinstance(valor, (int, float, np.number)))
+    return digitos.where(~numericos | (digitos.str.len() == 0), digitos.str.zfill(8))
+
+
+def _matriz_digitos(digitos, tamanho):
+    """
+    Converte uma sequência de textos com exatamente `tamanho` dígitos em uma matriz de inteiros.
+    """
+    return (np.frombuffer(''.join(digitos).encode('ascii'), dtype=np.uint8)
+            .reshape(-1, tamanho).astype(np.int64) - ord('0'))
+
+
+def _digito_modulo_11(matriz, pesos):
+    resto = (matriz[:, :len(pesos)] * pesos).sum(axis=1) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+
+def validar_cnpj_serie(digitos):
+    """
+    Verifica os dígitos verificadores de uma coluna de CNPJs (apenas dígitos).
+
+    Parâmetros:
+        digitos (pandas.Series): CNPJs normalizados (ver normalize_cnpj_serie).
+
+    Retorna:
+        pandas.Series: True para os CNPJs válidos (14 dígitos, não repetidos, dígitos verificadores corretos).
+
+    Exemplo:
+        >>> validar_cnpj_serie(pd.Series(['12345678000195', '12345678000100'])).tolist()
+        [True, False]
+    """
+    validos = pd.Series(False, index=digitos.index)
+    candidatos = digitos[digitos.str.fullmatch(r'\d{14}').fillna(False)]
+    if candidatos.empty:
+        return validos
+    matriz = _matriz_digitos(candidatos, 14)
+    corretos = ((_digito_modulo_11(matriz, _PESOS_CNPJ_1) == matriz[:, 12])
+                & (_digito_modulo_11(matriz, _PESOS_CNPJ_2) == matriz[:, 13])
+                & (matriz != matriz[:, :1]).any(axis=1))
+    validos[candidatos.index] = corretos
+    return validos
+
+
+def validar_cpf_serie(digitos):
+    """
+    Verifica os dígitos verificadores de uma coluna de CPFs (apenas dígitos).
+
+    Parâmetros:
+        digitos (pandas.Series): CPFs normalizados (ver normalize_cnpj_serie).
+
+    Retorna:
+        pandas.Series: True para os CPFs válidos (11 dígitos, não repetidos, dígitos verificadores corretos).
+
+    Exemplo:
+        >>> validar_cpf_serie(pd.Series(['12345678909', '11111111111'])).tolist()
+        [True, False]
+    """
+    validos = pd.Series(False, index=digitos.index)
+    candidatos = digitos[digitos.str.fullmatch(r'\d{11}').fillna(False)]
+    if candidatos.empty:
+        return validos
+    matriz = _matriz_digitos(candidatos, 11)
+    dv1 = (matriz[:, :9] * _PESOS_CPF_1).sum(axis=1) * 10 % 11 % 10
+    dv2 = (matriz[:, :10] * _PESOS_CPF_2).sum(axis=1) * 10 % 11 % 10
+    corretos = (dv1 == matriz[:, 9]) & (dv2 == matriz[:, 10]) & (matriz != matriz[:, :1]).any(axis=1)
+    validos[candidatos.index] = corretos
+    return validos
+
+
+def validar_dataframe(df):
+    """
+    Valida todas as linhas de uma aba de uma vez.
+
+    Verificações:
+    - Campos obrigatórios (CAMPOS_OBRIGATORIOS) preenchidos.
+    - CNPJ (14 dígitos) ou CPF (11 dígitos) do tomador com dígitos verificadores corretos.
+    - Valor numérico e maior que zero.
+    - CEP com 8 dígitos.
+
+    Parâmetros:
+        df (pandas.DataFrame): Linhas da aba, com as colunas normalizadas.
+
+    Retorna:
+        pandas.Series: Erros de cada linha separados por '; ' (texto vazio para as linhas válidas).
+
+    Exemplo:
+        >>> df = pd.DataFrame({'cnpj': ['12.345.678/0001-95', '123'], 'valor': ['1.234,56', '0'], ...})
+        >>> validar_dataframe(df).tolist()
+        ['', 'CNPJ/CPF do tomador inválido; Valor inválido']
+    """
+    erros = []
+
+    for campo in CAMPOS_OBRIGATORIOS:
+        if campo not in df.columns:
+            erros.append(pd.Series(f"Coluna obrigatória ausente: {campo}", index=df.index))
+            continue
+        coluna = df[campo]
+        vazios = coluna.isna() | coluna.map({valor: str(valor).strip() == '' for valor in coluna.dropna().unique()})
+        erros.append(pd.Series(np.where(vazios, f"Campo obrigatório vazio: {campo}", ''), index=df.index))
+
+    if 'cnpj' in df.columns:
+        # Os dígitos verificadores são conferidos apenas nos documentos distintos
+        digitos = normalize_cnpj_serie(df['cnpj'])
+        unicos = pd.Series(digitos.unique(), dtype=object)
+        validos = validar_cnpj_serie(unicos) | validar_cpf_serie(unicos)
+        invalidos = ~digitos.map(dict(zip(unicos, validos))) & (digitos != '')
+        erros.append(pd.Series(np.where(invalidos, "CNPJ/CPF do tomador inválido", ''), index=df.index))
+
+    if 'valor' in df.columns:
+        valores = pd.to_numeric(normalize_valor_serie(df['valor']), errors='coerce')
+        invalidos = (valores.isna() | ~np.isfinite(valores) | (valores <= 0)) & df['valor'].notna()
+        erros.append(pd.Series(np.where(invalidos, "Valor inválido", ''), index=df.index))
+
+    if 'cep' in df.columns:
+        ceps = normalize_cep_serie(df['cep'])
+        invalidos = (ceps.str.len() != 8) & (ceps != '')
+        erros.append(pd.Series(np.where(invalidos, "CEP inválido", ''), index=df.index))
+
+    resultado = pd.Series('', index=df.index)
+    for erro in erros:
+        separador = np.where((resultado != '') & (erro != ''), '; ', '')
+        resultado = resultado + separador + erro
+    return resultado
+
+
+def relatorio_validacao(dfs):
+    """
+    Valida todas as abas e retorna o relatório das linhas com erro, antes de qualquer envio.
+
+    Parâmetros:
+        dfs (dict): DataFrames por aba, com as colunas normalizadas.
+
+    Retorna:
+        list: Dicionários com 'aba', 'linha' (linha na planilha, contando o cabeçalho), 'rps'
+            (número do RPS atribuído no envio: o da primeira linha da aba, seguido em sequência,
+            ver rps_preparacao.primeiro_rps) e 'erros' de cada linha inválida.
+    """
+    # Importação local: rps_preparacao importa as normalizações deste módulo
+    from rps_preparacao import primeiro_rps
+
+    relatorio = []
+    for sheet_name, df in dfs.items():
+        if df.empty:
+            continue
+        erros = validar_dataframe(df).to_numpy()
+        posicoes = np.flatnonzero(erros != '')
+        rps_inicial = primeiro_rps(df)
+        relatorio.extend({'aba': sheet_name, 'linha': int(posicao) + 2, 'rps': rps_inicial + int(posicao),
+                          'erros': erros[posicao]}
+                         for posicao in posicoes)
+    return relatorio
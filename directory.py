@@ -1,8 +1,10 @@
 import os
 import pandas as pd
 import datetime
-import requests
-import html
+from transport import post_soap
+from endpoints import obter_endpoint, OPERACAO_ENVIO
+from xml_serializer import escapar_texto, formatar_decimal, CASAS_ALIQUOTA
+from rps_template import render_lote
 from dotenv import load_dotenv  # Para carregar variáveis de ambiente
 
 # Carrega variáveis de ambiente do arquivo .env
@@ -19,11 +21,13 @@ Funcionalidades:
 
 Dependências:
 - Pandas
-- Requests
+- transport (sessão HTTP compartilhada)
+- endpoints (endereço do web service)
 - Variáveis de Ambiente (dotenv)
 """
 
-SOAP_URL = 'https://isscuritiba.curitiba.pr.gov.br/Iss.NfseWebService/nfsews.asmx'
+# Quantidade máxima de RPS aceita pelo web service em um único LoteRps
+LIMITE_RPS_POR_LOTE = 50
 
 dados = {
     "categoria_1": [os.getenv('CNPJ_CATEGORIA_1'), os.getenv('IM_CATEGORIA_1')],
@@ -94,7 +98,11 @@ class SoapRequestGenerator:
         numero_lote = self.numero_lote_dinamico(valor_rps)
         self.rps_counter += 1
 
-        tomador_razao_social = html.escape(kwargs.get('tomador_razao_social', ''))
+        tomador_razao_social = escapar_texto(kwargs.get('tomador_razao_social', ''))
+        descricao = escapar_texto(descricao)
+        valor_liquido_nfse = formatar_decimal(valor_liquido_nfse)
+        base_calculo = formatar_decimal(kwargs.get('base_calculo', valor_liquido_nfse))
+        aliquota = formatar_decimal(aliquota, CASAS_ALIQUOTA)
 
         tomador_cpf_cnpj = kwargs.get('tomador_cnpj', '').replace('.', '').replace('-', '').replace('/', '')
         if len(tomador_cpf_cnpj) == 11:
@@ -136,7 +144,7 @@ class SoapRequestGenerator:
                     <ValorIss>0</ValorIss>
                     <ValorIssRetido>0</ValorIssRetido>
                     <OutrasRetencoes>0</OutrasRetencoes>
-                    <BaseCalculo>{kwargs.get('base_calculo', valor_liquido_nfse)}</BaseCalculo>
+                    <BaseCalculo>{base_calculo}</BaseCalculo>
                     <Aliquota>{aliquota}</Aliquota>
                     <ValorLiquidoNfse>{valor_liquido_nfse}</ValorLiquidoNfse>
                     <DescontoIncondicionado>0</DescontoIncondicionado>
@@ -160,12 +168,12 @@ class SoapRequestGenerator:
                   </IdentificacaoTomador>
                   <RazaoSocial>{tomador_razao_social}</RazaoSocial>
                   <Endereco>
-                    <Endereco>{kwargs.get('tomador_endereco', '')}</Endereco>
-                    <Numero>{kwargs.get('tomador_numero', '')}</Numero>
-                    <Bairro>{kwargs.get('tomador_bairro', '')}</Bairro>
+                    <Endereco>{escapar_texto(kwargs.get('tomador_endereco', ''))}</Endereco>
+                    <Numero>{escapar_texto(kwargs.get('tomador_numero', ''))}</Numero>
+                    <Bairro>{escapar_texto(kwargs.get('tomador_bairro', ''))}</Bairro>
                     <CodigoMunicipio>{kwargs.get('tomador_codigo_municipio', '')}</CodigoMunicipio>
-                    <Uf>{kwargs.get('tomador_uf', '')}</Uf>
-                    <Cep>{kwargs.get('tomador_cep', '')}</Cep>
+                    <Uf>{escapar_texto(kwargs.get('tomador_uf', ''))}</Uf>
+                    <Cep>{escapar_texto(kwargs.get('tomador_cep', ''))}</Cep>
                   </Endereco>
                   <Contato>
                     <Email>financeiro@scryta.com.br</Email>
@@ -181,6 +189,25 @@ class SoapRequestGenerator:
 </soap:Envelope>"""
 
 
+def create_lote_request(numero_lote, cnpj, inscricao_municipal, lista_inf_rps):
+    """
+    Monta o envelope SOAP de um LoteRps contendo um ou mais RPS.
+
+    Parâmetros:
+        numero_lote (int): Número do lote.
+        cnpj (str): CNPJ do prestador.
+        inscricao_municipal (str): Inscrição municipal do prestador.
+        lista_inf_rps (list): Conteúdo do elemento InfRps de cada RPS do lote.
+
+    Retorna:
+        str: Envelope SOAP do lote com QuantidadeRps igual ao número de RPS informados.
+    """
+    if len(lista_inf_rps) > LIMITE_RPS_POR_LOTE:
+        raise ValueError(f"O lote excede o limite de {LIMITE_RPS_POR_LOTE} RPS por envio.")
+
+    return render_lote(numero_lote, cnpj, inscricao_municipal, lista_inf_rps)
+
+
 def read_data_from_excel(file_path):
     """
     Lê dados de um arquivo Excel e retorna um dicionário com as abas.
@@ -197,131 +224,48 @@ def read_data_from_excel(file_path):
     return dfs
 
 
-def send_soap_request(soap_request):
+def send_soap_request(soap_request, timeout=None, stream=False, prestador=None):
     """
     Envia uma requisição SOAP para o servidor especificado.
 
     Parâmetros:
         soap_request (str): Corpo da requisição SOAP em XML.
+        timeout (float): Timeout da requisição em segundos (default: transport.DEFAULT_TIMEOUT).
+        stream (bool): Retorna antes de ler o corpo, para análise com soap_response.ler_resposta.
+        prestador (str): CNPJ do prestador, para o controle de fluxo por prestador (opcional).
 
     Retorna:
         requests.Response: Resposta do servidor.
     """
-    headers = {
-        'Content-Type': 'text/xml; charset=utf-8',
-        'SOAPAction': 'https://www.e-governeapps2.com.br/RecepcionarLoteRps'
-    }
-    response = requests.post(SOAP_URL, data=soap_request, headers=headers)
+    endpoint = obter_endpoint(OPERACAO_ENVIO)
+    response = post_soap(endpoint.url, soap_request, endpoint.soap_action, timeout=timeout, stream=stream,
+                         prestador=prestador)
     return response
 
 
 def main(excel_file_path, output_dir):
-    dfs = read_data_from_excel(excel_file_path)
-
-    for sheet_name, df in dfs.items():
-        print(f"Processando aba: {sheet_name}")
-        print(f"Abas encontradas: {list(dfs.keys())}")
-
-        for sheet_name, df in dfs.items():
-            print(f"Processando aba: {sheet_name}")
-            print(f"Abas encontradas: {list(dfs.keys())}")
-
-            if sheet_name in dados:
-                cnpj_prestador, inscricao_municipal_prestador = dados[sheet_name]
-                item_lista_servico = lista[sheet_name][0]
-
-                if sheet_name == "simply":
-                    aliquota = 0.0253
-                elif sheet_name == "dm":
-                    aliquota = 0.0414
-                else:
-                    aliquota = 0.05
-
-                codigo_cnae = 8219999 if sheet_name == "consultoria" else 0
-            else:
-                print(f"Nome da aba '{sheet_name}' não encontrado no dicionário de dados.")
-                continue
-
-        print(f"Colunas disponíveis na aba '{sheet_name}': {list(df.columns)}")
-
-        soap_request_gen = SoapRequestGenerator()
-        rpss = []
-
-        for index, row in df.iterrows():
-            valor_rps = row.get('rps', '')
-            kwargs = {
-                'cnpj': cnpj_prestador,
-                'inscricao_municipal': inscricao_municipal_prestador,
-                'valor_rps': valor_rps,
-                'prestador_cnpj': cnpj_prestador,
-                'prestador_inscricao': inscricao_municipal_prestador,
-                'tomador_cnpj': row.get('cnpj', ''),
-                'tomador_razao_social': row.get('razao', ''),
-                'tomador_endereco': row.get('logradouro', ''),
-                'tomador_numero': row.get('numero', ''),
-                'tomador_bairro': row.get('bairro', ''),
-                'tomador_codigo_municipio': row.get('municipio', ''),
-                'tomador_uf': row.get('uf', ''),
-                'tomador_cep': row.get('cep', ''),
-                'valor_liquido_nfse': row.get('valor', ''),
-                'descricao': row.get('descricao', ''),
-            }
-
-            soap_request = soap_request_gen.create_soap_request(
-                valor_liquido_nfse=row.get('valor', ''),
-                descricao=row.get('descricao', ''),
-                valor_rps=valor_rps,
-                item_lista_servico=item_lista_servico,
-                aliquota=aliquota,
-                codigo_cnae=codigo_cnae,
-                **kwargs
-            )
-            rpss.append(soap_request)
-
-        if rpss:
-            soap_request_lote = f"""<?xml version="1.0" encoding="utf-8"?> <soap:Envelope 
-            xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-            xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"> <soap:Body> <RecepcionarLoteRps 
-            xmlns="https://www.e-governeapps2.com.br/"> <EnviarLoteRpsEnvio> <LoteRps> <NumeroLote>
-{soap_request_gen.numero_lote_dinamico(valor_rps)}</NumeroLote>
-          <Cnpj>{cnpj_prestador}</Cnpj>
-          <InscricaoMunicipal>{inscricao_municipal_prestador}</InscricaoMunicipal>
-          <QuantidadeRps>{len(rpss)}</QuantidadeRps>
-          <ListaRps>"""
-
-            for rps in rpss:
-                soap_request_lote += f"""
-            <Rps>
-              <InfRps>
-                {rps.split('<InfRps>')[1].split('</InfRps>')[0]}
-              </InfRps>
-            </Rps>"""
+    """
+    Processa uma planilha (ou um diretório de planilhas) sem o servidor web.
 
-            soap_request_lote += f"""
-          </ListaRps>
-        </LoteRps>
-      </EnviarLoteRpsEnvio>
-    </RecepcionarLoteRps>
-  </soap:Body>
-</soap:Envelope>"""
+    Mantida como ponto de entrada da execução direta; usa a execução em lote (batch.py), com as
+    mesmas etapas do app: municípios, validação, lotes, consulta dos protocolos e registro de RPS.
+    O resultado de cada planilha é gravado em output_dir.
 
-            output_file_path = os.path.join(output_dir, f"{sheet_name}_lote_request.xml")
-            with open(output_file_path, 'w', encoding='utf-8') as file:
-                file.write(soap_request_lote)
+    Parâmetros:
+        excel_file_path (str): Planilha .xlsx ou diretório com planilhas.
+        output_dir (str): Diretório dos resultados.
 
-            response = send_soap_request(soap_request_lote)
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text[:500]}")
+    Retorna:
+        list: Resumos das planilhas (ver batch.processar_arquivo).
+    """
+    from batch import executar
+    return executar(excel_file_path, output_dir)
 
 
 if __name__ == "__main__":
     """
-    Esta seção era utilizada quando o sistema não possuía um frontend.
-    Nesse formato, o código acessava diretamente os arquivos nos caminhos especificados no arquivo .env,
-    permitindo o processamento manual de um arquivo Excel e a geração dos resultados na pasta de saída.
-
-    Com a implementação de um frontend, o envio dos arquivos e a seleção dos caminhos passaram a ser feitos
-    por meio da interface web, tornando essa abordagem opcional para execução direta.
+    Execução direta, sem o frontend: processa a planilha (ou o diretório) de BASE_EXCEL_PATH e
+    grava os resultados em OUTPUT_DIR. Para mais opções (processos, formato), use batch.py.
     """
     # Carrega os caminhos do arquivo .env
     excel_file_path = os.getenv('BASE_EXCEL_PATH')
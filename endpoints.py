@@ -0,0 +1,212 @@
+import os
+import json
+import threading
+from urllib.parse import urlsplit
+
+"""
+Módulo: endpoints.py
+Descrição: Registro dos endereços do web service de NFS-e por ambiente, município e operação.
+
+Os endereços (URL e SOAPAction) de cada operação deixam de ser constantes espalhadas pelos módulos
+de envio e de consulta: são obtidos deste registro, que combina os endereços conhecidos com um
+arquivo de configuração opcional. Assim, o mesmo código pode ser apontado para um serviço local de
+teste, para o ambiente de homologação ou para produção apenas por configuração.
+
+Formato do arquivo de configuração (JSON), combinado com ENDPOINTS_PADRAO:
+    {
+        "homologacao": {
+            "curitiba": {
+                "url": "https://...",
+                "namespace": "https://www.e-governeapps2.com.br/",
+                "operacoes": {"ConsultarLoteRps": {"url": "https://...", "soap_action": "..."}}
+            }
+        }
+    }
+A URL e o namespace do município valem para todas as operações; cada operação pode substituí-los.
+A SOAPAction padrão é namespace + nome da operação.
+
+Configuração (variáveis de ambiente):
+- NFSE_AMBIENTE: Ambiente usado por padrão (default: producao).
+- NFSE_MUNICIPIO: Município usado por padrão (default: curitiba).
+- NFSE_ENDPOINTS: Caminho do arquivo JSON com endereços adicionais (opcional).
+- NFSE_URL: URL usada em todas as operações, ignorando o registro (opcional; por exemplo, o
+  serviço local de benchmarks/fake_nfse.py).
+
+Dependências:
+- json
+"""
+
+NFSE_AMBIENTE = os.getenv('NFSE_AMBIENTE', 'producao').lower()
+NFSE_MUNICIPIO = os.getenv('NFSE_MUNICIPIO', 'curitiba').lower()
+NFSE_ENDPOINTS = os.getenv('NFSE_ENDPOINTS')
+NFSE_URL = os.getenv('NFSE_URL')
+
+OPERACAO_ENVIO = 'RecepcionarLoteRps'
+OPERACAO_CONSULTA = 'ConsultarLoteRps'
+
+ENDPOINTS_PADRAO = {
+    'producao': {
+        'curitiba': {
+            'url': 'https://isscuritiba.curitiba.pr.gov.br/Iss.NfseWebService/nfsews.asmx',
+            'namespace': 'https://www.e-governeapps2.com.br/',
+        },
+    },
+}
+
+
+class Endpoint:
+    """
+    Endereço de uma operação do web service.
+
+    Atributos:
+    - ambiente / municipio / operacao: Identificação do endereço no registro.
+    - url: Endereço HTTP do serviço.
+    - soap_action: Valor do cabeçalho SOAPAction.
+    - chave: Esquema e host da URL, usados para separar os pools de conexões.
+    """
+    __slots__ = ('ambiente', 'municipio', 'operacao', 'url', 'soap_action')
+
+    def __init__(self, ambiente, municipio, operacao, url, soap_action):
+        self.ambiente = ambiente
+        self.municipio = municipio
+        self.operacao = operacao
+        self.url = url
+        self.soap_action = soap_action
+
+    @property
+    def chave(self):
+        return chave_endpoint(self.url)
+
+    def __repr__(self):
+        return f"Endpoint({self.ambiente}/{self.municipio}/{self.operacao}: {self.url})"
+
+
+def chave_endpoint(url):
+    """
+    Retorna o esquema e o host de uma URL (por exemplo, 'https://isscuritiba.curitiba.pr.gov.br').
+    """
+    partes = urlsplit(url)
+    return f"{partes.scheme}://{partes.netloc}".lower()
+
+
+def _combinar(base, extra):
+    resultado = dict(base)
+    for chave, valor in extra.items():
+        if isinstance(valor, dict) and isinstance(resultado.get(chave), dict):
+            resultado[chave] = _combinar(resultado[chave], valor)
+        else:
+            resultado[chave] = valor
+    return resultado
+
+
+class EndpointRegistry:
+    """
+    Registro de endereços por ambiente, município e operação.
+
+    Métodos:
+    - obter: Endereço de uma operação.
+    - ambientes: Ambientes e municípios configurados.
+    """
+    def __init__(self, config=None, ambiente=None, municipio=None, url=None):
+        """
+        Inicializa o registro.
+
+        Parâmetros:
+            config (dict): Endereços adicionais, no formato do arquivo de configuração, combinados
+                com ENDPOINTS_PADRAO.
+            ambiente (str): Ambiente padrão (default: NFSE_AMBIENTE).
+            municipio (str): Município padrão (default: NFSE_MUNICIPIO).
+            url (str): URL usada em todas as operações (default: NFSE_URL).
+        """
+        self.config = _combinar(ENDPOINTS_PADRAO, config or {})
+        self.ambiente = (ambiente or NFSE_AMBIENTE).lower()
+        self.municipio = (municipio or NFSE_MUNICIPIO).lower()
+        self.url = url if url is not None else NFSE_URL
+        self._cache = {}
+
+    @classmethod
+    def carregar(cls, caminho=None, **kwargs):
+        """
+        Cria o registro a partir do arquivo de configuração (default: NFSE_ENDPOINTS, se definido).
+        """
+        caminho = caminho or NFSE_ENDPOINTS
+        config = None
+        if caminho:
+            with open(caminho, encoding='utf-8') as arquivo:
+                config = json.load(arquivo)
+        return cls(config, **kwargs)
+
+    def ambientes(self):
+        return {ambiente: sorted(municipios) for ambiente, municipios in self.config.items()}
+
+    def obter(self, operacao, municipio=None, ambiente=None):
+        """
+        Retorna o endereço de uma operação.
+
+        Parâmetros:
+            operacao (str): Nome da operação (OPERACAO_ENVIO, OPERACAO_CONSULTA).
+            municipio (str): Município (default: o do registro).
+            ambiente (str): Ambiente (default: o do registro).
+
+        Retorna:
+            Endpoint: URL e SOAPAction da operação.
+
+        Exceções:
+            ValueError: Ambiente ou município não configurado.
+        """
+        ambiente = (ambiente or self.ambiente).lower()
+        municipio = (municipio or self.municipio).lower()
+        chave = (ambiente, municipio, operacao)
+        endpoint = self._cache.get(chave)
+        if endpoint is not None:
+            return endpoint
+
+        municipios = self.config.get(ambiente)
+        if municipios is None:
+            raise ValueError(f"Ambiente de NFS-e não configurado: {ambiente}")
+        servico = municipios.get(municipio)
+        if servico is None:
+            raise ValueError(f"Município não configurado no ambiente {ambiente}: {municipio}")
+
+        config_operacao = servico.get('operacoes', {}).get(operacao, {})
+        namespace = config_operacao.get('namespace', servico.get('namespace', ''))
+        url = self.url or config_operacao.get('url') or servico.get('url')
+        if not url:
+            raise ValueError(f"URL não configurada para {operacao} em {ambiente}/{municipio}")
+
+        endpoint = Endpoint(ambiente, municipio, operacao, url,
+                            config_operacao.get('soap_action', f"{namespace}{operacao}"))
+        self._cache[chave] = endpoint
+        return endpoint
+
+
+_registry = None
+_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Retorna o registro de endereços do processo, carregando a configuração na primeira chamada.
+    """
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = EndpointRegistry.carregar()
+    return _registry
+
+
+def reset_registry(registry=None):
+    """
+    Substitui o registro do processo (default: recarregado da configuração na próxima chamada).
+    """
+    global _registry
+    with _lock:
+        _registry = registry
+
+
+def obter_endpoint(operacao, municipio=None, ambiente=None):
+    """
+    Retorna o endereço de uma operação no registro do processo (ver EndpointRegistry.obter).
+    """
+    return get_registry().obter(operacao, municipio, ambiente)
@@ -0,0 +1,171 @@
+import csv
+import io
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from rps_preparacao import primeiro_rps
+
+"""
+Módulo: exportacao.py
+Descrição: Exportação das planilhas processadas com o resultado do envio de cada RPS.
+
+Os resultados (protocolo, status de verificação, NFS-e e código de verificação) são associados às
+linhas das abas por um merge do pandas na chave (aba, número do RPS), e não pela posição da linha
+de status: abas ignoradas no envio (sem prestador configurado) ou vazias ficam sem resultado, sem
+deslocar os resultados das abas seguintes. O número do RPS de cada linha é o mesmo atribuído no
+envio: o da primeira linha da aba, seguido em sequência (ver rps_preparacao.primeiro_rps).
+
+Formatos:
+- xlsx: uma aba por aba da planilha, gravada com o modo somente escrita do openpyxl (as linhas são
+  escritas em sequência, sem montar as células em memória).
+- csv: todas as abas em um único arquivo, com a coluna 'aba'.
+- parquet: como o csv; requer pyarrow ou fastparquet.
+
+Dependências:
+- pandas
+- openpyxl
+- pyarrow ou fastparquet (opcional, apenas para parquet)
+"""
+
+COLUNAS_RESULTADO = ['Protocolo', 'Status Verificação', 'NFS-e', 'Código Verificação']
+
+COLUNAS_EXPORTACAO = [
+    'vazio', 'rps', 'vazio.1', 'cnpj', 'razao', 'logradouro',
+    'numero', 'cep', 'bairro', 'valor', 'descricao', 'obs',
+    'uf', 'municipio', *COLUNAS_RESULTADO
+]
+
+FORMATOS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def resultados_dataframe(linhas):
+    """
+    Converte as linhas de status de um job em um DataFrame indexado por (aba, número do RPS).
+
+    Parâmetros:
+        linhas (list): Resultados (status_store.ResultadoRps).
+
+    Retorna:
+        pandas.DataFrame: Colunas COLUNAS_RESULTADO, com índice ('aba', 'rps').
+    """
+    registros = [(linha.aba, linha.rps, linha.protocolo, linha.status, linha.nfse, linha.codigo_verificacao)
+                 for linha in linhas]
+    resultados = pd.DataFrame(registros, columns=['aba', 'rps', *COLUNAS_RESULTADO])
+    resultados['rps'] = pd.to_numeric(resultados['rps'], errors='coerce').astype('Int64')
+    return resultados.drop_duplicates(['aba', 'rps'], keep='last').set_index(['aba', 'rps'])
+
+
+def juntar_resultados(planilhas, linhas):
+    """
+    Acrescenta às abas as colunas de resultado do envio, associadas por (aba, número do RPS).
+
+    Parâmetros:
+        planilhas (dict): DataFrames por aba, como enviados.
+        linhas (list): Resultados (ResultadoRps) do job.
+
+    Retorna:
+        dict: DataFrames por aba, com as colunas de COLUNAS_EXPORTACAO.
+    """
+    resultados = resultados_dataframe(linhas)
+    abas_com_resultado = set(resultados.index.get_level_values('aba'))
+
+    exportadas = {}
+    for sheet_name, df in planilhas.items():
+        df = df.reset_index(drop=True)
+        if sheet_name in abas_com_resultado and not df.empty:
+            numeros_rps = pd.Series(primeiro_rps(df) + np.arange(len(df)), dtype='Int64')
+            chave = pd.MultiIndex.from_arrays([[sheet_name] * len(df), numeros_rps], names=['aba', 'rps'])
+            df = pd.concat([df, resultados.reindex(chave).reset_index(drop=True)], axis=1)
+        exportadas[sheet_name] = df.reindex(columns=COLUNAS_EXPORTACAO)
+    return exportadas
+
+
+def _celulas(df):
+    """
+    Linhas de um DataFrame como listas de valores Python, com células vazias como None.
+    """
+    valores = df.astype(object).where(df.notna(), None)
+    return valores.itertuples(index=False, name=None)
+
+
+def escrever_xlsx(planilhas, destino):
+    """
+    Grava as abas em um arquivo xlsx com o modo somente escrita do openpyxl.
+
+    Parâmetros:
+        planilhas (dict): DataFrames por aba.
+        destino (str | file): Caminho ou arquivo binário de destino.
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in planilhas.items():
+        planilha = workbook.create_sheet(title=sheet_name)
+        planilha.append(list(df.columns))
+        for linha in _celulas(df):
+            planilha.append(linha)
+    workbook.save(destino)
+
+
+def _concatenar(planilhas):
+    return pd.concat([df.assign(aba=sheet_name)[['aba', *df.columns]] for sheet_name, df in planilhas.items()],
+                     ignore_index=True)
+
+
+def escrever_csv(planilhas, destino):
+    """
+    Grava todas as abas em um único CSV (UTF-8 com BOM, para abrir corretamente no Excel), com a
+    coluna 'aba' na frente.
+    """
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    writer = csv.writer(texto)
+    writer.writerow(['aba', *COLUNAS_EXPORTACAO])
+    for sheet_name, df in planilhas.items():
+        writer.writerows([sheet_name, *linha] for linha in _celulas(df))
+    texto.flush()
+    texto.detach()
+
+
+def escrever_parquet(planilhas, destino):
+    """
+    Grava todas as abas em um único arquivo Parquet, com a coluna 'aba'.
+
+    Exceções:
+        ImportError: Nem pyarrow nem fastparquet estão instalados.
+    """
+    df = _concatenar(planilhas)
+    # Colunas com tipos misturados (texto e número) são gravadas como texto
+    for coluna in df.columns[df.dtypes == object]:
+        df[coluna] = df[coluna].map(lambda valor: None if valor is None or valor != valor else str(valor))
+    df.to_parquet(destino, index=False)
+
+
+def exportar(planilhas, linhas, formato='xlsx'):
+    """
+    Gera o arquivo de exportação de um job.
+
+    Parâmetros:
+        planilhas (dict): DataFrames por aba, como enviados.
+        linhas (list): Resultados (ResultadoRps) do job.
+        formato (str): 'xlsx', 'csv' ou 'parquet'.
+
+    Retorna:
+        BytesIO: Conteúdo do arquivo, posicionado no início.
+
+    Exceções:
+        ValueError: Formato não suportado.
+        ImportError: Formato parquet sem pyarrow/fastparquet instalado.
+
+    Exemplo:
+        >>> saida = exportar(planilhas, status_store.linhas(job_id), 'csv')
+    """
+    escritores = {'xlsx': escrever_xlsx, 'csv': escrever_csv, 'parquet': escrever_parquet}
+    if formato not in escritores:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+
+    output = io.BytesIO()
+    escritores[formato](juntar_resultados(planilhas, linhas), output)
+    output.seek(0)
+    return output
@@ -1,5 +1,7 @@
 import os
 import pandas as pd
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
 
 """
 Módulo: file_handler.py
@@ -9,12 +11,16 @@ como salvar uploads e ler arquivos Excel (.xlsx).
 Funcionalidades:
 - Salvar arquivos enviados via upload em um diretório especificado.
 - Ler arquivos Excel e retornar os dados em formato de DataFrame do Pandas.
+- Ler arquivos Excel grandes em blocos de linhas (modo somente leitura), sem carregar o arquivo inteiro.
 
 Dependências:
 - os
 - pandas
+- openpyxl
 """
 
+XLSX_CHUNK_LINHAS = int(os.getenv('XLSX_CHUNK_LINHAS', '1000'))
+
 
 def save_uploaded_file(file, upload_folder, filename):
     """
@@ -55,3 +61,56 @@ def read_xlsx(file_path):
             1   Maria      30
         """
     return pd.read_excel(file_path)
+
+
+def _bloco_para_dataframe(cabecalho, bloco):
+    """
+    Converte um bloco de linhas em DataFrame com o mesmo parser usado pelo pd.read_excel, de modo
+    que nomes de colunas (repetidas ou vazias) e tipos inferidos sejam os mesmos da leitura completa.
+    """
+    return TextParser([cabecalho] + bloco, header=0).read()
+
+
+def iter_xlsx_chunks(file_path, chunk_size=None):
+    """
+    Lê um arquivo Excel (.xlsx) aba por aba, em blocos de linhas, usando o modo somente leitura
+    do openpyxl. O uso de memória é proporcional ao tamanho do bloco, e não ao do arquivo.
+
+    Parâmetros:
+        file_path (str): Caminho completo do arquivo Excel a ser lido.
+        chunk_size (int): Quantidade de linhas por bloco (default: XLSX_CHUNK_LINHAS).
+
+    Retorna:
+        generator: Pares (nome da aba, DataFrame) com no máximo chunk_size linhas cada; os blocos
+        de uma aba são produzidos em sequência. Linhas totalmente vazias são ignoradas (a leitura
+        completa as descarta da mesma forma, em pipeline.enriquecer_planilhas).
+
+    Exemplo:
+        >>> for aba, bloco in iter_xlsx_chunks('uploads/documento.xlsx', chunk_size=500):
+        ...     print(aba, len(bloco))
+        categoria_1 500
+        categoria_1 132
+    """
+    chunk_size = max(1, chunk_size or XLSX_CHUNK_LINHAS)
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            linhas = worksheet.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is None:
+                continue
+            cabecalho = list(cabecalho)
+
+            largura = len(cabecalho)
+            bloco = []
+            for linha in linhas:
+                if all(valor is None for valor in linha):
+                    continue
+                bloco.append(list(linha[:largura]) + [None] * (largura - len(linha)))
+                if len(bloco) >= chunk_size:
+                    yield worksheet.title, _bloco_para_dataframe(cabecalho, bloco)
+                    bloco = []
+            if bloco:
+                yield worksheet.title, _bloco_para_dataframe(cabecalho, bloco)
+    finally:
+        workbook.close()
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Módulo: jobs.py
+Descrição: Execução dos uploads em segundo plano.
+
+Cada upload gera um job com identificador próprio, executado por um pool de workers. A rota de
+upload retorna imediatamente e o progresso do job (linhas enviadas e concluídas, vazão e
+estimativa de término) pode ser acompanhado pela rota /jobs/<id>.
+
+Funcionalidades:
+- Modelo de job com contadores de progresso seguros para uso entre threads.
+- Pool de workers para execução dos jobs.
+- Retenção limitada dos jobs finalizados em memória; as abas da planilha (Job.planilhas) são
+  liberadas quando o job termina, e a exportação as obtém do cache de uploads (upload_cache.py).
+
+Configuração (variáveis de ambiente):
+- JOB_WORKERS: Número de uploads processados simultaneamente (default: 2).
+- JOB_RETENCAO: Quantidade de jobs mantidos em memória (default: 50).
+
+Dependências:
+- concurrent.futures
+"""
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_RETENCAO = int(os.getenv('JOB_RETENCAO', '50'))
+
+
+class Job:
+    """
+    Representa o processamento de um arquivo enviado pelo usuário.
+
+    Métodos:
+    - iniciar: Marca o início da execução.
+    - adicionar_total: Soma linhas ao total a processar, à medida que a planilha é lida.
+    - registrar_envio: Contabiliza linhas enviadas ao web service.
+    - registrar_conclusao: Contabiliza linhas com status definitivo.
+    - finalizar / falhar: Encerram a etapa de envio do job.
+    - to_dict: Resumo do progresso para a API.
+    """
+    def __init__(self, filename, file_path, job_id=None):
+        """
+        Inicializa o job.
+
+        Parâmetros:
+            filename (str): Nome original do arquivo enviado.
+            file_path (str): Caminho do arquivo salvo no servidor.
+            job_id (str): Identificador do job (default: gerado automaticamente).
+        """
+        self.id = job_id or uuid.uuid4().hex
+        self.filename = filename
+        self.file_path = file_path
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.finalizado_em = None
+        self.erro = None
+        self.planilhas = None
+        self.total = 0
+        self.enviados = 0
+        self.concluidos = 0
+        self._envio_finalizado = False
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            self.iniciado_em = time.time()
+
+    def adicionar_total(self, quantidade):
+        with self._lock:
+            self.total += quantidade
+
+    def registrar_envio(self, quantidade, concluidos=0):
+        """
+        Contabiliza linhas enviadas; as que já falharam no envio contam como concluídas.
+        """
+        with self._lock:
+            self.enviados += quantidade
+            self.concluidos += concluidos
+            self._verificar_fim()
+
+    def registrar_conclusao(self, quantidade):
+        with self._lock:
+            self.concluidos += quantidade
+            self._verificar_fim()
+
+    def finalizar(self):
+        with self._lock:
+            self._envio_finalizado = True
+            self._verificar_fim()
+
+    def falhar(self, erro):
+        with self._lock:
+            self.erro = str(erro)
+            self._envio_finalizado = True
+            self.finalizado_em = time.time()
+            self.planilhas = None
+
+    def _verificar_fim(self):
+        if self._envio_finalizado and self.finalizado_em is None and self.concluidos >= self.total:
+            self.finalizado_em = time.time()
+            # Os jobs finalizados ficam retidos (JOB_RETENCAO) apenas pelo progresso; as abas não
+            # são mantidas em memória com eles
+            self.planilhas = None
+
+    @property
+    def estado(self):
+        if self.erro is not None:
+            return 'erro'
+        if self.finalizado_em is not None:
+            return 'concluido'
+        if self.iniciado_em is not None:
+            return 'processando'
+        return 'na_fila'
+
+    def to_dict(self):
+        """
+        Retorna o progresso do job: linhas enviadas/concluídas, vazão (linhas/s) e ETA (s).
+        """
+        with self._lock:
+            fim = self.finalizado_em or time.time()
+            decorrido = fim - self.iniciado_em if self.iniciado_em else 0.0
+            vazao = self.concluidos / decorrido if decorrido > 0 else 0.0
+            restantes = max(self.total - self.concluidos, 0)
+            if self.estado in ('concluido', 'erro'):
+                eta = 0.0
+            else:
+                eta = restantes / vazao if vazao > 0 else None
+
+            return {
+                'id': self.id,
+                'arquivo': self.filename,
+                'estado': self.estado,
+                'total': self.total,
+                'enviados': self.enviados,
+                'concluidos': self.concluidos,
+                'vazao': round(vazao, 2),
+                'eta': round(eta, 1) if eta is not None else None,
+                'decorrido': round(decorrido, 1),
+                'erro': self.erro,
+            }
+
+
+class JobManager:
+    """
+    Executa jobs em um pool de workers e mantém os jobs recentes em memória.
+
+    Métodos:
+    - submit: Cria e agenda um job.
+    - get: Retorna um job pelo identificador.
+    """
+    def __init__(self, workers=None, retencao=None, ao_descartar=None):
+        """
+        Parâmetros:
+            workers (int): Número de jobs executados simultaneamente (default: JOB_WORKERS).
+            retencao (int): Quantidade de jobs mantidos em memória (default: JOB_RETENCAO).
+            ao_descartar (callable): Chamada com o identificador de cada job descartado, para
+                liberar os dados associados a ele (por exemplo, StatusStore.descartar_job).
+        """
+        self.retencao = retencao or JOB_RETENCAO
+        self.ao_descartar = ao_descartar
+        self._executor = ThreadPoolExecutor(max_workers=workers or JOB_WORKERS, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, filename, file_path, funcao, job_id=None):
+        """
+        Cria um job para o arquivo e agenda sua execução.
+
+        Parâmetros:
+            filename (str): Nome original do arquivo enviado.
+            file_path (str): Caminho do arquivo salvo no servidor.
+            funcao (callable): Função que processa o job; recebe o próprio job.
+            job_id (str): Identificador do job (default: gerado automaticamente).
+
+        Retorna:
+            Job: Job criado.
+        """
+        job = Job(filename, file_path, job_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            descartados = self._descartar_antigos()
+        if self.ao_descartar is not None:
+            for descartado in descartados:
+                self.ao_descartar(descartado)
+        self._executor.submit(self._executar, job, funcao)
+        return job
+
+    def _descartar_antigos(self):
+        descartados = []
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.retencao:
+                break
+            if self._jobs[job_id].estado in ('concluido', 'erro'):
+                del self._jobs[job_id]
+                descartados.append(job_id)
+        return descartados
+
+    def _executar(self, job, funcao):
+        job.iniciar()
+        try:
+            funcao(job)
+            job.finalizar()
+        except Exception as e:
+            print(f"Erro ao processar o job {job.id} ({job.filename}): {e}")
+            job.falhar(e)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
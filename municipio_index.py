@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+import pandas as pd
+
+"""
+Módulo: municipio_index.py
+Descrição: Índice de municípios (cidade/UF -> Código Município) construído a partir do banco
+territorial de referência (relatorio_municipio.xls).
+
+O índice é montado uma única vez, persistido em cache no disco e reaproveitado entre requisições
+e entre processos (workers). O cache é identificado pelo hash do arquivo de origem, de modo que
+uma nova versão do banco territorial invalida o cache automaticamente.
+
+Funcionalidades:
+- Normalização de nomes de cidades (acentos, espaços e caixa), escalar e vetorizada.
+- Construção do índice normalizado "cidade/UF" -> código do município.
+- Cache em memória (por processo) e em disco (compartilhado entre processos).
+
+Dependências:
+- pandas
+- xlrd (leitura do arquivo .xls)
+"""
+
+CACHE_DIR = os.getenv('MUNICIPIO_CACHE_DIR', 'cache')
+
+# Mapeamento de códigos IBGE para estados (UF)
+UF_MAPPING = {
+    11: 'RO', 12: 'AC', 13: 'AM', 14: 'RR', 15: 'PA', 16: 'AP', 17: 'TO',
+    21: 'MA', 22: 'PI', 23: 'CE', 24: 'RN', 25: 'PB', 26: 'PE', 27: 'AL', 28: 'SE', 29: 'BA',
+    31: 'MG', 32: 'ES', 33: 'RJ', 35: 'SP',
+    41: 'PR', 42: 'SC', 43: 'RS',
+    50: 'MS', 51: 'MT', 52: 'GO', 53: 'DF'
+}
+
+_indices = {}
+_lock = threading.Lock()
+
+
+def normalizar_texto(texto):
+    """
+       Normaliza o texto removendo acentos, espaços extras e convertendo para minúsculas.
+    """
+    if pd.isna(texto):
+        return texto
+    texto = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
+    texto = texto.lower().strip()
+    texto = re.sub(r'\s+', ' ', texto)
+    return texto
+
+
+def normalizar_serie(serie):
+    """
+    Versão vetorizada de normalizar_texto para uma coluna inteira.
+
+    Apenas os valores distintos são normalizados (com os métodos de string do pandas) e o
+    resultado é mapeado de volta para as linhas, de modo que o custo é proporcional ao número
+    de cidades diferentes e não ao número de linhas.
+
+    Parâmetros:
+        serie (pandas.Series): Coluna com os textos a normalizar.
+
+    Retorna:
+        pandas.Series: Coluna normalizada, com os valores ausentes preservados.
+
+    Exemplo:
+        >>> normalizar_serie(pd.Series(['  São  Paulo', 'CURITIBA', None])).tolist()
+        ['sao paulo', 'curitiba', nan]
+    """
+    unicos = pd.Series(serie.dropna().unique(), dtype=object)
+    normalizados = (unicos.astype(str)
+                    .str.normalize('NFKD')
+                    .str.encode('ascii', 'ignore')
+                    .str.decode('ascii')
+                    .str.lower()
+                    .str.strip()
+                    .str.replace(r'\s+', ' ', regex=True))
+    return serie.map(dict(zip(unicos, normalizados)))
+
+
+def separar_cidade_uf(serie):
+    """
+    Divide uma coluna no formato "cidade/UF" em cidade normalizada, UF e chave do índice.
+
+    A divisão e a normalização são feitas apenas sobre os valores distintos da coluna e o
+    resultado é mapeado de volta para as linhas.
+
+    Parâmetros:
+        serie (pandas.Series): Coluna "cidade/uf" da planilha.
+
+    Retorna:
+        pandas.DataFrame: Colunas 'cidade', 'uf' (maiúsculas) e 'chave', alinhadas à coluna original.
+
+    Exceções:
+        ValueError: Valores fora do formato "cidade/UF".
+    """
+    unicos = pd.Series(serie.dropna().unique(), dtype=object)
+    partes = unicos.astype(str).str.split('/', expand=True)
+    if partes.shape[1] != 2:
+        raise ValueError("Valores da coluna 'cidade/uf' fora do formato cidade/UF.")
+
+    cidade = normalizar_serie(partes[0])
+    uf = partes[1].str.strip().str.upper()
+    chave = cidade + '/' + uf.str.lower()
+
+    return pd.DataFrame({
+        'cidade': serie.map(dict(zip(unicos, cidade))),
+        'uf': serie.map(dict(zip(unicos, uf))),
+        'chave': serie.map(dict(zip(unicos, chave))),
+    }, index=serie.index)
+
+
+def _hash_arquivo(caminho):
+    """
+    Calcula o hash SHA-1 do conteúdo de um arquivo.
+    """
+    sha1 = hashlib.sha1()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 16), b''):
+            sha1.update(bloco)
+    return sha1.hexdigest()
+
+
+def construir_indice(banco_territorial_caminho):
+    """
+    Lê o banco territorial e monta o índice normalizado de municípios.
+
+    Parâmetros:
+        banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+    Retorna:
+        dict: Dicionário "cidade/UF" normalizado -> código do município.
+    """
+    df_banco_territorial = pd.read_excel(banco_territorial_caminho)
+
+    uf = df_banco_territorial['UF'].map(UF_MAPPING)
+    cidade = normalizar_serie(df_banco_territorial['Cidade'])
+    chave = cidade + '/' + uf.str.lower()
+    validos = chave.notna()
+
+    return dict(zip(chave[validos], df_banco_territorial.loc[validos, 'Código Município'].astype(int)))
+
+
+def _caminho_cache(digest):
+    return os.path.join(CACHE_DIR, f"municipios_{digest}.json")
+
+
+def _ler_cache(digest):
+    try:
+        with open(_caminho_cache(digest), 'r', encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_cache(digest, indice):
+    """
+    Grava o índice no disco de forma atômica (arquivo temporário + rename), para que
+    outros processos nunca leiam um cache parcialmente escrito.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    destino = _caminho_cache(digest)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(indice, arquivo, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temporario, destino)
+
+
+def carregar_indice(banco_territorial_caminho):
+    """
+    Retorna o índice de municípios, reaproveitando o cache em memória ou em disco.
+
+    A assinatura (mtime, tamanho) do arquivo evita recalcular o hash a cada chamada; o hash
+    do conteúdo identifica o cache em disco compartilhado entre processos.
+
+    Parâmetros:
+        banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+    Retorna:
+        dict: Dicionário "cidade/UF" normalizado -> código do município.
+
+    Exemplo:
+        >>> indice = carregar_indice('referencia/relatorio_municipio.xls')
+        >>> indice['curitiba/pr']
+        4106902
+    """
+    stat = os.stat(banco_territorial_caminho)
+    assinatura = (os.path.abspath(banco_territorial_caminho), stat.st_mtime_ns, stat.st_size)
+
+    indice = _indices.get(assinatura)
+    if indice is not None:
+        return indice
+
+    with _lock:
+        indice = _indices.get(assinatura)
+        if indice is not None:
+            return indice
+
+        digest = _hash_arquivo(banco_territorial_caminho)
+        indice = _ler_cache(digest)
+        if indice is None:
+            print(f"Construindo índice de municípios a partir de: {banco_territorial_caminho}")
+            indice = construir_indice(banco_territorial_caminho)
+            try:
+                _gravar_cache(digest, indice)
+            except OSError as e:
+                print(f"Não foi possível gravar o cache de municípios: {e}")
+
+        _indices[assinatura] = indice
+        return indice
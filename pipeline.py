@@ -0,0 +1,727 @@
+import os
+import datetime
+import threading
+import unicodedata
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+import pandas as pd
+from openpyxl import load_workbook
+from directory import (read_data_from_excel, SoapRequestGenerator, send_soap_request, create_lote_request, dados,
+                       LIMITE_RPS_POR_LOTE)
+from municipio_index import carregar_indice, separar_cidade_uf
+from submission import SubmissionEngine
+from polling import get_poller, STATUS_AGUARDANDO
+from rps_template import render_inf_rps
+from rps_preparacao import preparar_rps, primeiro_rps
+from data_validation import validar_dataframe
+from soap_response import analisar_envio, ler_resposta
+from status_store import ResultadoRps, SEM_PROTOCOLO
+from upload_cache import obter_planilhas
+from rps_journal import RpsJournal, hash_rps, ESTADO_CONCLUIDO, ESTADO_INCERTO
+
+"""
+Módulo: pipeline.py
+Descrição: Etapas do processamento de uma planilha de RPS, compartilhadas pelo app web e pela
+execução em lote (batch.py).
+
+Funcionalidades:
+- Normalização das colunas e preenchimento dos códigos de município (banco territorial).
+- Preparação, validação e agrupamento dos RPS em lotes por prestador.
+- Envio dos lotes pelo motor de envio concorrente e agendamento da consulta dos protocolos.
+- Retomada dos RPS já registrados (rps_journal.py), sem reenvio.
+- Processamento das abas em paralelo, em processos separados.
+
+As abas são independentes (cada uma tem seu prestador, sua numeração de RPS e sua alíquota). Em
+planilhas com várias abas e pelo menos PIPELINE_PARALELO_MIN_LINHAS linhas, a leitura e o
+preenchimento dos municípios de cada aba e a montagem dos seus lotes (preparação, validação e
+geração dos envelopes, a parte que consome CPU) são feitos em um pool de processos, uma aba por
+tarefa. Os lotes voltam ao processo principal e são juntados na ordem da planilha; o envio
+continua no motor de envio, com limites de concorrência e de taxa separados por prestador, de
+modo que as abas também são enviadas em paralelo. O resultado é o mesmo do processamento em
+sequência. A leitura em blocos de arquivos grandes (enviar_blocos) continua sequencial.
+
+Configuração (variáveis de ambiente):
+- BANCO_TERRITORIAL: Caminho do banco territorial (default: referencia/relatorio_municipio.xls).
+- LOTE_TAMANHO: Quantidade de RPS por lote (default: 1), limitada a LIMITE_RPS_POR_LOTE.
+- STREAMING_MIN_BYTES: Tamanho a partir do qual o app lê e envia a planilha em blocos (default: 5 MB).
+- VALIDAR_RPS: Valida as linhas antes do envio (default: true).
+- PIPELINE_PROCESSOS: Processos usados para as abas; 1 desativa o paralelismo (default: número
+  de CPUs, até 4).
+- PIPELINE_PARALELO_MIN_LINHAS: Linhas a partir das quais as abas são processadas em paralelo
+  (default: 2000).
+
+Dependências:
+- pandas
+- requests
+"""
+
+BANCO_TERRITORIAL_CAMINHO = os.getenv('BANCO_TERRITORIAL', 'referencia/relatorio_municipio.xls')
+LOTE_TAMANHO = int(os.getenv('LOTE_TAMANHO', '1'))
+# Arquivos a partir deste tamanho são lidos e enviados em blocos, sem carregar a planilha inteira
+STREAMING_MIN_BYTES = int(os.getenv('STREAMING_MIN_BYTES', str(5 * 1024 * 1024)))
+# Valida as linhas antes do envio; as reprovadas não são enviadas ao web service
+VALIDAR_RPS = os.getenv('VALIDAR_RPS', 'True').lower() == 'true'
+
+PIPELINE_PROCESSOS = int(os.getenv('PIPELINE_PROCESSOS', str(min(4, os.cpu_count() or 1))))
+PIPELINE_PARALELO_MIN_LINHAS = int(os.getenv('PIPELINE_PARALELO_MIN_LINHAS', '2000'))
+
+# Tipos de lote gerados em montar_lotes
+MODO_ENVIAR = 'enviar'
+MODO_RETOMAR = 'retomar'
+MODO_INVALIDO = 'invalido'
+
+# Início do status dos RPS cujo envio ficou sem resposta (o lote pode ter sido recebido); esses RPS
+# não são reenviados automaticamente e devem ser conferidos no portal (ver RpsJournal.reconciliar)
+STATUS_NAO_CONFIRMADO = 'Envio não confirmado, conferir antes de reenviar'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_abas():
+    """
+    Retorna o pool de processos das abas, criando-o na primeira chamada.
+
+    Os processos são iniciados com 'spawn': o app cria threads (jobs, envio e consultas), e um
+    fork de um processo com threads pode herdar locks em uso.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=PIPELINE_PROCESSOS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def reset_pool_abas():
+    """
+    Encerra o pool de processos das abas; o próximo uso cria um novo pool.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _paralelizar(linhas_por_aba):
+    return (PIPELINE_PROCESSOS > 1 and len(linhas_por_aba) > 1
+            and sum(linhas_por_aba) >= PIPELINE_PARALELO_MIN_LINHAS)
+
+
+def normalizar_coluna(nome_coluna):
+    """
+      Normaliza o nome de uma coluna removendo acentos e convertendo para minúsculas.
+    """
+    nome_coluna = unicodedata.normalize('NFKD', nome_coluna).encode('ASCII', 'ignore').decode('ASCII')
+    return nome_coluna.lower()
+
+
+def normalize_column_names(columns):
+    """
+     Normaliza os nomes das colunas, removendo sufixos e convertendo para minúsculas.
+    """
+    normalized_columns = []
+    for col in columns:
+        normalized_col = col.split('_')[0].lower().strip()
+        normalized_columns.append(normalized_col)
+    return normalized_columns
+
+
+def enriquecer_planilhas(dfs, banco_territorial_caminho):
+    """
+       Preenche os códigos municipais das abas já carregadas em memória, com base no banco
+       territorial de referência.
+
+       Linhas totalmente vazias são descartadas, como na leitura em blocos
+       (file_handler.iter_xlsx_chunks): os RPS das abas são numerados em sequência a partir da
+       primeira linha, e as duas leituras precisam chegar às mesmas linhas para que a exportação
+       associe os resultados às linhas certas.
+
+       Parâmetros:
+           dfs (dict): DataFrames por aba, como lidos da planilha do usuário.
+           banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+       Retorna:
+           dict: DataFrames por aba com colunas normalizadas e as colunas 'uf' e 'municipio'.
+
+       Exceções:
+           ValueError: Erro em formato de colunas ou dados ausentes.
+    """
+    municipio_mapping = carregar_indice(banco_territorial_caminho)
+
+    df_dict = {}
+
+    for sheet_name, df_planilha in dfs.items():
+        vazias = df_planilha.isna().all(axis=1)
+        df_planilha = df_planilha[~vazias].reset_index(drop=True) if vazias.any() else df_planilha.copy()
+
+        df_planilha.columns = normalize_column_names(df_planilha.columns)
+
+        # Validação da coluna cidade/uf
+        if 'cidade/uf' not in df_planilha.columns:
+            raise ValueError(f"A coluna 'cidade/uf' não está presente na planilha de entrada na aba {sheet_name}.")
+
+        # Divide a coluna cidade/uf e monta a chave do índice de municípios
+        try:
+            df_planilha[['cidade', 'uf', 'chave']] = separar_cidade_uf(df_planilha['cidade/uf'])
+        except ValueError:
+            raise ValueError(f"Erro ao dividir a coluna 'cidade/uf' na aba {sheet_name}. Verifique o formato.")
+
+        df_planilha['municipio'] = df_planilha['chave'].map(municipio_mapping)
+
+        if df_planilha['municipio'].isnull().any():
+            raise ValueError(f"Alguns cód de municípios não foram encontrados no banco de dados "
+                             f"na aba {sheet_name}.")
+
+        df_planilha = df_planilha.drop(columns=['cidade/uf', 'cidade', 'chave'])
+
+        # Salva o resultado processado
+        df_dict[sheet_name] = df_planilha
+
+    return df_dict
+
+
+def enriquecer_blocos(blocos, banco_territorial_caminho):
+    """
+       Preenche os códigos municipais de blocos de linhas à medida que são lidos.
+
+       Parâmetros:
+           blocos (iterable): Pares (nome da aba, DataFrame), como os de file_handler.iter_xlsx_chunks.
+           banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+       Retorna:
+           generator: Pares (nome da aba, DataFrame) enriquecidos.
+    """
+    for sheet_name, bloco in blocos:
+        yield sheet_name, enriquecer_planilhas({sheet_name: bloco}, banco_territorial_caminho)[sheet_name]
+
+
+def preencher_municipio(planilha_caminho, banco_territorial_caminho):
+    """
+       Preenche os códigos municipais de uma planilha em disco e a reescreve com os dados atualizados.
+
+       A planilha é lida uma única vez; o fluxo web usa enriquecer_planilhas diretamente e não
+       precisa reescrever o arquivo.
+
+       Parâmetros:
+           planilha_caminho (str): Caminho da planilha enviada pelo usuário.
+           banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+       Retorna:
+           dict: DataFrames por aba com os códigos de município.
+
+       Exceções:
+           ValueError: Erro em formato de colunas ou dados ausentes.
+    """
+    df_dict = enriquecer_planilhas(read_data_from_excel(planilha_caminho), banco_territorial_caminho)
+
+    # Reescreve a planilha com os dados atualizados
+    with pd.ExcelWriter(planilha_caminho, engine='openpyxl') as writer:
+        for sheet_name, df in df_dict.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return df_dict
+
+
+def ler_aba(planilha_caminho, sheet_name, banco_territorial_caminho):
+    """
+    Lê uma aba da planilha e preenche os códigos de município (tarefa do pool de processos).
+    """
+    df = pd.read_excel(planilha_caminho, sheet_name=sheet_name)
+    return enriquecer_planilhas({sheet_name: df}, banco_territorial_caminho)[sheet_name]
+
+
+def ler_planilha(planilha_caminho, banco_territorial_caminho):
+    """
+    Lê as abas de uma planilha e preenche os códigos de município, com uma aba por processo em
+    planilhas grandes com várias abas.
+
+    Parâmetros:
+        planilha_caminho (str): Caminho da planilha.
+        banco_territorial_caminho (str): Caminho do banco de dados territorial.
+
+    Retorna:
+        dict: DataFrames por aba, na ordem da planilha (ver enriquecer_planilhas).
+    """
+    # As dimensões gravadas no arquivo dão o tamanho das abas sem lê-las
+    workbook = load_workbook(planilha_caminho, read_only=True)
+    try:
+        linhas_por_aba = {planilha.title: max((planilha.max_row or 1) - 1, 0) for planilha in workbook.worksheets}
+    finally:
+        workbook.close()
+
+    if not _paralelizar(list(linhas_por_aba.values())):
+        return enriquecer_planilhas(read_data_from_excel(planilha_caminho), banco_territorial_caminho)
+
+    pool = get_pool_abas()
+    futuros = {sheet_name: pool.submit(ler_aba, planilha_caminho, sheet_name, banco_territorial_caminho)
+               for sheet_name in linhas_por_aba}
+    return {sheet_name: futuro.result() for sheet_name, futuro in futuros.items()}
+
+
+def planilhas_enriquecidas(caminho):
+    """
+    Retorna as abas de uma planilha enviada já preenchidas com os códigos de município,
+    reaproveitando o cache de uploads com o mesmo conteúdo e o mesmo banco territorial.
+    """
+    stat = os.stat(BANCO_TERRITORIAL_CAMINHO)
+    versao = f"{os.path.abspath(BANCO_TERRITORIAL_CAMINHO)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return obter_planilhas(caminho, lambda arquivo: ler_planilha(arquivo, BANCO_TERRITORIAL_CAMINHO), versao)
+
+
+def nfses_por_rps(resposta_consulta, linhas):
+    """
+    Associa as NFS-e de uma consulta às linhas do lote pelo número do RPS.
+
+    Parâmetros:
+        resposta_consulta (RespostaConsulta): Resultado da consulta do protocolo (ou None).
+        linhas (list): Resultados (ResultadoRps) do lote.
+
+    Retorna:
+        dict: {número do RPS (str): (número da NFS-e, código de verificação)}.
+    """
+    if resposta_consulta is None or not resposta_consulta.nfses:
+        return {}
+    nfses = {str(numero_rps): (nfse.numero, nfse.codigo_verificacao)
+             for numero_rps, nfse in resposta_consulta.nfse_por_rps().items()}
+    # Lote de um único RPS: a NFS-e é dele mesmo que a resposta não identifique o RPS de origem
+    if not nfses and len(resposta_consulta.nfses) == 1 and len(linhas) == 1:
+        nfse = resposta_consulta.nfses[0]
+        nfses = {str(linhas[0].rps): (nfse.numero, nfse.codigo_verificacao)}
+    return nfses
+
+
+def linha_status(rps, protocolo, status, nfse=None, codigo_verificacao=None):
+    """
+    Monta o resultado de um RPS (dados do tomador, protocolo, status de verificação, número da
+    NFS-e, código de verificação e aba de origem).
+
+    Retorna:
+        ResultadoRps: Resultado do RPS.
+    """
+    return ResultadoRps.de_rps(rps, protocolo, status, nfse, codigo_verificacao)
+
+
+def agendar_consulta(lote, linhas, protocolo, poller, job=None, store=None, journal=None):
+    """
+    Agenda a consulta de um protocolo; quando ela é concluída, o status e as NFS-e são gravados nas
+    linhas, no armazenamento de status e no registro de RPS.
+
+    Parâmetros:
+        lote (dict): Lote dos RPS (usa 'cnpj' e 'inscricao_municipal').
+        linhas (list): Resultados (ResultadoRps) dos RPS do protocolo.
+        protocolo (str): Protocolo a consultar.
+        poller, job, store, journal: Como em enviar_lote.
+    """
+    def atualizar_status(status, resposta_consulta):
+        nfses = nfses_por_rps(resposta_consulta, linhas)
+        for linha in linhas:
+            linha.status = status
+            linha.nfse, linha.codigo_verificacao = nfses.get(str(linha.rps), (None, None))
+        if store is not None:
+            store.atualizar_status(job.id, protocolo, status, nfses)
+        if journal is not None:
+            journal.registrar_consulta(lote['cnpj'], protocolo, status, resposta_consulta, nfses)
+        if job is not None:
+            job.registrar_conclusao(len(linhas))
+
+    poller.enqueue(lote['cnpj'], lote['inscricao_municipal'], protocolo, atualizar_status)
+
+
+def requisicao_nao_enviada(erro):
+    """
+    Indica se uma falha de comunicação ocorreu antes de a requisição chegar ao web service
+    (conexão recusada, falha de DNS ou timeout de conexão). Nas demais falhas (por exemplo, timeout
+    de leitura) o lote pode ter sido recebido.
+    """
+    if isinstance(erro, requests.ConnectTimeout):
+        return True
+    motivo = getattr(erro.args[0], 'reason', None) if erro.args else None
+    return isinstance(motivo, ConnectTimeoutError)
+
+
+def enviar_lote(lote, poller, job=None, store=None, journal=None, timeout=None):
+    """
+    Envia um lote de RPS e monta as linhas de status.
+
+    O protocolo retornado é atribuído a todos os RPS do lote e agendado para consulta em segundo
+    plano; o status de verificação das linhas é atualizado quando a consulta é concluída.
+
+    Uma falha de comunicação depois de a requisição ter saído não é tratada como recusa: o lote
+    pode ter sido recebido, e os RPS são registrados como incertos (STATUS_NAO_CONFIRMADO), sem
+    novo envio automático (ver rps_journal.py).
+
+    Parâmetros:
+        lote (dict): Lote a enviar, com as chaves 'kwargs' (registros Rps, na ordem da planilha),
+            'envelope' (requisição SOAP), 'cnpj', 'inscricao_municipal', 'posicao' (posição da
+            primeira linha do lote no arquivo) e 'hashes' (hash do conteúdo de cada RPS, usado no
+            registro de RPS).
+        poller (ProtocolPoller): Fila de consulta dos protocolos.
+        job (Job): Job cujo progresso é atualizado (opcional).
+        store (StatusStore): Armazenamento onde as linhas do job são gravadas (opcional, requer job).
+        journal (RpsJournal): Registro onde o envio e a consulta são gravados (opcional).
+        timeout (float): Timeout da requisição em segundos.
+
+    Retorna:
+        list: Resultados (ResultadoRps) dos RPS do lote: dados do tomador, protocolo, status de
+            verificação, número da NFS-e, código de verificação e aba.
+    """
+    protocolo = None
+    incerto = False
+    try:
+        response = send_soap_request(lote['envelope'], timeout=timeout, stream=True, prestador=lote['cnpj'])
+        resposta = ler_resposta(response, analisar_envio)
+
+        if resposta.sucesso:
+            protocolo = resposta.protocolo
+            status_verificacao = STATUS_AGUARDANDO
+        else:
+            status_verificacao = "Erro ao processar a NFS-e: " + resposta.descricao_erro()
+    except requests.RequestException as e:
+        status_verificacao = f"Erro de comunicação com o web service: {e}"
+        if not requisicao_nao_enviada(e):
+            incerto = True
+            status_verificacao = f"{STATUS_NAO_CONFIRMADO}: {status_verificacao}"
+
+    protocolo_numero = protocolo if protocolo is not None else SEM_PROTOCOLO
+    linhas = [linha_status(rps, protocolo_numero, status_verificacao) for rps in lote['kwargs']]
+
+    if journal is not None:
+        journal.registrar_envio(lote['cnpj'], zip((rps.valor_rps for rps in lote['kwargs']), lote['hashes']),
+                                protocolo, status_verificacao, incerto=incerto)
+    if store is not None:
+        store.adicionar_linhas(job.id, lote['posicao'], linhas)
+    if job is not None:
+        job.registrar_envio(len(linhas), concluidos=0 if protocolo is not None else len(linhas))
+
+    if protocolo is not None:
+        agendar_consulta(lote, linhas, protocolo, poller, job, store, journal)
+
+    return linhas
+
+
+def retomar_lote(lote, poller, job=None, store=None, journal=None, timeout=None):
+    """
+    Monta as linhas de status de RPS que já constam do registro de RPS, sem reenviá-los.
+
+    Os RPS concluídos recebem o status e as NFS-e registrados; os que já têm protocolo mas ainda
+    não foram confirmados têm o protocolo consultado novamente. Os incertos (envio sem resposta)
+    mantêm o status registrado, que os sinaliza para conferência manual, sem envio nem consulta.
+
+    Parâmetros:
+        lote (dict): Lote com as chaves de enviar_lote (exceto 'envelope') e 'registros'
+            (RegistroRps de cada RPS).
+        poller, job, store, journal, timeout: Como em enviar_lote.
+
+    Retorna:
+        list: Resultados (ResultadoRps) dos RPS do lote.
+    """
+    linhas = []
+    por_protocolo = {}
+    for rps, registro in zip(lote['kwargs'], lote['registros']):
+        if registro.estado == ESTADO_CONCLUIDO:
+            linha = linha_status(rps, registro.protocolo, registro.status, registro.nfse,
+                                 registro.codigo_verificacao)
+        elif registro.estado == ESTADO_INCERTO:
+            linha = linha_status(rps, SEM_PROTOCOLO, registro.status)
+        else:
+            linha = linha_status(rps, registro.protocolo, STATUS_AGUARDANDO)
+            por_protocolo.setdefault(registro.protocolo, []).append(linha)
+        linhas.append(linha)
+
+    aguardando = sum(len(linhas_protocolo) for linhas_protocolo in por_protocolo.values())
+    if store is not None:
+        store.adicionar_linhas(job.id, lote['posicao'], linhas)
+    if job is not None:
+        job.registrar_envio(len(linhas), concluidos=len(linhas) - aguardando)
+
+    for protocolo, linhas_protocolo in por_protocolo.items():
+        agendar_consulta(lote, linhas_protocolo, protocolo, poller, job, store, journal)
+
+    return linhas
+
+
+def recusar_lote(lote, poller, job=None, store=None, journal=None, timeout=None):
+    """
+    Monta as linhas de status de RPS reprovados na validação prévia, sem enviá-los.
+
+    Parâmetros:
+        lote (dict): Lote com as chaves de enviar_lote (exceto 'envelope') e 'erros' (erros de
+            validação de cada RPS).
+        poller, job, store, journal, timeout: Como em enviar_lote.
+
+    Retorna:
+        list: Resultados (ResultadoRps) dos RPS do lote.
+    """
+    linhas = [linha_status(rps, SEM_PROTOCOLO, f"Erro de validação: {erro}")
+              for rps, erro in zip(lote['kwargs'], lote['erros'])]
+    if store is not None:
+        store.adicionar_linhas(job.id, lote['posicao'], linhas)
+    if job is not None:
+        job.registrar_envio(len(linhas), concluidos=len(linhas))
+    return linhas
+
+
+def process_file(file_path, **kwargs):
+    """
+    Lê uma planilha já preenchida com os códigos de município e envia seus RPS.
+
+    Parâmetros:
+        file_path (str): Caminho da planilha.
+        kwargs: Parâmetros repassados a process_dataframes.
+
+    Retorna:
+        list: Resultados (ResultadoRps) na mesma ordem das linhas da planilha.
+    """
+    return process_dataframes(read_data_from_excel(file_path), **kwargs)
+
+
+def process_dataframes(dfs, engine=None, lote_tamanho=None, poller=None, job=None, store=None, journal=None):
+    """
+    Envia os RPS de abas já carregadas em memória. Todos os lotes são gerados antes do envio,
+    o que permite ao motor intercalar os prestadores das diferentes abas. Em planilhas grandes com
+    várias abas, os lotes de cada aba são montados em paralelo (ver montar_lotes_abas).
+
+    Parâmetros:
+        dfs (dict): DataFrames por aba, já preenchidos com os códigos de município.
+        engine, lote_tamanho, poller, job, store, journal: Como em enviar_blocos.
+
+    Retorna:
+        list: Resultados (ResultadoRps) na mesma ordem das linhas da planilha; o status de verificação
+        é atualizado nas próprias linhas à medida que as consultas são concluídas.
+    """
+    engine = engine or SubmissionEngine()
+    poller = poller or get_poller()
+    lote_tamanho = max(1, min(lote_tamanho or LOTE_TAMANHO, LIMITE_RPS_POR_LOTE))
+
+    tarefas = [tarefa_lote(lote, poller, job, store, journal)
+               for lote in montar_lotes_abas(dfs, lote_tamanho, journal)]
+    return [status for status_lote in engine.run(tarefas) for status in status_lote]
+
+
+def montar_lotes_aba(sheet_name, df, lote_tamanho, journal_caminho=None):
+    """
+    Monta os lotes de uma única aba (tarefa do pool de processos).
+
+    Parâmetros:
+        sheet_name (str): Nome da aba.
+        df (pandas.DataFrame): Linhas da aba, já preenchidas com os códigos de município.
+        lote_tamanho (int): Quantidade de RPS por lote.
+        journal_caminho (str): Caminho do registro de RPS (opcional).
+
+    Retorna:
+        list: Lotes da aba, com posições a partir de 0.
+    """
+    journal = RpsJournal(journal_caminho) if journal_caminho else None
+    return list(montar_lotes([(sheet_name, df)], lote_tamanho, journal))
+
+
+def montar_lotes_abas(dfs, lote_tamanho, journal=None):
+    """
+    Monta os lotes de todas as abas, em paralelo quando a planilha é grande e tem várias abas
+    de prestadores configurados; os lotes são devolvidos na ordem da planilha, com as posições
+    contadas desde a primeira aba, como em montar_lotes.
+
+    Parâmetros:
+        dfs (dict): DataFrames por aba, já preenchidos com os códigos de município.
+        lote_tamanho (int): Quantidade de RPS por lote.
+        journal (RpsJournal): Registro de RPS (opcional).
+
+    Retorna:
+        list: Lotes na ordem da planilha.
+    """
+    abas = [(sheet_name, df) for sheet_name, df in dfs.items() if sheet_name in dados and not df.empty]
+    if not _paralelizar([len(df) for _, df in abas]):
+        return list(montar_lotes(abas, lote_tamanho, journal))
+
+    pool = get_pool_abas()
+    journal_caminho = journal.caminho if journal is not None else None
+    futuros = [pool.submit(montar_lotes_aba, sheet_name, df, lote_tamanho, journal_caminho)
+               for sheet_name, df in abas]
+
+    lotes = []
+    inicio_aba = 0
+    for (_, df), futuro in zip(abas, futuros):
+        for lote in futuro.result():
+            lote['posicao'] += inicio_aba
+            lotes.append(lote)
+        inicio_aba += len(df)
+    return lotes
+
+
+def montar_lotes(blocos, lote_tamanho, journal=None):
+    """
+    Prepara os RPS de cada linha e agrupa os RPS de cada aba em lotes.
+
+    Os blocos de uma mesma aba devem chegar em sequência; a numeração dos RPS e o lote em
+    formação continuam de um bloco para o outro, de modo que o resultado é o mesmo de
+    processar a aba inteira de uma vez.
+
+    Com o registro de RPS, os RPS já enviados (com o mesmo conteúdo) não entram nos lotes de envio:
+    as sequências desses RPS viram lotes a retomar (retomar_lote), que não acessam o web service. Da
+    mesma forma, as linhas reprovadas na validação prévia (VALIDAR_RPS) viram lotes recusados
+    (recusar_lote).
+
+    Os lotes são dicionários simples (sem referência ao job ou à fila de consultas), que podem ser
+    montados em outro processo (ver montar_lotes_aba).
+
+    Parâmetros:
+        blocos (iterable): Pares (nome da aba, DataFrame) já preenchidos com os códigos de município.
+        lote_tamanho (int): Quantidade de RPS por lote.
+        journal (RpsJournal): Registro de RPS usado para pular os RPS já enviados (opcional).
+
+    Retorna:
+        generator: Lotes na ordem da planilha, com as chaves descritas em enviar_lote e 'modo'
+            (MODO_ENVIAR, MODO_RETOMAR ou MODO_INVALIDO).
+    """
+    total_linhas = 0
+    aba_atual = None
+    soap_request_gen = None
+    rps_counter = None
+    registros = {}
+    modo_lote = MODO_ENVIAR
+    lista_kwargs = []
+    lista_hashes = []
+    lista_inf_rps = []
+    lista_detalhes = []
+
+    def fechar_lote():
+        nonlocal total_linhas, lista_kwargs, lista_hashes, lista_inf_rps, lista_detalhes
+        lote = {
+            'modo': modo_lote,
+            'kwargs': lista_kwargs,
+            'hashes': lista_hashes,
+            'cnpj': cnpj_prestador,
+            'inscricao_municipal': inscricao_municipal_prestador,
+            'posicao': total_linhas,
+        }
+        if modo_lote == MODO_RETOMAR:
+            lote['registros'] = lista_detalhes
+        elif modo_lote == MODO_INVALIDO:
+            lote['erros'] = lista_detalhes
+        else:
+            numero_lote = soap_request_gen.numero_lote_dinamico(valor_rps=lista_kwargs[0].valor_rps)
+            lote['envelope'] = create_lote_request(numero_lote, cnpj_prestador, inscricao_municipal_prestador,
+                                                   lista_inf_rps)
+        total_linhas += len(lista_kwargs)
+        lista_kwargs, lista_hashes, lista_inf_rps, lista_detalhes = [], [], [], []
+        return lote
+
+    for sheet_name, df in blocos:
+        if sheet_name in dados:
+            cnpj_prestador_aba, inscricao_municipal_aba = dados[sheet_name]
+        else:
+            continue
+        if df.empty:
+            continue
+
+        if sheet_name != aba_atual:
+            if lista_kwargs:
+                yield fechar_lote()
+
+            aba_atual = sheet_name
+            cnpj_prestador, inscricao_municipal_prestador = cnpj_prestador_aba, inscricao_municipal_aba
+            soap_request_gen = SoapRequestGenerator()
+            rps_counter = primeiro_rps(df)
+            registros = journal.carregar(cnpj_prestador) if journal is not None else {}
+
+        # Uma única data de emissão por bloco: evita formatar datetime.now() a cada RPS
+        data_emissao = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+        registros_rps = preparar_rps(df, sheet_name, cnpj_prestador, inscricao_municipal_prestador, rps_counter)
+        erros = validar_dataframe(df).tolist() if VALIDAR_RPS else [''] * len(registros_rps)
+        rps_counter += len(registros_rps)
+
+        for rps, erro in zip(registros_rps, erros):
+            hash_conteudo = hash_rps(rps) if journal is not None else None
+            registro = registros.get((str(rps.valor_rps), hash_conteudo))
+            if registro is not None and not registro.pendente:
+                modo, detalhe = MODO_RETOMAR, registro
+            elif erro:
+                modo, detalhe = MODO_INVALIDO, erro
+            else:
+                modo, detalhe = MODO_ENVIAR, None
+
+            # RPS a enviar, já registrados e inválidos não se misturam no mesmo lote
+            if lista_kwargs and modo != modo_lote:
+                yield fechar_lote()
+            modo_lote = modo
+
+            lista_kwargs.append(rps)
+            lista_hashes.append(hash_conteudo)
+            if modo != MODO_ENVIAR:
+                lista_detalhes.append(detalhe)
+                continue
+            lista_inf_rps.append(render_inf_rps(data_emissao=data_emissao, **rps))
+
+            if len(lista_kwargs) >= lote_tamanho:
+                yield fechar_lote()
+
+    if lista_kwargs:
+        yield fechar_lote()
+
+
+def tarefa_lote(lote, poller, job=None, store=None, journal=None):
+    """
+    Converte um lote de montar_lotes na tarefa do motor de envio: enviar_lote, retomar_lote ou
+    recusar_lote, conforme o modo do lote.
+
+    Retorna:
+        tuple: (cnpj_prestador, funcao), como esperado por SubmissionEngine.
+    """
+    funcoes = {MODO_ENVIAR: enviar_lote, MODO_RETOMAR: retomar_lote, MODO_INVALIDO: recusar_lote}
+    if job is not None:
+        job.adicionar_total(len(lote['kwargs']))
+    return lote['cnpj'], partial(funcoes[lote['modo']], lote, poller, job, store, journal)
+
+
+def gerar_lotes(blocos, lote_tamanho, poller, job=None, store=None, journal=None):
+    """
+    Gera as tarefas de envio dos blocos (ver montar_lotes e tarefa_lote).
+
+    Parâmetros:
+        blocos (iterable): Pares (nome da aba, DataFrame) já preenchidos com os códigos de município.
+        lote_tamanho (int): Quantidade de RPS por lote.
+        poller (ProtocolPoller): Fila de consulta dos protocolos.
+        job (Job): Job cujo progresso é atualizado (opcional).
+        store (StatusStore): Armazenamento onde as linhas do job são gravadas (opcional, requer job).
+        journal (RpsJournal): Registro de RPS usado para pular os RPS já enviados (opcional).
+
+    Retorna:
+        generator: Tarefas (cnpj_prestador, funcao) para o motor de envio, na ordem da planilha.
+    """
+    for lote in montar_lotes(blocos, lote_tamanho, journal):
+        yield tarefa_lote(lote, poller, job, store, journal)
+
+
+def enviar_blocos(blocos, engine=None, lote_tamanho=None, poller=None, job=None, store=None, journal=None):
+    """
+    Agrupa os RPS dos blocos em lotes e os envia pelo motor de envio concorrente à medida que
+    os blocos são lidos. Os protocolos são consultados em segundo plano.
+
+    Parâmetros:
+        blocos (iterable): Pares (nome da aba, DataFrame), por exemplo dfs.items() ou os blocos
+            de file_handler.iter_xlsx_chunks já preenchidos com os códigos de município.
+        engine (SubmissionEngine): Motor de envio (default: configuração das variáveis de ambiente).
+        lote_tamanho (int): Quantidade de RPS por lote (default: LOTE_TAMANHO), limitada a
+            LIMITE_RPS_POR_LOTE.
+        poller (ProtocolPoller): Fila de consulta dos protocolos (default: fila compartilhada do processo).
+        job (Job): Job cujo progresso é atualizado (opcional).
+        store (StatusStore): Armazenamento onde as linhas do job são gravadas (opcional, requer job).
+        journal (RpsJournal): Registro de RPS; os RPS já enviados não são reenviados (opcional).
+
+    Retorna:
+        generator: Resultados (ResultadoRps) na mesma ordem das linhas da planilha.
+    """
+    engine = engine or SubmissionEngine()
+    poller = poller or get_poller()
+    lote_tamanho = max(1, min(lote_tamanho or LOTE_TAMANHO, LIMITE_RPS_POR_LOTE))
+
+    tarefas = gerar_lotes(blocos, lote_tamanho, poller, job, store, journal)
+    for status_lote in engine.stream(tarefas):
+        yield from status_lote
+
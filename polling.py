@@ -0,0 +1,182 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from requests import RequestException
+from utils import consultar_protocolo
+from soap_response import STATUS_NAO_ENCONTRADO, STATUS_ERRO_ANALISE
+
+"""
+Módulo: polling.py
+Descrição: Consulta assíncrona do status dos protocolos retornados pelo RecepcionarLoteRps.
+
+Logo após o envio, o município normalmente ainda não processou o lote, de modo que uma consulta
+imediata retorna "Status não encontrado". Os protocolos são colocados em uma fila e consultados
+em segundo plano (ConsultarLoteRps) com backoff exponencial até que um status definitivo seja
+obtido ou o número máximo de consultas seja atingido. O resultado (texto de status e resposta
+estruturada, com as NFS-e emitidas) é entregue por callback.
+
+Funcionalidades:
+- Fila de protocolos ordenada pelo horário da próxima consulta.
+- Workers em segundo plano (threads daemon) iniciados sob demanda.
+- Backoff exponencial entre as consultas de um mesmo protocolo.
+- Espera opcional pelo fim das consultas pendentes (execuções fora do Flask).
+
+Configuração (variáveis de ambiente):
+- POLLING_WORKERS: Número de threads de consulta (default: 2).
+- POLLING_INTERVALO_INICIAL / POLLING_INTERVALO_MAXIMO: Intervalo entre consultas, em segundos (default: 2 / 60).
+- POLLING_TENTATIVAS: Número máximo de consultas por protocolo (default: 10).
+
+Dependências:
+- utils (consultar_protocolo)
+"""
+
+POLLING_WORKERS = int(os.getenv('POLLING_WORKERS', '2'))
+POLLING_INTERVALO_INICIAL = float(os.getenv('POLLING_INTERVALO_INICIAL', '2'))
+POLLING_INTERVALO_MAXIMO = float(os.getenv('POLLING_INTERVALO_MAXIMO', '60'))
+POLLING_TENTATIVAS = int(os.getenv('POLLING_TENTATIVAS', '10'))
+
+STATUS_AGUARDANDO = "Aguardando processamento"
+
+# Status que indicam que o lote ainda não foi processado (ou que a consulta falhou) e deve ser repetido
+STATUS_NAO_TERMINAIS = (STATUS_NAO_ENCONTRADO, STATUS_ERRO_ANALISE)
+
+
+class ProtocolPoller:
+    """
+    Fila de consultas de protocolos processada por workers em segundo plano.
+
+    Métodos:
+    - enqueue: Agenda a consulta de um protocolo.
+    - wait: Aguarda o término das consultas pendentes.
+    """
+    def __init__(self, workers=None, intervalo_inicial=None, intervalo_maximo=None, tentativas_maximas=None,
+                 verificar=consultar_protocolo):
+        """
+        Inicializa a fila de consultas.
+
+        Parâmetros:
+            workers (int): Número de threads de consulta (default: POLLING_WORKERS).
+            intervalo_inicial (float): Espera antes da primeira consulta, em segundos
+                (default: POLLING_INTERVALO_INICIAL).
+            intervalo_maximo (float): Limite do intervalo entre consultas (default: POLLING_INTERVALO_MAXIMO).
+            tentativas_maximas (int): Número máximo de consultas por protocolo (default: POLLING_TENTATIVAS).
+            verificar (callable): Função de consulta (cnpj, inscricao_municipal, protocolo) -> RespostaConsulta.
+        """
+        self.workers = max(1, workers or POLLING_WORKERS)
+        self.intervalo_inicial = POLLING_INTERVALO_INICIAL if intervalo_inicial is None else intervalo_inicial
+        self.intervalo_maximo = intervalo_maximo or POLLING_INTERVALO_MAXIMO
+        self.tentativas_maximas = max(1, tentativas_maximas or POLLING_TENTATIVAS)
+        self.verificar = verificar
+
+        self._fila = []
+        self._sequencia = itertools.count()
+        self._cond = threading.Condition()
+        self._pendentes = 0
+        self._threads = []
+
+    def _iniciar(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"protocol-poller-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _agendar(self, consulta, espera):
+        heapq.heappush(self._fila, (time.monotonic() + espera, next(self._sequencia), consulta))
+        self._cond.notify()
+
+    def enqueue(self, cnpj, inscricao_municipal, protocolo, callback):
+        """
+        Agenda a consulta de um protocolo.
+
+        Parâmetros:
+            cnpj (str): CNPJ do prestador.
+            inscricao_municipal (str): Inscrição municipal do prestador.
+            protocolo (str): Número do protocolo retornado no envio.
+            callback (callable): Função chamada com o status definitivo do protocolo e a última
+                RespostaConsulta (None se a consulta falhou por erro de comunicação).
+        """
+        consulta = {
+            'cnpj': cnpj,
+            'inscricao_municipal': inscricao_municipal,
+            'protocolo': protocolo,
+            'callback': callback,
+            'tentativas': 0,
+        }
+        with self._cond:
+            self._iniciar()
+            self._pendentes += 1
+            self._agendar(consulta, self.intervalo_inicial)
+
+    def wait(self, timeout=None):
+        """
+        Aguarda até que todos os protocolos agendados tenham um status definitivo.
+
+        Parâmetros:
+            timeout (float): Tempo máximo de espera em segundos (default: sem limite).
+
+        Retorna:
+            bool: True se não há consultas pendentes, False se o tempo se esgotou.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pendentes == 0, timeout)
+
+    def _proxima(self):
+        with self._cond:
+            while True:
+                if not self._fila:
+                    self._cond.wait()
+                    continue
+                espera = self._fila[0][0] - time.monotonic()
+                if espera <= 0:
+                    return heapq.heappop(self._fila)[2]
+                self._cond.wait(espera)
+
+    def _consultar(self, consulta):
+        try:
+            resposta = self.verificar(consulta['cnpj'], consulta['inscricao_municipal'], consulta['protocolo'])
+            return resposta.status, resposta.status not in STATUS_NAO_TERMINAIS, resposta
+        except RequestException as e:
+            return f"Erro de comunicação com o web service: {e}", False, None
+
+    def _worker(self):
+        while True:
+            consulta = self._proxima()
+            consulta['tentativas'] += 1
+            status, terminal, resposta = self._consultar(consulta)
+
+            if not terminal and consulta['tentativas'] < self.tentativas_maximas:
+                espera = min(self.intervalo_inicial * 2 ** consulta['tentativas'], self.intervalo_maximo)
+                with self._cond:
+                    self._agendar(consulta, espera)
+                continue
+
+            if not terminal:
+                status = f"{status} após {consulta['tentativas']} consultas"
+            try:
+                consulta['callback'](status, resposta)
+            except Exception as e:
+                print(f"Erro ao registrar o status do protocolo {consulta['protocolo']}: {e}")
+            finally:
+                with self._cond:
+                    self._pendentes -= 1
+                    self._cond.notify_all()
+
+
+_poller = None
+_lock = threading.Lock()
+
+
+def get_poller():
+    """
+    Retorna a fila de consultas compartilhada pelo processo, criando-a na primeira chamada.
+    """
+    global _poller
+    if _poller is None:
+        with _lock:
+            if _poller is None:
+                _poller = ProtocolPoller()
+    return _poller
@@ -0,0 +1,315 @@
+import os
+import time
+import threading
+from collections import deque
+
+"""
+Módulo: rate_limit.py
+Descrição: Controle do ritmo das requisições ao web service, por endpoint e prestador.
+
+Cada par (endpoint, prestador) tem um controle de fluxo com duas partes:
+- Um token bucket, que limita a taxa de requisições por segundo (com rajadas de até
+  SOAP_RAJADA requisições).
+- Um limite de concorrência adaptativo (AIMD): enquanto a latência se mantém próxima da latência
+  de base, o limite sobe aditivamente (cerca de +1 a cada limite respostas); em timeouts, erros
+  de conexão, HTTP 502/503/504 ou respostas de limitação (HTTP 429), o limite é multiplicado por
+  SOAP_FATOR_REDUCAO, no máximo uma vez por intervalo de latência. Um HTTP 500 (SOAP Fault, em
+  geral erro de validação do lote) não indica sobrecarga e não reduz o limite.
+
+O limite adaptativo é o único limite de requisições simultâneas por prestador (o motor de envio,
+submission.py, não tem um limite próprio). As retentativas feitas pelo urllib3 dentro de uma
+requisição (transport.py) também passam pelo token bucket (ver ControleFluxo.retentativa); elas
+ocupam a mesma vaga do limite de concorrência da requisição original.
+
+A taxa observada, o limite de concorrência e a latência de cada controle ficam disponíveis em
+metricas(), exposta pelo app na rota /metricas.
+
+Configuração (variáveis de ambiente):
+- SOAP_TAXA: Requisições por segundo por endpoint e prestador; 0 desativa o limite (default: 20).
+- SOAP_RAJADA: Requisições que podem ser feitas de uma vez acima da taxa (default: SOAP_TAXA).
+- SOAP_ADAPTATIVO: Ajusta o limite de concorrência automaticamente (default: true).
+- SOAP_CONCORRENCIA_INICIAL / SOAP_CONCORRENCIA_MINIMA / SOAP_CONCORRENCIA_MAXIMA: Limite de
+  requisições simultâneas (default: 4 / 1 / 16).
+- SOAP_FATOR_REDUCAO: Fator aplicado ao limite em caso de sobrecarga (default: 0.5).
+- SOAP_TOLERANCIA_LATENCIA: Quanto a latência pode superar a de base sem impedir o aumento do
+  limite (default: 2.0).
+
+Dependências:
+- threading
+"""
+
+SOAP_TAXA = float(os.getenv('SOAP_TAXA', '20'))
+SOAP_RAJADA = float(os.getenv('SOAP_RAJADA', '0')) or None
+SOAP_ADAPTATIVO = os.getenv('SOAP_ADAPTATIVO', 'True').lower() == 'true'
+SOAP_CONCORRENCIA_INICIAL = int(os.getenv('SOAP_CONCORRENCIA_INICIAL', '4'))
+SOAP_CONCORRENCIA_MINIMA = int(os.getenv('SOAP_CONCORRENCIA_MINIMA', '1'))
+SOAP_CONCORRENCIA_MAXIMA = int(os.getenv('SOAP_CONCORRENCIA_MAXIMA', '16'))
+SOAP_FATOR_REDUCAO = float(os.getenv('SOAP_FATOR_REDUCAO', '0.5'))
+SOAP_TOLERANCIA_LATENCIA = float(os.getenv('SOAP_TOLERANCIA_LATENCIA', '2.0'))
+
+# Respostas HTTP tratadas como sinal de sobrecarga do servidor
+STATUS_SOBRECARGA = frozenset({429, 502, 503, 504})
+
+# Janela, em segundos, usada no cálculo da taxa observada
+JANELA_TAXA = 10.0
+
+# Controle da requisição em andamento em cada thread (usado nas retentativas do urllib3)
+_execucao = threading.local()
+
+
+def sobrecarregado(response):
+    """
+    Indica se a resposta sinaliza sobrecarga: status de STATUS_SOBRECARGA na resposta final ou
+    em alguma das retentativas feitas pelo urllib3 antes dela (que não chegam ao chamador).
+    """
+    if response.status_code in STATUS_SOBRECARGA:
+        return True
+    retentativas = getattr(getattr(response, 'raw', None), 'retries', None)
+    return any(tentativa.status in STATUS_SOBRECARGA or tentativa.error is not None
+               for tentativa in getattr(retentativas, 'history', ()))
+
+
+class TokenBucket:
+    """
+    Limitador de taxa: cada requisição consome um token; os tokens são repostos à taxa configurada
+    até a capacidade (rajada máxima).
+    """
+    def __init__(self, taxa, capacidade=None):
+        """
+        Parâmetros:
+            taxa (float): Tokens repostos por segundo; 0 desativa o limite.
+            capacidade (float): Tokens acumuláveis (default: taxa, no mínimo 1).
+        """
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self._tokens = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        """
+        Consome um token, aguardando a reposição se necessário.
+        """
+        if self.taxa <= 0:
+            return
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado) * self.taxa)
+                self._atualizado = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+class AdaptiveLimiter:
+    """
+    Limite de requisições simultâneas com ajuste AIMD (aumento aditivo, redução multiplicativa).
+    """
+    def __init__(self, inicial=None, minimo=None, maximo=None, fator_reducao=None, tolerancia=None,
+                 adaptativo=None):
+        """
+        Parâmetros:
+            inicial (int): Limite inicial (default: SOAP_CONCORRENCIA_INICIAL).
+            minimo / maximo (int): Faixa do limite (default: SOAP_CONCORRENCIA_MINIMA / MAXIMA).
+            fator_reducao (float): Fator aplicado em caso de sobrecarga (default: SOAP_FATOR_REDUCAO).
+            tolerancia (float): Razão máxima entre a latência e a latência de base para que o limite
+                suba (default: SOAP_TOLERANCIA_LATENCIA).
+            adaptativo (bool): Se False, o limite fica fixo no valor inicial (default: SOAP_ADAPTATIVO).
+        """
+        self.minimo = max(1, minimo or SOAP_CONCORRENCIA_MINIMA)
+        self.maximo = max(self.minimo, maximo or SOAP_CONCORRENCIA_MAXIMA)
+        self.limite = float(min(max(inicial or SOAP_CONCORRENCIA_INICIAL, self.minimo), self.maximo))
+        self.fator_reducao = fator_reducao or SOAP_FATOR_REDUCAO
+        self.tolerancia = tolerancia or SOAP_TOLERANCIA_LATENCIA
+        self.adaptativo = SOAP_ADAPTATIVO if adaptativo is None else adaptativo
+
+        self.em_uso = 0
+        self.latencia_base = None
+        self.reducoes = 0
+        self._ultima_reducao = 0.0
+        self._cond = threading.Condition()
+
+    def adquirir(self):
+        with self._cond:
+            while self.em_uso >= int(self.limite):
+                self._cond.wait()
+            self.em_uso += 1
+
+    def liberar(self, latencia=None, sobrecarga=False):
+        """
+        Libera uma vaga e ajusta o limite com o resultado da requisição.
+
+        Parâmetros:
+            latencia (float): Latência da requisição em segundos (None se não houve resposta).
+            sobrecarga (bool): Indica timeout, erro de conexão, HTTP 502/503/504 ou limitação.
+        """
+        with self._cond:
+            self.em_uso -= 1
+            if self.adaptativo:
+                if sobrecarga:
+                    self._reduzir()
+                elif latencia is not None:
+                    self._registrar_latencia(latencia)
+            self._cond.notify_all()
+
+    def _reduzir(self):
+        # Uma única redução por "janela" de latência: várias requisições simultâneas costumam
+        # falhar pelo mesmo episódio de sobrecarga
+        agora = time.monotonic()
+        if agora - self._ultima_reducao < (self.latencia_base or 0.1):
+            return
+        self._ultima_reducao = agora
+        self.limite = max(float(self.minimo), self.limite * self.fator_reducao)
+        self.reducoes += 1
+
+    def _registrar_latencia(self, latencia):
+        # A latência de base acompanha o mínimo observado e sobe lentamente, para acomodar uma
+        # mudança duradoura no tempo de resposta do servidor
+        if self.latencia_base is None or latencia < self.latencia_base:
+            self.latencia_base = latencia
+        else:
+            self.latencia_base += (latencia - self.latencia_base) * 0.01
+        if latencia <= self.latencia_base * self.tolerancia:
+            self.limite = min(float(self.maximo), self.limite + 1 / self.limite)
+
+
+class ControleFluxo:
+    """
+    Controle de fluxo de um endpoint e prestador: token bucket, limite adaptativo e métricas.
+
+    Métodos:
+    - executar: Executa uma requisição respeitando a taxa e o limite de concorrência.
+    - retentativa: Aguarda a taxa antes de uma retentativa da requisição em andamento.
+    - metricas: Estado atual do controle.
+    """
+    def __init__(self, taxa=None, rajada=None, limitador=None):
+        taxa = SOAP_TAXA if taxa is None else taxa
+        self.bucket = TokenBucket(taxa, rajada or SOAP_RAJADA)
+        self.limitador = limitador or AdaptiveLimiter()
+        self.requisicoes = 0
+        self.sobrecargas = 0
+        self._latencia_media = None
+        self._instantes = deque()
+        self._lock = threading.Lock()
+
+    def executar(self, requisicao, sobrecarga=None):
+        """
+        Executa uma requisição.
+
+        Parâmetros:
+            requisicao (callable): Função sem argumentos que faz a requisição e retorna a resposta.
+            sobrecarga (tuple): Exceções tratadas como sinal de sobrecarga (timeouts, conexão).
+
+        Retorna:
+            requests.Response: Resposta da requisição.
+        """
+        self.bucket.adquirir()
+        self.limitador.adquirir()
+        anterior = getattr(_execucao, 'controle', None)
+        _execucao.controle = self
+        inicio = time.perf_counter()
+        try:
+            response = requisicao()
+        except sobrecarga or ():
+            self._registrar(None, True)
+            raise
+        except BaseException:
+            self._registrar(None, False)
+            raise
+        finally:
+            _execucao.controle = anterior
+        self._registrar(time.perf_counter() - inicio, sobrecarregado(response))
+        return response
+
+    def retentativa(self):
+        """
+        Consome um token do bucket antes de uma retentativa da requisição em andamento (aguardando
+        a reposição se necessário) e a conta na taxa observada. A requisição continua com a vaga
+        do limite de concorrência obtida em executar.
+        """
+        self.bucket.adquirir()
+        with self._lock:
+            self.requisicoes += 1
+            self._instantes.append(time.monotonic())
+
+    def _registrar(self, latencia, sobrecarga):
+        self.limitador.liberar(None if sobrecarga else latencia, sobrecarga)
+        agora = time.monotonic()
+        with self._lock:
+            self.requisicoes += 1
+            self.sobrecargas += sobrecarga
+            if latencia is not None:
+                self._latencia_media = latencia if self._latencia_media is None else \
+                    self._latencia_media + (latencia - self._latencia_media) * 0.1
+            self._instantes.append(agora)
+            while self._instantes and self._instantes[0] < agora - JANELA_TAXA:
+                self._instantes.popleft()
+
+    def metricas(self):
+        """
+        Retorna a taxa observada (req/s nos últimos JANELA_TAXA segundos), a taxa configurada, o
+        limite de concorrência, as requisições em andamento e a latência média e de base (s).
+        """
+        agora = time.monotonic()
+        with self._lock:
+            recentes = sum(1 for instante in self._instantes if instante >= agora - JANELA_TAXA)
+            latencia_media = self._latencia_media
+            requisicoes, sobrecargas = self.requisicoes, self.sobrecargas
+        limitador = self.limitador
+        return {
+            'taxa': round(recentes / JANELA_TAXA, 2),
+            'taxa_maxima': self.bucket.taxa or None,
+            'concorrencia': int(limitador.limite),
+            'em_uso': limitador.em_uso,
+            'latencia_media': round(latencia_media, 4) if latencia_media is not None else None,
+            'latencia_base': round(limitador.latencia_base, 4) if limitador.latencia_base is not None else None,
+            'requisicoes': requisicoes,
+            'sobrecargas': sobrecargas,
+            'reducoes': limitador.reducoes,
+        }
+
+
+_controles = {}
+_lock = threading.Lock()
+
+
+def get_controle(endpoint, prestador=None):
+    """
+    Retorna o controle de fluxo de um endpoint e prestador, criando-o na primeira chamada.
+
+    Parâmetros:
+        endpoint (str): Chave do endpoint (esquema e host, ver endpoints.chave_endpoint).
+        prestador (str): CNPJ do prestador (default: controle compartilhado do endpoint).
+    """
+    chave = (endpoint, prestador)
+    controle = _controles.get(chave)
+    if controle is None:
+        with _lock:
+            controle = _controles.get(chave)
+            if controle is None:
+                controle = _controles[chave] = ControleFluxo()
+    return controle
+
+
+def controle_atual():
+    """
+    Retorna o controle de fluxo da requisição em andamento na thread (dentro de
+    ControleFluxo.executar) ou None.
+    """
+    return getattr(_execucao, 'controle', None)
+
+
+def metricas():
+    """
+    Retorna as métricas de todos os controles de fluxo, por endpoint e prestador.
+
+    Retorna:
+        list: Dicionários com 'endpoint', 'prestador' e as métricas de ControleFluxo.metricas.
+    """
+    with _lock:
+        controles = list(_controles.items())
+    return [{'endpoint': endpoint, 'prestador': prestador, **controle.metricas()}
+            for (endpoint, prestador), controle in sorted(controles, key=lambda item: (item[0][0], item[0][1] or ''))]
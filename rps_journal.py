@@ -0,0 +1,231 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+"""
+Módulo: rps_journal.py
+Descrição: Registro persistente dos RPS enviados, para retomar um envio interrompido.
+
+Cada RPS é identificado pelo CNPJ do prestador, pelo número do RPS e por um hash do seu conteúdo
+(dados do tomador, valor, descrição e tributação). O registro guarda em que ponto o RPS está:
+- enviado: o lote foi aceito e tem protocolo, mas a consulta ainda não retornou as NFS-e.
+- concluido: a consulta do protocolo retornou as NFS-e (número e código de verificação).
+- erro: o lote foi recusado pelo web service, no envio ou na consulta.
+- incerto: o envio falhou por comunicação (por exemplo, timeout de leitura) depois de a requisição
+  ter saído; o web service pode ter recebido o lote, e um novo envio do mesmo número de RPS seria
+  recusado ou emitiria a NFS-e em duplicidade.
+
+Ao processar novamente a mesma planilha (por exemplo, depois de uma queda do processo), os RPS
+concluídos não são reenviados: suas linhas de status são montadas a partir do registro. Os RPS
+enviados têm o protocolo consultado de novo, sem reenvio, e apenas os recusados e os ainda não
+enviados seguem para o web service. Os RPS incertos também não são reenviados: ficam sinalizados
+para conferência manual até serem reconciliados (reconciliar). Um RPS cujo conteúdo mudou tem
+outro hash e é tratado como novo.
+
+O registro é um banco SQLite em modo WAL, compartilhado entre os processos da mesma máquina.
+
+Configuração (variáveis de ambiente):
+- RPS_JOURNAL: Caminho do banco SQLite; vazio desativa o registro (default: rps_journal.db).
+
+Dependências:
+- sqlite3
+"""
+
+RPS_JOURNAL = os.getenv('RPS_JOURNAL', 'rps_journal.db')
+
+ESTADO_ENVIADO = 'enviado'
+ESTADO_CONCLUIDO = 'concluido'
+ESTADO_ERRO = 'erro'
+ESTADO_INCERTO = 'incerto'
+
+# Campos do RPS que entram no hash do conteúdo (o número do RPS faz parte da chave)
+CAMPOS_HASH = (
+    'prestador_cnpj', 'prestador_inscricao', 'tomador_cnpj', 'tomador_razao_social', 'tomador_endereco',
+    'tomador_numero', 'tomador_bairro', 'tomador_codigo_municipio', 'tomador_uf', 'tomador_cep',
+    'valor_liquido_nfse', 'item_lista_servico', 'aliquota', 'codigo_cnae', 'descricao',
+)
+
+
+def hash_rps(kwargs):
+    """
+    Retorna o hash do conteúdo de um RPS.
+
+    Parâmetros:
+        kwargs (Rps | dict): Campos do RPS (ver rps_preparacao.Rps).
+
+    Retorna:
+        str: Hash SHA-1 (hexadecimal) dos campos de CAMPOS_HASH.
+    """
+    conteudo = '\x1f'.join(str(kwargs.get(campo, '')) for campo in CAMPOS_HASH)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+
+class RegistroRps:
+    """
+    Situação registrada de um RPS.
+    """
+    __slots__ = ('estado', 'protocolo', 'status', 'nfse', 'codigo_verificacao')
+
+    def __init__(self, estado, protocolo=None, status=None, nfse=None, codigo_verificacao=None):
+        self.estado = estado
+        self.protocolo = protocolo
+        self.status = status
+        self.nfse = nfse
+        self.codigo_verificacao = codigo_verificacao
+
+    @property
+    def pendente(self):
+        """
+        Indica se o RPS deve ser enviado novamente (lote recusado).
+        """
+        return self.estado == ESTADO_ERRO
+
+    def __repr__(self):
+        return f"RegistroRps({self.estado!r}, protocolo={self.protocolo!r}, nfse={self.nfse!r})"
+
+
+class RpsJournal:
+    """
+    Registro dos RPS enviados em SQLite.
+
+    Cada thread usa sua própria conexão; o modo WAL permite leituras concorrentes às escritas.
+
+    Métodos:
+    - carregar: Situação dos RPS de um prestador.
+    - registrar_envio: Registra o resultado do envio de um lote.
+    - registrar_consulta: Registra o resultado da consulta de um protocolo.
+    - reconciliar: Resolve manualmente a situação de um RPS incerto.
+    """
+    def __init__(self, caminho=None):
+        self.caminho = caminho or RPS_JOURNAL
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS rps (
+                    cnpj TEXT NOT NULL,
+                    numero_rps TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    protocolo TEXT,
+                    status TEXT,
+                    nfse TEXT,
+                    codigo_verificacao TEXT,
+                    atualizado_em REAL,
+                    PRIMARY KEY (cnpj, numero_rps, hash)
+                );
+                CREATE INDEX IF NOT EXISTS idx_rps_protocolo ON rps (cnpj, protocolo);
+            """)
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+        return conexao
+
+    def carregar(self, cnpj):
+        """
+        Retorna a situação de todos os RPS registrados de um prestador.
+
+        Parâmetros:
+            cnpj (str): CNPJ do prestador.
+
+        Retorna:
+            dict: {(número do RPS (str), hash do conteúdo): RegistroRps}.
+        """
+        rows = self._conexao().execute('SELECT numero_rps, hash, estado, protocolo, status, nfse, codigo_verificacao '
+                                       'FROM rps WHERE cnpj = ?', (cnpj,))
+        return {(numero_rps, hash_conteudo): RegistroRps(*dados) for numero_rps, hash_conteudo, *dados in rows}
+
+    def registrar_envio(self, cnpj, itens, protocolo, status, incerto=False):
+        """
+        Registra o resultado do envio de um lote.
+
+        Parâmetros:
+            cnpj (str): CNPJ do prestador.
+            itens (iterable): Pares (número do RPS, hash do conteúdo) dos RPS do lote.
+            protocolo (str): Protocolo do lote (None se o lote foi recusado ou não houve resposta).
+            status (str): Status das linhas do lote.
+            incerto (bool): Sem protocolo por falha de comunicação depois de a requisição ter saído
+                (o lote pode ter sido recebido); registrado como ESTADO_INCERTO, e não como erro.
+        """
+        if protocolo is not None:
+            estado = ESTADO_ENVIADO
+        else:
+            estado = ESTADO_INCERTO if incerto else ESTADO_ERRO
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.executemany(
+                'INSERT OR REPLACE INTO rps (cnpj, numero_rps, hash, estado, protocolo, status, atualizado_em) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(cnpj, str(numero_rps), hash_conteudo, estado, protocolo, status, agora)
+                 for numero_rps, hash_conteudo in itens])
+
+    def registrar_consulta(self, cnpj, protocolo, status, resposta_consulta, nfses=None):
+        """
+        Registra o resultado definitivo da consulta de um protocolo.
+
+        Se a consulta não chegou a um resultado definitivo (lote ainda em processamento ou falha de
+        comunicação), os RPS continuam como enviados e o protocolo é consultado de novo na próxima
+        execução.
+
+        Parâmetros:
+            cnpj (str): CNPJ do prestador.
+            protocolo (str): Protocolo do lote.
+            status (str): Status de verificação das linhas.
+            resposta_consulta (RespostaConsulta): Última resposta da consulta (ou None).
+            nfses (dict): {número do RPS (str): (número da NFS-e, código de verificação)} (opcional).
+        """
+        if resposta_consulta is None or resposta_consulta.erro_analise is not None:
+            return
+        if resposta_consulta.lista_nfse:
+            estado = ESTADO_CONCLUIDO
+        elif resposta_consulta.mensagens:
+            estado = ESTADO_ERRO
+        else:
+            return
+
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute('UPDATE rps SET estado = ?, status = ?, atualizado_em = ? WHERE cnpj = ? AND protocolo = ?',
+                            (estado, status, agora, cnpj, protocolo))
+            if nfses:
+                conexao.executemany('UPDATE rps SET nfse = ?, codigo_verificacao = ? '
+                                    'WHERE cnpj = ? AND protocolo = ? AND numero_rps = ?',
+                                    [(nfse, codigo, cnpj, protocolo, numero_rps)
+                                     for numero_rps, (nfse, codigo) in nfses.items()])
+
+    def reconciliar(self, cnpj, numero_rps, protocolo=None):
+        """
+        Resolve a situação de RPS incertos depois da conferência no portal da prefeitura.
+
+        Parâmetros:
+            cnpj (str): CNPJ do prestador.
+            numero_rps (str): Número do RPS.
+            protocolo (str): Protocolo do lote, se o web service o recebeu: o RPS volta a ser
+                enviado e o protocolo é consultado na próxima execução. Sem protocolo, o RPS é
+                marcado como recusado e enviado de novo na próxima execução.
+
+        Retorna:
+            int: Quantidade de registros atualizados.
+        """
+        estado = ESTADO_ENVIADO if protocolo is not None else ESTADO_ERRO
+        with self._conexao() as conexao:
+            cursor = conexao.execute('UPDATE rps SET estado = ?, protocolo = ?, atualizado_em = ? '
+                                     'WHERE cnpj = ? AND numero_rps = ? AND estado = ?',
+                                     (estado, protocolo, time.time(), cnpj, str(numero_rps), ESTADO_INCERTO))
+            return cursor.rowcount
+
+
+def criar_journal():
+    """
+    Cria o registro de RPS configurado em RPS_JOURNAL.
+
+    Retorna:
+        RpsJournal: Registro em SQLite, ou None se RPS_JOURNAL estiver vazio.
+    """
+    return RpsJournal() if RPS_JOURNAL else None
@@ -0,0 +1,153 @@
+import pandas as pd
+from directory import lista
+from data_validation import normalize_cnpj_serie, normalize_valor_serie, normalize_cep_serie
+
+"""
+Módulo: rps_preparacao.py
+Descrição: Preparação vetorizada dos RPS de uma aba, antes da geração dos envelopes.
+
+Substitui a montagem linha a linha (df.iterrows, um dicionário de campos por linha e as regras de
+alíquota, item da lista de serviço e CNAE reavaliadas a cada RPS) por uma etapa por aba:
+- As constantes da aba (alíquota, item da lista de serviço, CNAE) são calculadas uma única vez.
+- As colunas são limpas de uma vez com operações do pandas: CNPJ/CPF do tomador apenas com
+  dígitos, valores no formato decimal padrão, CEP com 8 dígitos e a numeração sequencial dos RPS.
+- Cada linha vira um registro compacto (Rps, com __slots__) entregue ao gerador de envelopes.
+
+Funcionalidades:
+- Constantes de tributação por aba.
+- Preparação dos registros de RPS de um DataFrame (aba inteira ou bloco).
+
+Dependências:
+- pandas
+- data_validation (normalizações vetorizadas)
+"""
+
+# Alíquota de ISS por aba; as demais abas usam ALIQUOTA_PADRAO
+ALIQUOTAS = {'simply': 0.0253, 'dm': 0.0414}
+ALIQUOTA_PADRAO = 0.05
+
+# Código CNAE por aba; as demais abas usam CNAE_PADRAO
+CODIGOS_CNAE = {'consultoria': '8219999'}
+CNAE_PADRAO = '0'
+
+
+class Rps:
+    """
+    Campos de um RPS, na forma usada pelo gerador de envelopes.
+
+    Os campos podem ser lidos como atributos ou como chaves (rps['valor_rps'], render_inf_rps(**rps)),
+    com os mesmos nomes dos parâmetros de SoapRequestGenerator.create_soap_request; 'aba' identifica
+    a aba de origem.
+    """
+    __slots__ = ('cnpj', 'inscricao_municipal', 'valor_rps', 'prestador_cnpj', 'prestador_inscricao',
+                 'tomador_cnpj', 'tomador_razao_social', 'tomador_endereco', 'tomador_numero', 'tomador_bairro',
+                 'tomador_codigo_municipio', 'tomador_uf', 'tomador_cep', 'valor_liquido_nfse',
+                 'item_lista_servico', 'aliquota', 'codigo_cnae', 'descricao', 'aba')
+
+    def __init__(self, cnpj, inscricao_municipal, valor_rps, tomador_cnpj, tomador_razao_social, tomador_endereco,
+                 tomador_numero, tomador_bairro, tomador_codigo_municipio, tomador_uf, tomador_cep,
+                 valor_liquido_nfse, item_lista_servico, aliquota, codigo_cnae, descricao, aba=None):
+        self.cnpj = cnpj
+        self.inscricao_municipal = inscricao_municipal
+        self.valor_rps = valor_rps
+        self.prestador_cnpj = cnpj
+        self.prestador_inscricao = inscricao_municipal
+        self.tomador_cnpj = tomador_cnpj
+        self.tomador_razao_social = tomador_razao_social
+        self.tomador_endereco = tomador_endereco
+        self.tomador_numero = tomador_numero
+        self.tomador_bairro = tomador_bairro
+        self.tomador_codigo_municipio = tomador_codigo_municipio
+        self.tomador_uf = tomador_uf
+        self.tomador_cep = tomador_cep
+        self.valor_liquido_nfse = valor_liquido_nfse
+        self.item_lista_servico = item_lista_servico
+        self.aliquota = aliquota
+        self.codigo_cnae = codigo_cnae
+        self.descricao = descricao
+        self.aba = aba
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except (AttributeError, TypeError):
+            raise KeyError(campo) from None
+
+    def get(self, campo, default=None):
+        return getattr(self, campo, default)
+
+    def __repr__(self):
+        return f"Rps({self.valor_rps!r}, tomador={self.tomador_cnpj!r}, valor={self.valor_liquido_nfse!r})"
+
+
+def constantes_aba(sheet_name):
+    """
+    Retorna as constantes de tributação de uma aba.
+
+    Parâmetros:
+        sheet_name (str): Nome da aba.
+
+    Retorna:
+        tuple: (alíquota, item da lista de serviço, código CNAE).
+
+    Exemplo:
+        >>> constantes_aba('simply')[0]
+        0.0253
+    """
+    return (ALIQUOTAS.get(sheet_name, ALIQUOTA_PADRAO), lista.get(sheet_name, ['0'])[0],
+            CODIGOS_CNAE.get(sheet_name, CNAE_PADRAO))
+
+
+def primeiro_rps(df):
+    """
+    Retorna o número do RPS da primeira linha de uma aba: o valor da coluna 'rps' ou 1, se a aba
+    não tiver essa coluna. As linhas seguintes são numeradas em sequência a partir dele.
+    """
+    return int(df.iloc[0]['rps']) if 'rps' in df.columns else 1
+
+
+def _coluna(df, nome):
+    if nome in df.columns:
+        return df[nome]
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def preparar_rps(df, sheet_name, cnpj_prestador, inscricao_municipal_prestador, rps_inicial):
+    """
+    Prepara os registros de RPS das linhas de uma aba (ou de um bloco de uma aba).
+
+    Parâmetros:
+        df (pandas.DataFrame): Linhas da aba, já preenchidas com os códigos de município.
+        sheet_name (str): Nome da aba (define a alíquota, o item da lista de serviço e o CNAE).
+        cnpj_prestador (str): CNPJ do prestador da aba.
+        inscricao_municipal_prestador (str): Inscrição municipal do prestador da aba.
+        rps_inicial (int): Número do RPS da primeira linha; as seguintes são numeradas em sequência.
+
+    Retorna:
+        list: Registros Rps, na ordem das linhas.
+    """
+    aliquota, item_lista_servico, codigo_cnae = constantes_aba(sheet_name)
+    quantidade = len(df)
+
+    colunas = (
+        range(rps_inicial, rps_inicial + quantidade),
+        normalize_cnpj_serie(_coluna(df, 'cnpj')).tolist(),
+        _coluna(df, 'razao').tolist(),
+        _coluna(df, 'logradouro').tolist(),
+        _coluna(df, 'numero').tolist(),
+        _coluna(df, 'bairro').tolist(),
+        _coluna(df, 'municipio').tolist(),
+        _coluna(df, 'uf').tolist(),
+        normalize_cep_serie(_coluna(df, 'cep')).tolist(),
+        normalize_valor_serie(_coluna(df, 'valor')).tolist(),
+        _coluna(df, 'descricao').tolist(),
+    )
+    return [
+        Rps(cnpj_prestador, inscricao_municipal_prestador, valor_rps, tomador_cnpj, razao, endereco, numero,
+            bairro, municipio, uf, cep, valor, item_lista_servico, aliquota, codigo_cnae, descricao, sheet_name)
+        for valor_rps, tomador_cnpj, razao, endereco, numero, bairro, municipio, uf, cep, valor, descricao
+        in zip(*colunas)
+    ]
@@ -0,0 +1,171 @@
+import datetime
+from xml_serializer import escapar_texto, formatar_decimal, CASAS_ALIQUOTA
+
+"""
+Módulo: rps_template.py
+Descrição: Geração dos fragmentos XML de RPS (InfRps) e dos envelopes de lote (LoteRps).
+
+Os fragmentos são montados com f-strings: o texto fixo faz parte do código e, na renderização,
+apenas os campos variáveis são formatados e concatenados. Os lotes são montados diretamente a
+partir dos fragmentos InfRps, sem gerar um envelope completo por RPS e recortá-lo depois.
+
+Funcionalidades:
+- Renderização do elemento InfRps de um RPS.
+- Renderização do envelope SOAP do RecepcionarLoteRps com um ou mais RPS.
+
+Os valores são serializados na renderização (xml_serializer): os textos são escapados uma única
+vez aqui e devem chegar sem escape; os valores e a alíquota saem com casas decimais fixas.
+
+Dependências:
+- xml_serializer (escape e formatação dos campos)
+"""
+
+
+def render_inf_rps(valor_liquido_nfse, descricao, valor_rps, item_lista_servico, aliquota, codigo_cnae,
+                   data_emissao=None, **kwargs):
+    """
+    Renderiza o conteúdo do elemento InfRps de um RPS.
+
+    Recebe os mesmos parâmetros de SoapRequestGenerator.create_soap_request e produz o mesmo
+    conteúdo de InfRps. Os campos de texto devem ser passados sem escape.
+
+    Parâmetros:
+        valor_liquido_nfse (float): Valor líquido da nota fiscal.
+        descricao (str): Descrição do serviço.
+        valor_rps (int): Número do RPS.
+        item_lista_servico (str): Código do serviço.
+        aliquota (float): Alíquota aplicada.
+        codigo_cnae (int): Código CNAE do serviço.
+        data_emissao (str): Data de emissão no formato AAAA-MM-DDTHH:MM:SS (default: agora).
+        kwargs (dict): Demais campos do prestador e do tomador.
+
+    Retorna:
+        str: Conteúdo XML do elemento InfRps.
+    """
+    if data_emissao is None:
+        data_emissao = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+    tomador_cpf_cnpj = escapar_texto(kwargs.get('tomador_cnpj', '')).replace('.', '').replace('-', '').replace('/', '')
+    if len(tomador_cpf_cnpj) == 11:
+        cpf_cnpj_tag = f"<Cpf>{tomador_cpf_cnpj}</Cpf>"
+    else:
+        cpf_cnpj_tag = f"<Cnpj>{tomador_cpf_cnpj}</Cnpj>"
+
+    valor_liquido = formatar_decimal(valor_liquido_nfse)
+    base_calculo = kwargs.get('base_calculo')
+    base_calculo = valor_liquido if base_calculo is None else formatar_decimal(base_calculo)
+    aliquota = formatar_decimal(aliquota, CASAS_ALIQUOTA)
+    item_lista_servico = escapar_texto(item_lista_servico)
+    codigo_cnae = escapar_texto(codigo_cnae)
+    codigo_tributacao = kwargs.get('CodigoTributacaoMunicipio')
+    descricao = escapar_texto(descricao)
+    prestador_cnpj = escapar_texto(kwargs.get('prestador_cnpj', ''))
+    prestador_inscricao = escapar_texto(kwargs.get('prestador_inscricao', ''))
+    razao_social = escapar_texto(kwargs.get('tomador_razao_social', ''))
+    endereco = escapar_texto(kwargs.get('tomador_endereco', ''))
+    numero_endereco = escapar_texto(kwargs.get('tomador_numero', ''))
+    bairro = escapar_texto(kwargs.get('tomador_bairro', ''))
+    codigo_municipio = escapar_texto(kwargs.get('tomador_codigo_municipio', ''))
+    uf = escapar_texto(kwargs.get('tomador_uf', ''))
+    cep = escapar_texto(kwargs.get('tomador_cep', ''))
+
+    return f"""
+                <IdentificacaoRps>
+                  <Numero>{valor_rps}</Numero>
+                  <Serie>1</Serie>
+                  <Tipo>1</Tipo>
+                </IdentificacaoRps>
+                <DataEmissao>{data_emissao}</DataEmissao>
+                <NaturezaOperacao>1</NaturezaOperacao>
+                <OptanteSimplesNacional>1</OptanteSimplesNacional>
+                <IncentivadorCultural>2</IncentivadorCultural>
+                <Status>1</Status>
+                <Servico>
+                  <Valores>
+                    <ValorServicos>{valor_liquido}</ValorServicos>
+                    <ValorDeducoes>0</ValorDeducoes>
+                    <ValorPis>0</ValorPis>
+                    <ValorCofins>0</ValorCofins>
+                    <ValorInss>0</ValorInss>
+                    <ValorIr>0</ValorIr>
+                    <ValorCsll>0</ValorCsll>
+                    <IssRetido>2</IssRetido>
+                    <ValorIss>0</ValorIss>
+                    <ValorIssRetido>0</ValorIssRetido>
+                    <OutrasRetencoes>0</OutrasRetencoes>
+                    <BaseCalculo>{base_calculo}</BaseCalculo>
+                    <Aliquota>{aliquota}</Aliquota>
+                    <ValorLiquidoNfse>{valor_liquido}</ValorLiquidoNfse>
+                    <DescontoIncondicionado>0</DescontoIncondicionado>
+                    <DescontoCondicionado>0</DescontoCondicionado>
+                  </Valores>
+                  <ItemListaServico>{item_lista_servico}</ItemListaServico>
+                  <CodigoCnae>{codigo_cnae}</CodigoCnae>
+                  <CodigoTributacaoMunicipio>{codigo_tributacao}</CodigoTributacaoMunicipio>
+                  <Discriminacao>{descricao}</Discriminacao>
+                  <CodigoMunicipio>4106902</CodigoMunicipio>
+                </Servico>
+                <Prestador>
+                  <Cnpj>{prestador_cnpj}</Cnpj>
+                  <InscricaoMunicipal>{prestador_inscricao}</InscricaoMunicipal>
+                </Prestador>
+                <Tomador>
+                  <IdentificacaoTomador>
+                    <CpfCnpj>
+                      {cpf_cnpj_tag}
+                    </CpfCnpj>
+                  </IdentificacaoTomador>
+                  <RazaoSocial>{razao_social}</RazaoSocial>
+                  <Endereco>
+                    <Endereco>{endereco}</Endereco>
+                    <Numero>{numero_endereco}</Numero>
+                    <Bairro>{bairro}</Bairro>
+                    <CodigoMunicipio>{codigo_municipio}</CodigoMunicipio>
+                    <Uf>{uf}</Uf>
+                    <Cep>{cep}</Cep>
+                  </Endereco>
+                  <Contato>
+                    <Email>financeiro@scryta.com.br</Email>
+                  </Contato>
+                </Tomador>
+              """
+
+
+def render_lote(numero_lote, cnpj, inscricao_municipal, lista_inf_rps):
+    """
+    Renderiza o envelope SOAP de um LoteRps a partir dos fragmentos InfRps.
+
+    Parâmetros:
+        numero_lote (int): Número do lote.
+        cnpj (str): CNPJ do prestador.
+        inscricao_municipal (str): Inscrição municipal do prestador.
+        lista_inf_rps (list): Conteúdo do elemento InfRps de cada RPS do lote.
+
+    Retorna:
+        str: Envelope SOAP do lote.
+    """
+    cnpj = escapar_texto(cnpj)
+    inscricao_municipal = escapar_texto(inscricao_municipal)
+    lista_rps = ''.join([f"""
+            <Rps>
+              <InfRps>{inf_rps}</InfRps>
+            </Rps>""" for inf_rps in lista_inf_rps])
+
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+                xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <RecepcionarLoteRps xmlns="https://www.e-governeapps2.com.br/">
+      <EnviarLoteRpsEnvio>
+        <LoteRps>
+          <NumeroLote>{numero_lote}</NumeroLote>
+          <Cnpj>{cnpj}</Cnpj>
+          <InscricaoMunicipal>{inscricao_municipal}</InscricaoMunicipal>
+          <QuantidadeRps>{len(lista_inf_rps)}</QuantidadeRps>
+          <ListaRps>{lista_rps}
+          </ListaRps>
+        </LoteRps>
+      </EnviarLoteRpsEnvio>
+    </RecepcionarLoteRps>
+  </soap:Body>
+</soap:Envelope>"""
@@ -0,0 +1,259 @@
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+"""
+Módulo: soap_response.py
+Descrição: Análise incremental das respostas SOAP do RecepcionarLoteRps e do ConsultarLoteRps.
+
+As respostas são lidas com ElementTree.iterparse diretamente do fluxo HTTP: cada elemento é
+tratado assim que termina, os já processados são descartados e a leitura é interrompida assim que
+a resposta está determinada (Protocolo recebido, ListaNfse ou ListaMensagemRetorno completas).
+O resultado é um objeto com os dados da resposta (protocolo, NFS-e emitidas com número e código
+de verificação, mensagens de retorno com código), em vez de apenas um texto de status.
+
+Funcionalidades:
+- Análise da resposta do envio de lote (protocolo ou mensagens de erro).
+- Análise da resposta da consulta de lote (NFS-e emitidas ou mensagens de erro).
+- Leitura de respostas HTTP em streaming, devolvendo a conexão ao pool ao final.
+
+Dependências:
+- xml.etree.ElementTree (iterparse)
+"""
+
+STATUS_SUCESSO = "Sucesso: NFS-e encontradas"
+STATUS_ERRO = "Erro: Mensagens de retorno encontradas"
+STATUS_NAO_ENCONTRADO = "Status não encontrado"
+STATUS_ERRO_ANALISE = "Erro ao analisar a resposta"
+
+
+class MensagemRetorno:
+    """
+    Mensagem de retorno do web service (código, mensagem e correção sugerida).
+    """
+    __slots__ = ('codigo', 'mensagem', 'correcao')
+
+    def __init__(self, codigo=None, mensagem=None, correcao=None):
+        self.codigo = codigo
+        self.mensagem = mensagem
+        self.correcao = correcao
+
+    def __str__(self):
+        return f"{self.codigo} - {self.mensagem}" if self.codigo else str(self.mensagem)
+
+    def __repr__(self):
+        return f"MensagemRetorno({self.codigo!r}, {self.mensagem!r})"
+
+
+class Nfse:
+    """
+    NFS-e emitida: número, código de verificação e número do RPS que a originou.
+    """
+    __slots__ = ('numero', 'codigo_verificacao', 'numero_rps')
+
+    def __init__(self, numero=None, codigo_verificacao=None, numero_rps=None):
+        self.numero = numero
+        self.codigo_verificacao = codigo_verificacao
+        self.numero_rps = numero_rps
+
+    def __repr__(self):
+        return f"Nfse({self.numero!r}, {self.codigo_verificacao!r}, rps={self.numero_rps!r})"
+
+
+class RespostaEnvio:
+    """
+    Resultado do RecepcionarLoteRps.
+
+    Atributos:
+    - protocolo: Protocolo do lote (None se o lote foi recusado).
+    - numero_lote / data_recebimento: Dados do recebimento, quando informados.
+    - mensagens: Lista de MensagemRetorno (erros de validação ou SOAP Fault).
+    - erro_analise: Descrição do erro quando a resposta não é um XML válido.
+    """
+    __slots__ = ('protocolo', 'numero_lote', 'data_recebimento', 'mensagens', 'erro_analise')
+
+    def __init__(self):
+        self.protocolo = None
+        self.numero_lote = None
+        self.data_recebimento = None
+        self.mensagens = []
+        self.erro_analise = None
+
+    @property
+    def sucesso(self):
+        return self.protocolo is not None
+
+    def descricao_erro(self):
+        """
+        Retorna o texto do erro do envio (mensagens de retorno ou erro de análise).
+        """
+        if self.mensagens:
+            return "; ".join(str(mensagem) for mensagem in self.mensagens)
+        if self.erro_analise:
+            return f"resposta inválida do web service ({self.erro_analise})"
+        return "resposta sem protocolo"
+
+
+class RespostaConsulta:
+    """
+    Resultado do ConsultarLoteRps.
+
+    Atributos:
+    - nfses: Lista de Nfse emitidas para o lote.
+    - mensagens: Lista de MensagemRetorno.
+    - lista_nfse: Indica se a resposta continha ListaNfse.
+    - erro_analise: Descrição do erro quando a resposta não é um XML válido.
+    """
+    __slots__ = ('nfses', 'mensagens', 'lista_nfse', 'erro_analise')
+
+    def __init__(self):
+        self.nfses = []
+        self.mensagens = []
+        self.lista_nfse = False
+        self.erro_analise = None
+
+    @property
+    def status(self):
+        """
+        Texto de status do lote, no mesmo formato usado nas linhas de status.
+        """
+        if self.erro_analise is not None:
+            return STATUS_ERRO_ANALISE
+        if self.lista_nfse:
+            return STATUS_SUCESSO
+        if self.mensagens:
+            return f"{STATUS_ERRO}: " + "; ".join(str(mensagem) for mensagem in self.mensagens)
+        return STATUS_NAO_ENCONTRADO
+
+    def nfse_por_rps(self):
+        """
+        Retorna um dicionário {número do RPS: Nfse} com as NFS-e que identificam o RPS de origem.
+        """
+        return {nfse.numero_rps: nfse for nfse in self.nfses if nfse.numero_rps is not None}
+
+
+def _nome(tag):
+    return tag.rpartition('}')[2]
+
+
+def _texto(elemento, *caminho):
+    """
+    Texto do elemento descendente indicado pelos nomes locais dos filhos, ignorando namespaces.
+    """
+    for nome in caminho:
+        for filho in elemento:
+            if _nome(filho.tag) == nome:
+                elemento = filho
+                break
+        else:
+            return None
+    texto = (elemento.text or '').strip()
+    return texto or None
+
+
+def _fluxo(fonte):
+    if isinstance(fonte, str):
+        fonte = fonte.encode('utf-8')
+    if isinstance(fonte, (bytes, bytearray)):
+        return BytesIO(fonte)
+    return fonte
+
+
+def _mensagem(elemento):
+    return MensagemRetorno(_texto(elemento, 'Codigo'), _texto(elemento, 'Mensagem'), _texto(elemento, 'Correcao'))
+
+
+def analisar_envio(fonte):
+    """
+    Analisa a resposta do RecepcionarLoteRps.
+
+    Parâmetros:
+        fonte (str | bytes | file): Resposta XML ou fluxo com o corpo da resposta.
+
+    Retorna:
+        RespostaEnvio: Protocolo ou mensagens de erro do envio.
+
+    Exemplo:
+        >>> analisar_envio(response_text).protocolo
+        '123456789'
+    """
+    resposta = RespostaEnvio()
+    try:
+        for _, elemento in ET.iterparse(_fluxo(fonte), events=('end',)):
+            nome = _nome(elemento.tag)
+            if nome == 'NumeroLote':
+                resposta.numero_lote = (elemento.text or '').strip()
+            elif nome == 'DataRecebimento':
+                resposta.data_recebimento = (elemento.text or '').strip()
+            elif nome == 'Protocolo':
+                resposta.protocolo = (elemento.text or '').strip()
+                break
+            elif nome == 'MensagemRetorno':
+                resposta.mensagens.append(_mensagem(elemento))
+                elemento.clear()
+            elif nome == 'ListaMensagemRetorno':
+                break
+            elif nome == 'Fault':
+                resposta.mensagens.append(MensagemRetorno(_texto(elemento, 'faultcode'),
+                                                          _texto(elemento, 'faultstring')))
+                break
+    except ET.ParseError as e:
+        resposta.erro_analise = str(e)
+    return resposta
+
+
+def analisar_consulta(fonte):
+    """
+    Analisa a resposta do ConsultarLoteRps.
+
+    Parâmetros:
+        fonte (str | bytes | file): Resposta XML ou fluxo com o corpo da resposta.
+
+    Retorna:
+        RespostaConsulta: NFS-e emitidas ou mensagens de retorno do lote.
+
+    Exemplo:
+        >>> analisar_consulta(response_text).status
+        'Sucesso: NFS-e encontradas'
+    """
+    resposta = RespostaConsulta()
+    try:
+        for _, elemento in ET.iterparse(_fluxo(fonte), events=('end',)):
+            nome = _nome(elemento.tag)
+            if nome == 'InfNfse':
+                resposta.nfses.append(Nfse(_texto(elemento, 'Numero'), _texto(elemento, 'CodigoVerificacao'),
+                                           _texto(elemento, 'IdentificacaoRps', 'Numero')))
+                elemento.clear()
+            elif nome == 'CompNfse':
+                elemento.clear()
+            elif nome == 'ListaNfse':
+                resposta.lista_nfse = True
+                break
+            elif nome == 'MensagemRetorno':
+                resposta.mensagens.append(_mensagem(elemento))
+                elemento.clear()
+            elif nome == 'ListaMensagemRetorno':
+                break
+    except ET.ParseError as e:
+        resposta.erro_analise = str(e)
+    return resposta
+
+
+def ler_resposta(response, analisar):
+    """
+    Analisa uma resposta HTTP obtida com stream=True à medida que o corpo é recebido.
+
+    Ao final, o restante do corpo é descartado sem análise e a conexão volta ao pool da sessão.
+
+    Parâmetros:
+        response (requests.Response): Resposta obtida com stream=True.
+        analisar (callable): analisar_envio ou analisar_consulta.
+
+    Retorna:
+        RespostaEnvio | RespostaConsulta: Resultado da análise.
+    """
+    response.raw.decode_content = True
+    try:
+        return analisar(response.raw)
+    finally:
+        response.raw.drain_conn()
+        response.raw.release_conn()
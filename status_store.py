@@ -0,0 +1,525 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from array import array
+from operator import attrgetter
+
+"""
+Módulo: status_store.py
+Descrição: Armazenamento das linhas de status dos uploads, separado por job.
+
+Substitui as listas globais do app por um repositório com duas implementações:
+- InMemoryStatusStore: em memória, para um único processo.
+- SQLiteStatusStore: em um banco SQLite compartilhado entre os workers (por exemplo, do gunicorn)
+  em uma mesma máquina.
+
+As linhas de status são registros ResultadoRps (dados do RPS/tomador, protocolo, status de
+verificação, número da NFS-e, código de verificação e aba de origem), guardados na ordem da
+planilha e indexados por número do RPS e por protocolo. Nas respostas JSON e no banco SQLite,
+cada registro é serializado como uma lista de 16 posições, na ordem de CAMPOS_RESULTADO (as
+posições INDICE_*).
+
+Cada gravação ou alteração de uma linha recebe um número de sequência crescente dentro do job, o
+que permite consultar apenas as linhas novas ou alteradas desde a última consulta (linhas_desde),
+em páginas e com filtros por status e por aba.
+
+O armazenamento em memória guarda os registros em uma lista por job e os números de sequência e
+os índices em arrays de inteiros, sem um objeto por linha além do próprio registro. Os jobs são
+descartados junto com os do JobManager (descartar_job), e as linhas sem protocolo (SEM_PROTOCOLO)
+não entram no índice por protocolo.
+
+Configuração (variáveis de ambiente):
+- STATUS_STORE: 'memoria' ou 'sqlite' (default: memoria).
+- STATUS_DB: Caminho do banco SQLite (default: status.db).
+
+Dependências:
+- sqlite3
+"""
+
+STATUS_STORE = os.getenv('STATUS_STORE', 'memoria').lower()
+STATUS_DB = os.getenv('STATUS_DB', 'status.db')
+
+# Campos de ResultadoRps, na ordem da lista serializada
+CAMPOS_RESULTADO = (
+    'rps', 'tomador_cnpj', 'tomador_razao_social', 'tomador_endereco', 'tomador_numero',
+    'tomador_codigo_municipio', 'tomador_uf', 'tomador_cep', 'tomador_bairro', 'valor', 'descricao',
+    'protocolo', 'status', 'nfse', 'codigo_verificacao', 'aba',
+)
+
+# Protocolo das linhas cujo lote não foi aceito pelo web service (erro de envio ou de validação)
+SEM_PROTOCOLO = 'N/A'
+
+# Posições dos campos na lista serializada
+INDICE_RPS = 0
+INDICE_PROTOCOLO = 11
+INDICE_STATUS = 12
+INDICE_NFSE = 13
+INDICE_CODIGO_VERIFICACAO = 14
+INDICE_ABA = 15
+
+
+class ResultadoRps:
+    """
+    Resultado do envio de um RPS: dados exibidos do tomador, protocolo do lote, status de
+    verificação, NFS-e emitida e aba de origem.
+
+    Os campos são os de CAMPOS_RESULTADO; para JSON e para o banco SQLite o registro é convertido
+    em lista com para_lista e reconstruído com de_lista.
+    """
+    __slots__ = CAMPOS_RESULTADO
+
+    _valores = attrgetter(*CAMPOS_RESULTADO)
+
+    def __init__(self, rps, tomador_cnpj, tomador_razao_social, tomador_endereco, tomador_numero,
+                 tomador_codigo_municipio, tomador_uf, tomador_cep, tomador_bairro, valor, descricao,
+                 protocolo, status, nfse=None, codigo_verificacao=None, aba=None):
+        self.rps = rps
+        self.tomador_cnpj = tomador_cnpj
+        self.tomador_razao_social = tomador_razao_social
+        self.tomador_endereco = tomador_endereco
+        self.tomador_numero = tomador_numero
+        self.tomador_codigo_municipio = tomador_codigo_municipio
+        self.tomador_uf = tomador_uf
+        self.tomador_cep = tomador_cep
+        self.tomador_bairro = tomador_bairro
+        self.valor = valor
+        self.descricao = descricao
+        self.protocolo = protocolo
+        self.status = status
+        self.nfse = nfse
+        self.codigo_verificacao = codigo_verificacao
+        self.aba = aba
+
+    @classmethod
+    def de_rps(cls, rps, protocolo, status, nfse=None, codigo_verificacao=None):
+        """
+        Monta o resultado de um RPS preparado (rps_preparacao.Rps).
+        """
+        return cls(rps.valor_rps, rps.tomador_cnpj, rps.tomador_razao_social, rps.tomador_endereco,
+                   rps.tomador_numero, rps.tomador_codigo_municipio, rps.tomador_uf, rps.tomador_cep,
+                   rps.tomador_bairro, rps.valor_liquido_nfse, rps.descricao, protocolo, status, nfse,
+                   codigo_verificacao, rps.aba)
+
+    @classmethod
+    def de_lista(cls, valores):
+        """
+        Reconstrói um resultado a partir da lista serializada (listas antigas, sem a aba, também
+        são aceitas).
+        """
+        return cls(*valores[:len(CAMPOS_RESULTADO)])
+
+    def para_lista(self):
+        """
+        Retorna os campos como lista, na ordem de CAMPOS_RESULTADO.
+        """
+        return list(self._valores(self))
+
+    def copia(self):
+        return ResultadoRps(*self._valores(self))
+
+    def __repr__(self):
+        return f"ResultadoRps({self.rps!r}, protocolo={self.protocolo!r}, status={self.status!r})"
+
+
+class StatusStore:
+    """
+    Interface do armazenamento de status.
+
+    Métodos:
+    - criar_job: Registra um novo job.
+    - ultimo_job: Identificador do job mais recente.
+    - info_job: Nome e caminho do arquivo de um job.
+    - adicionar_linhas: Grava resultados a partir de uma posição da planilha.
+    - atualizar_status: Atualiza o status de todas as linhas de um protocolo e as NFS-e emitidas.
+    - linhas: Linhas de um job, na ordem da planilha.
+    - buscar_por_rps / buscar_por_protocolo: Consultas indexadas.
+    - resumo_job: Contagem de linhas totais e pendentes de um job.
+    - linhas_desde: Linhas gravadas ou alteradas após um número de sequência (consulta incremental).
+    - descartar_job: Libera as linhas de um job que deixou de ser retido.
+    """
+    def criar_job(self, job_id, arquivo, caminho):
+        raise NotImplementedError
+
+    def descartar_job(self, job_id):
+        """
+        Libera as linhas de um job descartado pelo JobManager. Os armazenamentos persistentes
+        (SQLite) mantêm o histórico e não fazem nada.
+        """
+
+    def ultimo_job(self):
+        raise NotImplementedError
+
+    def info_job(self, job_id):
+        raise NotImplementedError
+
+    def adicionar_linhas(self, job_id, posicao_inicial, linhas):
+        """
+        Grava os resultados (ResultadoRps) a partir de uma posição da planilha.
+        """
+        raise NotImplementedError
+
+    def atualizar_status(self, job_id, protocolo, status, nfses=None):
+        """
+        Atualiza o status das linhas de um protocolo.
+
+        Parâmetros:
+            job_id (str): Identificador do job.
+            protocolo (str): Protocolo do lote.
+            status (str): Novo status de verificação.
+            nfses (dict): {número do RPS (str): (número da NFS-e, código de verificação)} (opcional).
+        """
+        raise NotImplementedError
+
+    def linhas(self, job_id):
+        """
+        Retorna cópias dos resultados (ResultadoRps) de um job, na ordem da planilha.
+        """
+        raise NotImplementedError
+
+    def buscar_por_rps(self, job_id, numero_rps):
+        raise NotImplementedError
+
+    def buscar_por_protocolo(self, protocolo):
+        raise NotImplementedError
+
+    def resumo_job(self, job_id, status_pendente):
+        """
+        Retorna (total, pendentes): total de linhas do job e quantas estão com o status informado.
+        """
+        linhas = self.linhas(job_id)
+        return len(linhas), sum(1 for linha in linhas if linha.status == status_pendente)
+
+    def linhas_desde(self, job_id, desde=0, limite=None, status=None, abas=None):
+        """
+        Retorna as linhas gravadas ou alteradas depois do número de sequência informado, na ordem
+        das alterações.
+
+        Parâmetros:
+            job_id (str): Identificador do job.
+            desde (int): Número de sequência já recebido (0 para todas as linhas).
+            limite (int): Quantidade máxima de linhas (default: sem limite).
+            status (str): Apenas linhas cujo status começa com este texto (opcional).
+            abas (iterable): Apenas linhas destas abas (opcional).
+
+        Retorna:
+            tuple: (itens, cursor, mais): itens é uma lista de (sequência, posição, ResultadoRps); cursor é
+                o número de sequência a usar na próxima consulta; mais indica se a página foi
+                limitada e há mais alterações a buscar.
+        """
+        raise NotImplementedError
+
+
+def _filtrar(linha, status, abas):
+    if status is not None and not str(linha.status).startswith(status):
+        return False
+    if abas is not None and linha.aba not in abas:
+        return False
+    return True
+
+
+class InMemoryStatusStore(StatusStore):
+    """
+    Armazenamento em memória, válido apenas dentro de um processo.
+
+    Por job, os registros ficam em uma lista indexada pela posição na planilha, e o número de
+    sequência de cada posição e o histórico de alterações (a posição alterada em cada sequência)
+    em arrays de inteiros.
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._ordem = []
+        self._por_protocolo = {}
+        self._lock = threading.Lock()
+
+    def criar_job(self, job_id, arquivo, caminho):
+        with self._lock:
+            # 'seqs' guarda a sequência da última alteração de cada posição (0: posição sem linha);
+            # 'alteracoes' guarda a posição alterada em cada sequência (a sequência n está no índice n - 1)
+            self._jobs[job_id] = {'arquivo': arquivo, 'caminho': caminho, 'criado_em': time.time(),
+                                  'linhas': [], 'seqs': array('q'), 'alteracoes': array('q'), 'por_rps': {}}
+            self._ordem.append(job_id)
+
+    def descartar_job(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            self._ordem.remove(job_id)
+            for protocolo in [protocolo for protocolo, por_job in self._por_protocolo.items() if job_id in por_job]:
+                por_job = self._por_protocolo[protocolo]
+                del por_job[job_id]
+                if not por_job:
+                    del self._por_protocolo[protocolo]
+
+    @staticmethod
+    def _marcar(job, posicao):
+        job['alteracoes'].append(posicao)
+        job['seqs'][posicao] = len(job['alteracoes'])
+
+    def ultimo_job(self):
+        with self._lock:
+            return self._ordem[-1] if self._ordem else None
+
+    def info_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {'id': job_id, 'arquivo': job['arquivo'], 'caminho': job['caminho'], 'criado_em': job['criado_em']}
+
+    def adicionar_linhas(self, job_id, posicao_inicial, linhas):
+        linhas = [linha.copia() for linha in linhas]
+        with self._lock:
+            job = self._jobs[job_id]
+            fim = posicao_inicial + len(linhas)
+            if fim > len(job['linhas']):
+                job['linhas'].extend([None] * (fim - len(job['linhas'])))
+                job['seqs'].extend([0] * (fim - len(job['seqs'])))
+            for posicao, linha in enumerate(linhas, start=posicao_inicial):
+                anterior = job['linhas'][posicao]
+                job['linhas'][posicao] = linha
+                if anterior is None:
+                    # Um número de RPS costuma ter uma única linha: guarda a posição e só passa a
+                    # uma lista quando o número se repete (abas diferentes)
+                    posicoes = job['por_rps'].setdefault(linha.rps, posicao)
+                    if posicoes != posicao:
+                        if not isinstance(posicoes, list):
+                            posicoes = job['por_rps'][linha.rps] = [posicoes]
+                        posicoes.append(posicao)
+                if linha.protocolo is not None and linha.protocolo != SEM_PROTOCOLO:
+                    self._por_protocolo.setdefault(linha.protocolo, {}).setdefault(job_id, array('q')).append(posicao)
+                self._marcar(job, posicao)
+
+    def atualizar_status(self, job_id, protocolo, status, nfses=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for posicao in self._por_protocolo.get(protocolo, {}).get(job_id, ()):
+                linha = job['linhas'][posicao]
+                linha.status = status
+                if nfses and str(linha.rps) in nfses:
+                    linha.nfse, linha.codigo_verificacao = nfses[str(linha.rps)]
+                self._marcar(job, posicao)
+
+    def linhas(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return []
+            return [linha.copia() for linha in job['linhas'] if linha is not None]
+
+    def buscar_por_rps(self, job_id, numero_rps):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return []
+            posicoes = job['por_rps'].get(numero_rps)
+            if posicoes is None and not isinstance(numero_rps, int) and str(numero_rps).isdigit():
+                posicoes = job['por_rps'].get(int(numero_rps))
+            if posicoes is None:
+                return []
+            if not isinstance(posicoes, list):
+                posicoes = [posicoes]
+            return [job['linhas'][posicao].copia() for posicao in posicoes]
+
+    def buscar_por_protocolo(self, protocolo):
+        with self._lock:
+            return [self._jobs[job_id]['linhas'][posicao].copia()
+                    for job_id, posicoes in self._por_protocolo.get(protocolo, {}).items() if job_id in self._jobs
+                    for posicao in posicoes]
+
+    def linhas_desde(self, job_id, desde=0, limite=None, status=None, abas=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return [], desde, False
+            alteracoes, seqs = job['alteracoes'], job['seqs']
+            itens = []
+            for seq in range(max(desde, 0) + 1, len(alteracoes) + 1):
+                posicao = alteracoes[seq - 1]
+                # Posições alteradas de novo depois desta sequência aparecem só na última alteração
+                if seqs[posicao] != seq:
+                    continue
+                linha = job['linhas'][posicao]
+                if _filtrar(linha, status, abas):
+                    if limite is not None and len(itens) >= limite:
+                        return itens, itens[-1][0], True
+                    itens.append((seq, posicao, linha.copia()))
+            return itens, max(len(alteracoes), desde), False
+
+
+class SQLiteStatusStore(StatusStore):
+    """
+    Armazenamento em SQLite, compartilhado entre processos da mesma máquina.
+
+    Cada thread usa sua própria conexão; o modo WAL permite leituras concorrentes às escritas.
+    """
+    def __init__(self, caminho=None):
+        self.caminho = caminho or STATUS_DB
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    arquivo TEXT,
+                    caminho TEXT,
+                    criado_em REAL
+                );
+                CREATE TABLE IF NOT EXISTS status (
+                    job_id TEXT NOT NULL,
+                    posicao INTEGER NOT NULL,
+                    numero_rps TEXT,
+                    protocolo TEXT,
+                    status TEXT,
+                    dados TEXT,
+                    seq INTEGER NOT NULL DEFAULT 0,
+                    aba TEXT,
+                    PRIMARY KEY (job_id, posicao)
+                );
+            """)
+            # Bancos criados antes da consulta incremental não têm as colunas seq e aba
+            colunas = {row[1] for row in conexao.execute('PRAGMA table_info(status)')}
+            if 'seq' not in colunas:
+                conexao.execute('ALTER TABLE status ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+            if 'aba' not in colunas:
+                conexao.execute('ALTER TABLE status ADD COLUMN aba TEXT')
+            conexao.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_status_rps ON status (job_id, numero_rps);
+                CREATE INDEX IF NOT EXISTS idx_status_protocolo ON status (protocolo);
+                CREATE INDEX IF NOT EXISTS idx_status_seq ON status (job_id, seq);
+                CREATE INDEX IF NOT EXISTS idx_jobs_criado_em ON jobs (criado_em);
+            """)
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+        return conexao
+
+    @staticmethod
+    def _linha(dados, protocolo, status):
+        linha = ResultadoRps.de_lista(json.loads(dados))
+        linha.protocolo = protocolo
+        linha.status = status
+        return linha
+
+    @staticmethod
+    def _ultima_seq(conexao, job_id):
+        return conexao.execute('SELECT COALESCE(MAX(seq), 0) FROM status WHERE job_id = ?', (job_id,)).fetchone()[0]
+
+    def criar_job(self, job_id, arquivo, caminho):
+        with self._conexao() as conexao:
+            conexao.execute('INSERT INTO jobs (id, arquivo, caminho, criado_em) VALUES (?, ?, ?, ?)',
+                            (job_id, arquivo, caminho, time.time()))
+
+    def ultimo_job(self):
+        row = self._conexao().execute('SELECT id FROM jobs ORDER BY criado_em DESC LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def info_job(self, job_id):
+        row = self._conexao().execute('SELECT arquivo, caminho, criado_em FROM jobs WHERE id = ?',
+                                      (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'id': job_id, 'arquivo': row[0], 'caminho': row[1], 'criado_em': row[2]}
+
+    def adicionar_linhas(self, job_id, posicao_inicial, linhas):
+        conexao = self._conexao()
+        with conexao:
+            # A transação é aberta antes da leitura da última sequência, para que gravações
+            # simultâneas do mesmo job (de outras threads ou processos) não repitam números
+            conexao.execute('BEGIN IMMEDIATE')
+            seq = self._ultima_seq(conexao, job_id)
+            registros = [
+                (job_id, posicao, str(linha.rps), linha.protocolo, linha.status,
+                 json.dumps(linha.para_lista(), default=str), seq + indice, linha.aba)
+                for indice, (posicao, linha) in enumerate(enumerate(linhas, start=posicao_inicial), start=1)
+            ]
+            conexao.executemany('INSERT OR REPLACE INTO status (job_id, posicao, numero_rps, protocolo, status, '
+                                'dados, seq, aba) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', registros)
+
+    def atualizar_status(self, job_id, protocolo, status, nfses=None):
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute('BEGIN IMMEDIATE')
+            seq = self._ultima_seq(conexao, job_id)
+            rows = conexao.execute('SELECT posicao, numero_rps, dados FROM status WHERE protocolo = ? AND job_id = ? '
+                                   'ORDER BY posicao', (protocolo, job_id)).fetchall()
+            atualizacoes = []
+            for indice, (posicao, numero_rps, dados) in enumerate(rows, start=1):
+                if nfses and numero_rps in nfses:
+                    linha = json.loads(dados)
+                    linha[INDICE_NFSE], linha[INDICE_CODIGO_VERIFICACAO] = nfses[numero_rps]
+                    dados = json.dumps(linha, default=str)
+                atualizacoes.append((status, dados, seq + indice, job_id, posicao))
+            conexao.executemany('UPDATE status SET status = ?, dados = ?, seq = ? WHERE job_id = ? AND posicao = ?',
+                                atualizacoes)
+
+    def linhas(self, job_id):
+        rows = self._conexao().execute('SELECT dados, protocolo, status FROM status WHERE job_id = ? '
+                                       'ORDER BY posicao', (job_id,))
+        return [self._linha(*row) for row in rows]
+
+    def buscar_por_rps(self, job_id, numero_rps):
+        rows = self._conexao().execute('SELECT dados, protocolo, status FROM status WHERE job_id = ? '
+                                       'AND numero_rps = ? ORDER BY posicao', (job_id, str(numero_rps)))
+        return [self._linha(*row) for row in rows]
+
+    def buscar_por_protocolo(self, protocolo):
+        rows = self._conexao().execute('SELECT dados, protocolo, status FROM status WHERE protocolo = ? '
+                                       'ORDER BY job_id, posicao', (protocolo,))
+        return [self._linha(*row) for row in rows]
+
+    def resumo_job(self, job_id, status_pendente):
+        row = self._conexao().execute('SELECT COUNT(*), COALESCE(SUM(status = ?), 0) FROM status '
+                                      'WHERE job_id = ?', (status_pendente, job_id)).fetchone()
+        return row[0], row[1]
+
+    def linhas_desde(self, job_id, desde=0, limite=None, status=None, abas=None):
+        consulta = 'SELECT seq, posicao, dados, protocolo, status FROM status WHERE job_id = ? AND seq > ?'
+        parametros = [job_id, desde]
+        if status is not None:
+            consulta += ' AND substr(status, 1, ?) = ?'
+            parametros += [len(status), status]
+        if abas is not None:
+            abas = list(abas)
+            consulta += f" AND aba IN ({', '.join('?' * len(abas))})"
+            parametros += abas
+        consulta += ' ORDER BY seq'
+        if limite is not None:
+            consulta += ' LIMIT ?'
+            parametros.append(limite + 1)
+
+        conexao = self._conexao()
+        with conexao:
+            # As duas leituras são feitas na mesma transação (mesmo instantâneo do banco): uma linha
+            # gravada entre elas receberia uma sequência abaixo do cursor devolvido e não seria
+            # entregue na próxima página
+            conexao.execute('BEGIN')
+            rows = conexao.execute(consulta, parametros).fetchall()
+            ultima_seq = self._ultima_seq(conexao, job_id)
+        itens = [(seq, posicao, self._linha(dados, protocolo, status_linha))
+                 for seq, posicao, dados, protocolo, status_linha in rows[:limite]]
+        if limite is not None and len(rows) > limite:
+            return itens, itens[-1][0], True
+        return itens, max(ultima_seq, desde), False
+
+
+def criar_status_store():
+    """
+    Cria o armazenamento de status configurado em STATUS_STORE.
+
+    Retorna:
+        StatusStore: InMemoryStatusStore ('memoria') ou SQLiteStatusStore ('sqlite').
+    """
+    if STATUS_STORE == 'sqlite':
+        return SQLiteStatusStore()
+    if STATUS_STORE == 'memoria':
+        return InMemoryStatusStore()
+    raise ValueError(f"Valor inválido para STATUS_STORE: {STATUS_STORE}")
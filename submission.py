@@ -0,0 +1,110 @@
+import os
+from collections import deque
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
+from transport import DEFAULT_TIMEOUT
+
+"""
+Módulo: submission.py
+Descrição: Motor de envio concorrente das requisições SOAP de RPS.
+
+As tarefas de envio são executadas em um pool de threads com limite global de workers. O limite
+de requisições simultâneas por CNPJ do prestador é o do controle de fluxo (rate_limit), que se
+ajusta à latência do web service; o motor apenas intercala as tarefas dos prestadores. Os
+resultados são devolvidos na mesma ordem das tarefas, de modo que a lista de status continua
+alinhada com os números de RPS.
+
+Funcionalidades:
+- Execução paralela de tarefas de envio, intercaladas por prestador.
+- Coleta ordenada dos resultados.
+- Envio em fluxo contínuo a partir de um iterador, com número limitado de tarefas pendentes.
+- Timeout por requisição repassado às funções de envio.
+
+Dependências:
+- concurrent.futures
+"""
+
+SUBMISSION_MAX_WORKERS = int(os.getenv('SUBMISSION_MAX_WORKERS', '8'))
+
+
+class SubmissionEngine:
+    """
+    Executa tarefas de envio em paralelo, intercalando as tarefas dos prestadores.
+
+    Métodos:
+    - run: Executa uma lista de tarefas e retorna os resultados na ordem original.
+    - stream: Executa tarefas à medida que são produzidas e devolve os resultados em ordem.
+    """
+    def __init__(self, max_workers=None, timeout=None):
+        """
+        Inicializa o motor de envio.
+
+        Parâmetros:
+            max_workers (int): Número máximo de threads (default: SUBMISSION_MAX_WORKERS).
+            timeout (float | tuple): Timeout de cada requisição, em segundos ou (conexão, leitura)
+                (default: transport.DEFAULT_TIMEOUT).
+        """
+        self.max_workers = max(1, max_workers or SUBMISSION_MAX_WORKERS)
+        self.timeout = timeout or DEFAULT_TIMEOUT
+
+    def run(self, tarefas):
+        """
+        Executa as tarefas de envio e retorna os resultados na ordem em que foram informadas.
+
+        Parâmetros:
+            tarefas (list): Lista de tuplas (cnpj_prestador, funcao). Cada função recebe o
+                timeout da requisição e retorna o resultado do envio.
+
+        Retorna:
+            list: Resultados das tarefas, na mesma ordem da lista de entrada.
+
+        Exemplo:
+            >>> engine = SubmissionEngine(max_workers=4)
+            >>> engine.run([('12345678000195', lambda timeout: 'ok')])
+            ['ok']
+        """
+        if not tarefas:
+            return []
+
+        # Intercala as tarefas dos prestadores para que um prestador no limite de concorrência
+        # (rate_limit) não ocupe todos os workers enquanto os demais aguardam na fila.
+        por_prestador = {}
+        for posicao, (cnpj_prestador, _) in enumerate(tarefas):
+            por_prestador.setdefault(cnpj_prestador, []).append(posicao)
+        ordem_envio = [posicao for grupo in zip_longest(*por_prestador.values())
+                       for posicao in grupo if posicao is not None]
+
+        futures = [None] * len(tarefas)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tarefas))) as executor:
+            for posicao in ordem_envio:
+                _, funcao = tarefas[posicao]
+                futures[posicao] = executor.submit(funcao, self.timeout)
+            return [future.result() for future in futures]
+
+    def stream(self, tarefas, max_pendentes=None):
+        """
+        Executa tarefas produzidas por um iterador (por exemplo, a partir de uma leitura em blocos
+        da planilha), sem esperar que todas estejam disponíveis.
+
+        No máximo max_pendentes tarefas ficam submetidas ao mesmo tempo; ao atingir o limite, o
+        resultado mais antigo é aguardado antes de consumir a próxima tarefa, o que mantém o uso
+        de memória constante.
+
+        Parâmetros:
+            tarefas (iterable): Tuplas (cnpj_prestador, funcao), como em run.
+            max_pendentes (int): Limite de tarefas submetidas e ainda não devolvidas
+                (default: quatro vezes max_workers).
+
+        Retorna:
+            generator: Resultados das tarefas, na ordem em que foram produzidas.
+        """
+        max_pendentes = max(1, max_pendentes or self.max_workers * 4)
+        pendentes = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _, funcao in tarefas:
+                pendentes.append(executor.submit(funcao, self.timeout))
+                while len(pendentes) >= max_pendentes:
+                    yield pendentes.popleft().result()
+            while pendentes:
+                yield pendentes.popleft().result()
@@ -0,0 +1,185 @@
+import os
+import gzip
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from endpoints import chave_endpoint
+from rate_limit import get_controle, controle_atual
+
+"""
+Módulo: transport.py
+Descrição: Camada de transporte HTTP compartilhada pelas requisições SOAP de envio e de consulta.
+
+As requisições ao web service passam por uma requests.Session por endpoint (esquema + host), cada
+uma com seu pool de conexões keep-alive, evitando um novo handshake TCP + TLS a cada chamada e
+isolando os pools de serviços diferentes (produção, homologação, serviço local de teste). A sessão
+aplica timeouts de conexão e de leitura e repete automaticamente, com backoff exponencial, as
+requisições que falham.
+
+As retentativas dependem da operação. O envio de lotes (RecepcionarLoteRps) não é idempotente:
+só é repetido em erros de conexão (a requisição não chegou ao servidor) e nas respostas 502, 503
+e 504; um timeout de leitura ou um HTTP 500 (SOAP Fault) não é repetido, pois o servidor pode já
+ter recebido o lote, e um novo envio emitiria NFS-e em duplicidade. As consultas, idempotentes,
+também são repetidas em erros de leitura e em respostas 500. Por isso cada endpoint tem uma
+sessão para cada política.
+
+Funcionalidades:
+- Sessões HTTP por endpoint, criadas sob demanda e seguras para uso entre threads.
+- Pool de conexões configurável.
+- Timeouts de conexão e leitura.
+- Retentativas com backoff, conforme a operação seja idempotente (consultas) ou não (envio).
+- Compressão gzip opcional do corpo das requisições.
+- Limite de taxa e de concorrência por endpoint e prestador (rate_limit), aplicado também às
+  retentativas.
+
+Configuração (variáveis de ambiente):
+- SOAP_POOL_SIZE: Conexões mantidas no pool de cada endpoint (default: 10).
+- SOAP_CONNECT_TIMEOUT / SOAP_TIMEOUT: Timeouts de conexão e de leitura em segundos (default: 10 / 30).
+- SOAP_RETRIES / SOAP_BACKOFF: Número de retentativas e fator de backoff (default: 3 / 0.5).
+- SOAP_GZIP: Comprime o corpo das requisições com gzip (default: false).
+
+Dependências:
+- requests
+- urllib3
+- rate_limit (controle de fluxo)
+"""
+
+SOAP_POOL_SIZE = int(os.getenv('SOAP_POOL_SIZE', '10'))
+SOAP_CONNECT_TIMEOUT = float(os.getenv('SOAP_CONNECT_TIMEOUT', '10'))
+SOAP_READ_TIMEOUT = float(os.getenv('SOAP_TIMEOUT', '30'))
+SOAP_RETRIES = int(os.getenv('SOAP_RETRIES', '3'))
+SOAP_BACKOFF = float(os.getenv('SOAP_BACKOFF', '0.5'))
+SOAP_GZIP = os.getenv('SOAP_GZIP', 'False').lower() == 'true'
+
+DEFAULT_TIMEOUT = (SOAP_CONNECT_TIMEOUT, SOAP_READ_TIMEOUT)
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class RetryControlado(Retry):
+    """
+    Política de retentativas do urllib3 em que cada retentativa, após o backoff, aguarda a taxa do
+    controle de fluxo da requisição (rate_limit.ControleFluxo.retentativa), como uma nova requisição.
+    """
+    def sleep(self, response=None):
+        super().sleep(response)
+        controle = controle_atual()
+        if controle is not None:
+            controle.retentativa()
+
+
+def create_session(pool_size=None, retries=None, backoff=None, idempotente=False):
+    """
+    Cria uma sessão HTTP com pool de conexões e política de retentativas.
+
+    Parâmetros:
+        pool_size (int): Número de conexões mantidas no pool (default: SOAP_POOL_SIZE).
+        retries (int): Número máximo de retentativas (default: SOAP_RETRIES).
+        backoff (float): Fator de backoff exponencial entre as retentativas (default: SOAP_BACKOFF).
+        idempotente (bool): Se True (consultas), repete também erros de leitura e respostas 500;
+            se False (envio), apenas erros de conexão e respostas 502, 503 e 504.
+
+    Retorna:
+        requests.Session: Sessão configurada para HTTP e HTTPS.
+    """
+    pool_size = pool_size or SOAP_POOL_SIZE
+    retries = SOAP_RETRIES if retries is None else retries
+    backoff = SOAP_BACKOFF if backoff is None else backoff
+
+    # O POST precisa ser incluído explicitamente, pois o urllib3 só repete métodos idempotentes.
+    # No envio, read=False repassa o timeout de leitura ao chamador (requests.ReadTimeout) sem repetir.
+    retry = RetryControlado(
+        total=retries,
+        connect=retries,
+        read=retries if idempotente else False,
+        other=retries if idempotente else 0,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(500, 502, 503, 504) if idempotente else (502, 503, 504),
+        allowed_methods=frozenset({'POST'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url, idempotente=False):
+    """
+    Retorna a sessão HTTP do endpoint da URL, criando-a na primeira chamada.
+
+    Parâmetros:
+        url (str): Endereço do web service; URLs com o mesmo esquema e host compartilham a sessão.
+        idempotente (bool): Sessão das operações idempotentes (consultas) ou do envio
+            (ver create_session).
+    """
+    chave = (chave_endpoint(url), idempotente)
+    session = _sessions.get(chave)
+    if session is None:
+        with _lock:
+            session = _sessions.get(chave)
+            if session is None:
+                session = _sessions[chave] = create_session(idempotente=idempotente)
+    return session
+
+
+def reset_session(url=None, session=None, idempotente=False):
+    """
+    Substitui a sessão de um endpoint (ou descarta todas) e fecha as sessões anteriores.
+
+    Parâmetros:
+        url (str): Endereço do endpoint (default: todos os endpoints).
+        session (requests.Session): Nova sessão do endpoint (default: recriada sob demanda na
+            próxima chamada).
+        idempotente (bool): Política da sessão substituída (ver get_session).
+    """
+    with _lock:
+        if url is None:
+            anteriores = list(_sessions.values())
+            _sessions.clear()
+        else:
+            chave = (chave_endpoint(url), idempotente)
+            anteriores = [_sessions.pop(chave)] if chave in _sessions else []
+            if session is not None:
+                _sessions[chave] = session
+    for anterior in anteriores:
+        anterior.close()
+
+
+def post_soap(url, soap_request, soap_action, timeout=None, stream=False, prestador=None, idempotente=False):
+    """
+    Envia uma requisição SOAP pela sessão do endpoint.
+
+    Parâmetros:
+        url (str): Endereço do web service.
+        soap_request (str): Corpo da requisição SOAP em XML.
+        soap_action (str): Valor do cabeçalho SOAPAction.
+        timeout (float | tuple): Timeout em segundos ou tupla (conexão, leitura)
+            (default: DEFAULT_TIMEOUT).
+        stream (bool): Não lê o corpo da resposta antecipadamente (ver soap_response.ler_resposta).
+        prestador (str): CNPJ do prestador, usado para separar o controle de fluxo (opcional).
+        idempotente (bool): A operação pode ser repetida sem efeitos adicionais (consultas); o
+            envio de lotes não é (default: False).
+
+    Retorna:
+        requests.Response: Resposta do servidor.
+    """
+    headers = {
+        'Content-Type': 'text/xml; charset=utf-8',
+        'SOAPAction': soap_action,
+    }
+    data = soap_request.encode('utf-8')
+    if SOAP_GZIP:
+        data = gzip.compress(data)
+        headers['Content-Encoding'] = 'gzip'
+
+    session = get_session(url, idempotente)
+    return get_controle(chave_endpoint(url), prestador).executar(
+        lambda: session.post(url, data=data, headers=headers, timeout=timeout or DEFAULT_TIMEOUT, stream=stream),
+        sobrecarga=(requests.Timeout, requests.ConnectionError),
+    )
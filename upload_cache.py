@@ -0,0 +1,162 @@
+import os
+import uuid
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+"""
+Módulo: upload_cache.py
+Descrição: Armazenamento dos uploads por conteúdo e cache das planilhas enriquecidas.
+
+É comum o usuário enviar de novo a mesma planilha (ou uma cópia com poucas linhas corrigidas).
+Os arquivos enviados são gravados com o hash SHA-256 do conteúdo como nome, de modo que envios
+repetidos do mesmo arquivo não ocupam espaço de novo e são reconhecidos pelo hash. As abas já
+enriquecidas com os códigos de município ficam em cache por esse hash (em memória e em disco),
+e um novo envio do mesmo arquivo não relê nem reprocessa a planilha.
+
+O reaproveitamento linha a linha (protocolos e status dos RPS que não mudaram) é feito pelo
+registro de RPS (rps_journal.py), que identifica cada RPS pelo hash do seu conteúdo; assim, as
+linhas alteradas de uma cópia corrigida são as únicas enviadas de novo.
+
+Funcionalidades:
+- Gravação do upload com cálculo do hash durante a cópia.
+- Cache em memória (LRU, por processo) e em disco (compartilhado entre processos) das planilhas
+  enriquecidas.
+
+Configuração (variáveis de ambiente):
+- UPLOAD_CACHE_DIR: Diretório do cache em disco (default: cache).
+- UPLOAD_CACHE_TAMANHO: Quantidade de planilhas mantidas em memória; 0 desativa o cache (default: 4).
+
+Dependências:
+- pandas (pickle dos DataFrames)
+"""
+
+UPLOAD_CACHE_DIR = os.getenv('UPLOAD_CACHE_DIR', 'cache')
+UPLOAD_CACHE_TAMANHO = int(os.getenv('UPLOAD_CACHE_TAMANHO', '4'))
+
+_hashes = {}
+_planilhas = OrderedDict()
+_lock = threading.Lock()
+
+
+def _assinatura(caminho):
+    stat = os.stat(caminho)
+    return os.path.abspath(caminho), stat.st_mtime_ns, stat.st_size
+
+
+def salvar_upload(file, upload_folder, extensao='xlsx'):
+    """
+    Salva um arquivo enviado pelo usuário com o hash do conteúdo como nome.
+
+    O arquivo é copiado para um temporário enquanto o hash é calculado e então renomeado; se um
+    arquivo com o mesmo conteúdo já existe, o temporário é descartado.
+
+    Parâmetros:
+        file (werkzeug.datastructures.FileStorage): Arquivo enviado pelo usuário via upload.
+        upload_folder (str): Diretório onde o arquivo será salvo.
+        extensao (str): Extensão do arquivo salvo.
+
+    Retorna:
+        tuple: (hash SHA-256 do conteúdo, caminho do arquivo salvo).
+
+    Exemplo:
+        >>> salvar_upload(file, 'uploads')
+        ('9f86d08...', 'uploads/9f86d08....xlsx')
+    """
+    sha256 = hashlib.sha256()
+    temporario = os.path.join(upload_folder, f".{uuid.uuid4().hex}.tmp")
+    with open(temporario, 'wb') as destino:
+        for bloco in iter(lambda: file.stream.read(1 << 16), b''):
+            sha256.update(bloco)
+            destino.write(bloco)
+
+    digest = sha256.hexdigest()
+    caminho = os.path.join(upload_folder, f"{digest}.{extensao}")
+    if os.path.exists(caminho):
+        os.remove(temporario)
+    else:
+        os.replace(temporario, caminho)
+
+    with _lock:
+        _hashes[_assinatura(caminho)] = digest
+    return digest, caminho
+
+
+def hash_arquivo(caminho):
+    """
+    Retorna o hash SHA-256 do conteúdo de um arquivo, reaproveitando o já calculado enquanto o
+    arquivo não muda (mesmo mtime e tamanho).
+    """
+    assinatura = _assinatura(caminho)
+    digest = _hashes.get(assinatura)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with open(caminho, 'rb') as arquivo:
+            for bloco in iter(lambda: arquivo.read(1 << 16), b''):
+                sha256.update(bloco)
+        digest = sha256.hexdigest()
+        with _lock:
+            _hashes[assinatura] = digest
+    return digest
+
+
+def _caminho_cache(chave):
+    return os.path.join(UPLOAD_CACHE_DIR, f"planilhas_{chave}.pkl")
+
+
+def _gravar_cache(chave, planilhas):
+    """
+    Grava as planilhas no disco de forma atômica (arquivo temporário + rename).
+    """
+    os.makedirs(UPLOAD_CACHE_DIR, exist_ok=True)
+    destino = _caminho_cache(chave)
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    pd.to_pickle(planilhas, temporario)
+    os.replace(temporario, destino)
+
+
+def _lembrar(chave, planilhas):
+    with _lock:
+        _planilhas[chave] = planilhas
+        _planilhas.move_to_end(chave)
+        while len(_planilhas) > UPLOAD_CACHE_TAMANHO:
+            _planilhas.popitem(last=False)
+
+
+def obter_planilhas(caminho, carregar, versao=''):
+    """
+    Retorna as abas enriquecidas de uma planilha, reaproveitando o cache do mesmo conteúdo.
+
+    As abas retornadas podem ser compartilhadas entre jobs e não devem ser alteradas.
+
+    Parâmetros:
+        caminho (str): Caminho da planilha.
+        carregar (callable): Função (caminho) -> dict de DataFrames, chamada na falta de cache.
+        versao (str): Identifica os dados de referência usados em carregar (por exemplo, o banco
+            territorial); uma versão diferente não reaproveita o cache.
+
+    Retorna:
+        dict: DataFrames por aba.
+    """
+    if UPLOAD_CACHE_TAMANHO <= 0:
+        return carregar(caminho)
+
+    chave = hashlib.sha1(f"{hash_arquivo(caminho)}:{versao}".encode('utf-8')).hexdigest()
+    with _lock:
+        planilhas = _planilhas.get(chave)
+        if planilhas is not None:
+            _planilhas.move_to_end(chave)
+            return planilhas
+
+    try:
+        planilhas = pd.read_pickle(_caminho_cache(chave))
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        planilhas = carregar(caminho)
+        try:
+            _gravar_cache(chave, planilhas)
+        except OSError as e:
+            print(f"Não foi possível gravar o cache das planilhas: {e}")
+    _lembrar(chave, planilhas)
+    return planilhas
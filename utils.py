@@ -1,5 +1,6 @@
-import requests
-import xml.etree.ElementTree as ET
+from transport import post_soap
+from endpoints import obter_endpoint, OPERACAO_CONSULTA
+from soap_response import analisar_consulta, ler_resposta
 
 """
 Módulo: utils.py
@@ -9,16 +10,14 @@ por meio de requisições SOAP.
 Funcionalidades:
 - Geração de requisições SOAP para verificação do status de protocolos enviados.
 - Envio de requisições ao web service.
-- Análise das respostas retornadas para determinar o status.
+- Análise das respostas retornadas para determinar o status e as NFS-e emitidas.
 
 Dependências:
-- requests
-- xml.etree.ElementTree (ET)
+- transport (sessão HTTP compartilhada)
+- endpoints (endereço do web service)
+- soap_response (análise incremental das respostas)
 """
 
-SOAP_URL = "https://isscuritiba.curitiba.pr.gov.br/Iss.NfseWebService/nfsews.asmx"
-SOAP_ACTION = "https://www.e-governeapps2.com.br/ConsultarLoteRps"
-
 
 def create_verification_request(cnpj, inscricao_municipal, protocolo):
     """
@@ -52,12 +51,14 @@ def create_verification_request(cnpj, inscricao_municipal, protocolo):
     return soap_request
 
 
-def send_verification_request(soap_request):
+def send_verification_request(soap_request, timeout=None, prestador=None):
     """
     Envia a requisição SOAP ao web service para verificação do status do protocolo.
 
     Parâmetros:
         soap_request (str): Corpo XML formatado da requisição SOAP.
+        timeout (float): Timeout da requisição em segundos (default: transport.DEFAULT_TIMEOUT).
+        prestador (str): CNPJ do prestador, para o controle de fluxo por prestador (opcional).
 
     Retorna:
         str: Resposta do web service em formato XML.
@@ -66,11 +67,9 @@ def send_verification_request(soap_request):
         >>> response = send_verification_request(soap_request)
         >>> print(response)
     """
-    headers = {
-        "Content-Type": "text/xml; charset=utf-8",
-        "SOAPAction": SOAP_ACTION,
-    }
-    response = requests.post(SOAP_URL, data=soap_request, headers=headers)
+    endpoint = obter_endpoint(OPERACAO_CONSULTA)
+    response = post_soap(endpoint.url, soap_request, endpoint.soap_action, timeout=timeout, prestador=prestador,
+                         idempotente=True)
     return response.text
 
 
@@ -88,23 +87,37 @@ def parse_verification_response(response_text):
         >>> status = parse_verification_response(response_text)
         'Sucesso: NFS-e encontradas'
     """
-    try:
-        root = ET.fromstring(response_text)
-        lista_nfse = root.findall('.//{https://www.e-governeapps2.com.br/}ListaNfse')
-        if lista_nfse:
-            status_lote = "Sucesso: NFS-e encontradas"
-        else:
-            lista_mensagem = root.findall('.//{https://www.e-governeapps2.com.br/}ListaMensagemRetorno')
-            if lista_mensagem:
-                status_lote = "Erro: Mensagens de retorno encontradas"
-            else:
-                status_lote = "Status não encontrado"
-        return status_lote
-    except ET.ParseError:
-        return "Erro ao analisar a resposta"
-
-
-def verify_submission(cnpj, inscricao_municipal, protocolo):
+    return analisar_consulta(response_text).status
+
+
+def consultar_protocolo(cnpj, inscricao_municipal, protocolo, timeout=None):
+    """
+    Consulta um protocolo e retorna o resultado estruturado da consulta.
+
+    A resposta é analisada à medida que é recebida, sem carregar o corpo inteiro em memória.
+
+    Parâmetros:
+        cnpj (str): CNPJ do prestador.
+        inscricao_municipal (str): Inscrição municipal do prestador.
+        protocolo (str): Número do protocolo gerado no envio.
+        timeout (float): Timeout de cada requisição em segundos (default: transport.DEFAULT_TIMEOUT).
+
+    Retorna:
+        RespostaConsulta: Status, NFS-e emitidas (número e código de verificação) e mensagens de retorno.
+
+    Exemplo:
+        >>> resposta = consultar_protocolo("12345678000195", "12345", "987654321")
+        >>> resposta.status, resposta.nfses
+        ('Sucesso: NFS-e encontradas', [Nfse('10', 'ABC', rps='1')])
+    """
+    soap_request = create_verification_request(cnpj, inscricao_municipal, protocolo)
+    endpoint = obter_endpoint(OPERACAO_CONSULTA)
+    response = post_soap(endpoint.url, soap_request, endpoint.soap_action, timeout=timeout, stream=True,
+                         prestador=cnpj, idempotente=True)
+    return ler_resposta(response, analisar_consulta)
+
+
+def verify_submission(cnpj, inscricao_municipal, protocolo, timeout=None):
     """
     Verifica o status de um protocolo enviado utilizando requisições SOAP.
 
@@ -112,6 +125,7 @@ def verify_submission(cnpj, inscricao_municipal, protocolo):
         cnpj (str): CNPJ do prestador.
         inscricao_municipal (str): Inscrição municipal do prestador.
         protocolo (str): Número do protocolo gerado no envio.
+        timeout (float): Timeout de cada requisição em segundos (default: transport.DEFAULT_TIMEOUT).
 
     Retorna:
         str: Status do protocolo após análise da resposta.
@@ -120,7 +134,4 @@ def verify_submission(cnpj, inscricao_municipal, protocolo):
         >>> verify_submission("12345678000195", "12345", "987654321")
         'Sucesso: NFS-e encontradas'
     """
-    soap_request = create_verification_request(cnpj, inscricao_municipal, protocolo)
-    response_text = send_verification_request(soap_request)
-    status = parse_verification_response(response_text)
-    return status
+    return consultar_protocolo(cnpj, inscricao_municipal, protocolo, timeout=timeout).status
@@ -0,0 +1,104 @@
+import re
+import math
+import numbers
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from data_validation import normalize_valor
+
+"""
+Módulo: xml_serializer.py
+Descrição: Serialização dos valores interpolados no XML dos RPS.
+
+Todo campo de texto vindo da planilha deve passar por escapar_texto exatamente uma vez, no
+momento da renderização; os valores monetários e a alíquota passam por formatar_decimal, que
+sempre produz o mesmo texto para o mesmo valor, independentemente de como a célula foi lida
+(float, int, Decimal ou texto no formato '1.234,56').
+
+Funcionalidades:
+- Escape de texto para conteúdo de elementos XML, com caminho rápido para textos sem caracteres
+  especiais.
+- Remoção de caracteres de controle não permitidos em XML 1.0.
+- Formatação decimal com casas fixas e arredondamento comercial (meia unidade para cima).
+
+Dependências:
+- decimal
+- data_validation (normalização de valores monetários)
+"""
+
+CASAS_VALOR = 2
+CASAS_ALIQUOTA = 4
+
+# Caracteres que exigem tratamento: os três reservados em conteúdo de elemento e os caracteres
+# de controle proibidos em XML 1.0 (células copiadas de outros sistemas costumam trazê-los)
+_ESPECIAIS = re.compile('[&<>\x00-\x08\x0b\x0c\x0e-\x1f]')
+_CONTROLE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def escapar_texto(valor):
+    """
+    Escapa um valor para uso como conteúdo de um elemento XML.
+
+    Textos sem caracteres especiais (a grande maioria) são retornados sem cópia. Valores ausentes
+    (None ou NaN, como o pandas representa células vazias) viram texto vazio.
+
+    Parâmetros:
+        valor: Valor da célula (str, número, None ou NaN).
+
+    Retorna:
+        str: Texto pronto para interpolação no XML.
+
+    Exemplo:
+        >>> escapar_texto('Empresa & Cia <ME>')
+        'Empresa &amp; Cia &lt;ME&gt;'
+    """
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ''
+    texto = valor if isinstance(valor, str) else str(valor)
+    if _ESPECIAIS.search(texto) is None:
+        return texto
+    texto = _CONTROLE.sub('', texto)
+    return texto.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+@lru_cache(maxsize=4096)
+def _formatar_decimal(valor, casas):
+    if isinstance(valor, str):
+        numero = Decimal(normalize_valor(valor))
+    elif isinstance(valor, numbers.Integral):
+        # int() também converte os inteiros do numpy, que o Decimal não aceita diretamente
+        numero = Decimal(int(valor))
+    elif isinstance(valor, numbers.Real) and not isinstance(valor, Decimal):
+        # str(float) dá a menor representação que identifica o float (100.5, e não 100.49999...);
+        # float() também converte os escalares do numpy, cujo repr no numpy 2 é 'np.float64(...)'
+        numero = Decimal(str(float(valor)))
+    else:
+        numero = Decimal(valor)
+    if not numero.is_finite():
+        raise InvalidOperation
+    return f"{numero.quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP):f}"
+
+
+def formatar_decimal(valor, casas=CASAS_VALOR):
+    """
+    Formata um valor numérico com um número fixo de casas decimais e ponto como separador.
+
+    Valores que não representam um número são apenas escapados como texto, para que o web
+    service devolva a mensagem de erro correspondente ao RPS.
+
+    Parâmetros:
+        valor: Valor a formatar (float, int, Decimal ou texto como '1.234,56' ou '1234.56').
+        casas (int): Quantidade de casas decimais (default: CASAS_VALOR).
+
+    Retorna:
+        str: Valor formatado.
+
+    Exemplo:
+        >>> formatar_decimal('1.234,5')
+        '1234.50'
+        >>> formatar_decimal(0.05, CASAS_ALIQUOTA)
+        '0.0500'
+    """
+    try:
+        return _formatar_decimal(valor, casas)
+    except (InvalidOperation, ValueError, TypeError):
+        return escapar_texto(valor)